@@ -1,12 +1,18 @@
 import streamlit as st
-import numpy as np
 from PIL import Image, ImageDraw
 import os
-import io
-import zipfile
 import json
-import requests
-import base64
+
+from mockup_engine import plans
+from mockup_engine.catalog import TemplateLibrary
+from mockup_engine.compositor import composite_v3_fixed, face_size, plan_v3
+from mockup_engine.coords import CoordinateStore
+from mockup_engine.encode import SUBSAMPLING, EncoderSettings
+from mockup_engine.github import GitHubRepo, publish_templates, sync_templates
+from mockup_engine.ingest import DesignError, DesignLimits, check_design
+from mockup_engine.jobs import JobManager
+from mockup_engine.resample import CoverResampler, open_proxy
+from mockup_engine.store import default_root
 
 # --- CONFIGURAZIONE ---
 st.set_page_config(page_title="PhotoBook Mockup Compositor - V3 FIXED", layout="wide")
@@ -14,24 +20,20 @@ st.set_page_config(page_title="PhotoBook Mockup Compositor - V3 FIXED", layout="
 if 'uploader_key' not in st.session_state:
     st.session_state.uploader_key = 0
 
+# Larghezza delle anteprime in Produzione: la colonna è 1/4 della pagina,
+# la risoluzione piena serve solo all'export
+PREVIEW_WIDTH = 640
+
 # --- GITHUB CONFIG ---
 GITHUB_REPO = "sciccioni/mockup-tool"
-GITHUB_API = f"https://api.github.com/repos/{GITHUB_REPO}/contents"
 GITHUB_TEMPLATES_PATH = "templates"
 GITHUB_COORDS_PATH = "template_coordinates.json"
+# box delle facce rilevati in automatico per i template non calibrati (solo locale)
+AUTO_REGIONS_PATH = "template_auto_regions.json"
 
-def get_github_headers():
-    token = st.secrets.get("GITHUB_TOKEN", "")
-    return {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-
-# --- ANTI-CACHE ---
-def get_folder_hash(folder_path):
-    if not os.path.exists(folder_path):
-        return 0
-    return sum(os.path.getmtime(os.path.join(folder_path, f)) for f in os.listdir(folder_path))
+@st.cache_resource
+def get_github_repo():
+    return GitHubRepo(GITHUB_REPO, st.secrets.get("GITHUB_TOKEN", ""))
 
 # --- COORDINATE ---
 DEFAULT_MAPS = {
@@ -47,242 +49,132 @@ DEFAULT_MAPS = {
     "orrizontale-preview-app.png": {"coords": (3.17, 4.51, 92.16, 90.0), "offset": 1}
 }
 
+@st.cache_resource
+def get_coord_store():
+    return CoordinateStore(get_github_repo(), GITHUB_COORDS_PATH, GITHUB_COORDS_PATH, DEFAULT_MAPS,
+                           auto_path=AUTO_REGIONS_PATH)
+
 def load_template_maps():
-    try:
-        resp = requests.get(f"{GITHUB_API}/{GITHUB_COORDS_PATH}", headers=get_github_headers(), timeout=5)
-        if resp.status_code == 200:
-            content = resp.json().get("content", "")
-            decoded = base64.b64decode(content).decode("utf-8")
-            return json.loads(decoded)
-    except Exception:
-        pass
-    if os.path.exists(GITHUB_COORDS_PATH):
-        try:
-            with open(GITHUB_COORDS_PATH, 'r') as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return DEFAULT_MAPS
+    return get_coord_store().get()
 
 def save_template_maps(maps):
-    content = json.dumps(maps, indent=2)
-    encoded = base64.b64encode(content.encode("utf-8")).decode("utf-8")
-    headers = get_github_headers()
-    sha = None
-    try:
-        resp = requests.get(f"{GITHUB_API}/{GITHUB_COORDS_PATH}", headers=headers, timeout=5)
-        if resp.status_code == 200:
-            sha = resp.json().get("sha")
-    except Exception:
-        pass
-    payload = {"message": "Update template_coordinates.json", "content": encoded, "branch": "main"}
-    if sha:
-        payload["sha"] = sha
-    try:
-        resp = requests.put(f"{GITHUB_API}/{GITHUB_COORDS_PATH}", headers=headers, json=payload, timeout=10)
-        if resp.status_code in (200, 201):
-            return True
-    except Exception:
-        pass
-    return False
+    ok = get_coord_store().save(maps)
+    plans.invalidate_plans()
+    return ok
 
 # --- TEMPLATE GITHUB ---
-def get_github_sha(path):
-    try:
-        resp = requests.get(f"{GITHUB_API}/{path}", headers=get_github_headers(), timeout=5)
-        if resp.status_code == 200:
-            return resp.json().get("sha")
-    except Exception:
-        pass
-    return None
-
-def upload_template_github(filename, file_bytes):
-    path = f"{GITHUB_TEMPLATES_PATH}/{filename}"
-    encoded = base64.b64encode(file_bytes).decode("utf-8")
-    sha = get_github_sha(path)
-    payload = {"message": f"Add/update template {filename}", "content": encoded, "branch": "main"}
-    if sha:
-        payload["sha"] = sha
-    try:
-        resp = requests.put(f"{GITHUB_API}/{path}", headers=get_github_headers(), json=payload, timeout=30)
-        return resp.status_code in (200, 201)
-    except Exception:
-        return False
-
-def delete_template_github(filename):
-    path = f"{GITHUB_TEMPLATES_PATH}/{filename}"
-    sha = get_github_sha(path)
-    if not sha:
-        return False
-    payload = {"message": f"Delete template {filename}", "sha": sha, "branch": "main"}
-    try:
-        resp = requests.delete(f"{GITHUB_API}/{path}", headers=get_github_headers(), json=payload, timeout=10)
-        return resp.status_code == 200
-    except Exception:
-        return False
+def publish_templates_github(files=None, delete=(), progress=None):
+    """Un solo commit su GitHub per tutti i template caricati/eliminati; PublishReport."""
+    return publish_templates(get_github_repo(), files, delete, GITHUB_TEMPLATES_PATH, progress=progress)
 
 def sync_templates_from_github():
-    """Scarica i template da GitHub nella cartella locale templates/"""
-    os.makedirs("templates", exist_ok=True)
+    """Scarica da GitHub nella cartella locale templates/ solo i template nuovi o modificati"""
     try:
-        resp = requests.get(f"{GITHUB_API}/{GITHUB_TEMPLATES_PATH}", headers=get_github_headers(), timeout=10)
-        if resp.status_code != 200:
-            return False
-        files = resp.json()
-        for f in files:
-            if not f["name"].lower().endswith(('.jpg', '.jpeg', '.png')):
-                continue
-            local_path = os.path.join("templates", f["name"])
-            if not os.path.exists(local_path):
-                dl = requests.get(f["download_url"], timeout=15)
-                if dl.status_code == 200:
-                    with open(local_path, "wb") as out:
-                        out.write(dl.content)
-        return True
+        return sync_templates(get_github_repo(), GITHUB_TEMPLATES_PATH, "templates")
     except Exception:
-        return False
+        return None
 
 # --- SYNC ALL'AVVIO ---
-if 'templates_synced' not in st.session_state:
+if not st.session_state.get('templates_synced'):
     with st.spinner("Sincronizzazione template da GitHub..."):
-        sync_templates_from_github()
+        report = sync_templates_from_github()
+    if report and report.downloaded:
+        st.toast(f"⬇️ {len(report.downloaded)} template aggiornati "
+                 f"({report.bytes / 1e6:.1f} MB in {report.seconds:.1f}s)")
     st.session_state.templates_synced = True
 
 TEMPLATE_MAPS = load_template_maps()
 
-# --- CATEGORIE ---
-def get_manual_cat(filename):
-    fn = filename.lower()
-    if any(x in fn for x in ["vertical", "15x22", "20x30", "bottom", "copertina_verticale"]):
-        return "Verticali"
-    if any(x in fn for x in ["orizzontal", "orrizontale", "orrizontale-preview-app", "20x15", "27x20", "32x24", "40x30"]):
-        return "Orizzontali"
-    if any(x in fn for x in ["quadrat", "20x20", "30x30"]):
-        return "Quadrati"
-    return "Altro"
-
-# --- CORE LOGIC ---
-def find_book_region(tmpl_gray, bg_val):
-    h, w = tmpl_gray.shape
-    book_mask = tmpl_gray > (bg_val + 3)
-    rows, cols = np.any(book_mask, axis=1), np.any(book_mask, axis=0)
-    if not rows.any() or not cols.any():
-        return None
-    by1, by2 = np.where(rows)[0][[0, -1]]
-    bx1, bx2 = np.where(cols)[0][[0, -1]]
-    mid_y = (by1 + by2) // 2
-    row = tmpl_gray[mid_y]
-    face_x1 = bx1
-    for x in range(bx1, bx2 - 5):
-        if np.all(row[x:x+5] >= 240):
-            face_x1 = x
-            break
-    return {
-        'book_x1': int(bx1), 'book_x2': int(bx2),
-        'book_y1': int(by1), 'book_y2': int(by2),
-        'face_x1': int(face_x1)
-    }
-
-def composite_v3_fixed(tmpl_pil, cover_pil, template_name="", border_offset=None):
-    has_alpha = False
-    alpha_mask = None
-    if (tmpl_pil.mode in ('RGBA', 'LA') or
-            (tmpl_pil.mode == 'P' and 'transparency' in tmpl_pil.info) or
-            template_name.lower().endswith('.png')):
-        has_alpha = True
-        tmpl_pil = tmpl_pil.convert('RGBA')
-        alpha_mask = tmpl_pil.split()[3]
-
-    tmpl_rgb = tmpl_pil.convert('RGB')
-    h, w = tmpl_rgb.size[1], tmpl_rgb.size[0]
-
-    if template_name in TEMPLATE_MAPS:
-        d = TEMPLATE_MAPS[template_name]
-        px, py, pw, ph = d["coords"]
-        bo = border_offset if border_offset is not None else d.get("offset", 1)
-        x1, y1 = int((px * w) / 100) + bo, int((py * h) / 100) + bo
-        tw, th = int((pw * w) / 100) - (bo * 2), int((ph * h) / 100) - (bo * 2)
-        target_aspect = tw / th
-        cw, ch = cover_pil.size
-        if cw/ch > target_aspect:
-            nw = int(ch * target_aspect)
-            crop = ((cw - nw)//2, 0, (cw - nw)//2 + nw, ch)
-        else:
-            nh = int(cw / target_aspect)
-            crop = (0, (ch - nh)//2, cw, (ch - nh)//2 + nh)
-        c_res = cover_pil.crop(crop).resize((tw, th), Image.LANCZOS)
-        tmpl_l = np.array(tmpl_rgb.convert('L')).astype(np.float64)
-        shadows = np.clip(tmpl_l[y1:y1+th, x1:x1+tw] / 246.0, 0, 1.0)
-        c_array = np.array(c_res.convert('RGB')).astype(np.float64)
-        for i in range(3):
-            c_array[:,:,i] *= shadows
-        final_face = Image.fromarray(c_array.astype(np.uint8))
-        if c_res.mode == 'RGBA':
-            tmpl_rgb.paste(final_face, (x1, y1), c_res)
-        else:
-            tmpl_rgb.paste(final_face, (x1, y1))
-        if has_alpha:
-            tmpl_rgb.putalpha(alpha_mask)
-        return tmpl_rgb
-
-    tmpl_gray = np.array(tmpl_rgb.convert('L'))
-    corners = [tmpl_gray[3,3], tmpl_gray[3,w-3], tmpl_gray[h-3,3], tmpl_gray[h-3,w-3]]
-    bg_val = float(np.median(corners))
-    region = find_book_region(tmpl_gray, bg_val)
-    if region is None or (region['book_x2'] - region['book_x1'] > w * 0.95):
-        margin_x, margin_y = int(w * 0.2), int(h * 0.1)
-        bx1, bx2, by1, by2 = margin_x, w - margin_x, margin_y, h - margin_y
-    else:
-        bx1, bx2, by1, by2 = region['book_x1'], region['book_x2'], region['book_y1'], region['book_y2']
-
-    if "base_copertina" in template_name.lower():
-        bx1, bx2, by1, by2 = 0, w-1, 0, h-1
-        for x in range(w):
-            if np.any(tmpl_gray[:, x] < 250):
-                bx1 = x
-                break
-        for x in range(w-1, -1, -1):
-            if np.any(tmpl_gray[:, x] < 250):
-                bx2 = x
-                break
-        for y in range(h):
-            if np.any(tmpl_gray[y, :] < 250):
-                by1 = y
-                break
-        for y in range(h-1, -1, -1):
-            if np.any(tmpl_gray[y, :] < 250):
-                by2 = y
-                break
-
-    bx1, bx2 = max(0, bx1 - 2), min(w - 1, bx2 + 2)
-    by1, by2 = max(0, by1 - 2), min(h - 1, by2 + 2)
-    tw, th = bx2 - bx1 + 1, by2 - by1 + 1
-    c_res = cover_pil.resize((tw, th), Image.LANCZOS)
-    c_arr = np.array(c_res.convert('RGB')).astype(np.float64)
-    sh = np.clip(tmpl_gray[by1:by2+1, bx1:bx2+1] / 246.0, 0, 1.0)
-    for i in range(3):
-        c_arr[:,:,i] *= sh
-    final_face = Image.fromarray(c_arr.astype(np.uint8))
-    if c_res.mode == 'RGBA':
-        tmpl_rgb.paste(final_face, (bx1, by1), c_res)
-    else:
-        tmpl_rgb.paste(final_face, (bx1, by1))
-    if has_alpha:
-        tmpl_rgb.putalpha(alpha_mask)
-    return tmpl_rgb
-
 # --- LIBRERIA ---
-@st.cache_data
-def get_lib(h_val):
-    lib = {"Verticali": {}, "Orizzontali": {}, "Quadrati": {}, "Altro": {}}
-    if not os.path.exists("templates"):
-        return lib
-    for f in os.listdir("templates"):
-        if f.lower().endswith(('.jpg', '.png', '.jpeg')):
-            lib[get_manual_cat(f)][f] = Image.open(os.path.join("templates", f))
-    return lib
-
-libreria = get_lib(get_folder_hash("templates"))
+# Indice con i soli metadati; i template si decodificano quando servono, in
+# una cache condivisa da tutte le sessioni con questo limite di memoria
+TEMPLATE_CACHE_MB = 512
+
+@st.cache_resource
+def get_template_library():
+    return TemplateLibrary("templates", budget=TEMPLATE_CACHE_MB * 1024 * 1024)
+
+template_lib = get_template_library()
+libreria = template_lib.index()
+# piani (base, alpha, ombre) mappati da .template_cache/, condivisi con i worker del batch
+plans.use_store(default_root("templates"))
+
+# --- LAVORI IN BACKGROUND ---
+# I batch girano in un thread del processo, non nello script: sopravvivono ai
+# rerun e al refresh del browser, e ogni sessione ne vede l'avanzamento
+JOBS_PATH = ".jobs"
+# File già generati, per (design, template, coordinate, codifica): rilanciare un
+# batch dopo una ricalibrazione rigenera solo le coppie cambiate
+RESULT_CACHE_PATH = ".result_cache"
+RESULT_CACHE_MB = 2048
+# Budget di decodifica per design: oltre, il file viene scartato con un errore
+DESIGN_LIMITS = DesignLimits(max_pixels=100_000_000, max_bytes=768 * 1024 * 1024)
+JOB_STATUS = {"queued": "⏳ In coda", "running": "⚙️ In corso", "done": "✅ Completato",
+              "cancelled": "⛔ Annullato", "failed": "❌ Errore", "interrupted": "⚠️ Interrotto"}
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager(JOBS_PATH, cache_root=RESULT_CACHE_PATH, cache_budget=RESULT_CACHE_MB * 1024 * 1024,
+                      limits=DESIGN_LIMITS)
+
+def file_reader(path):
+    """Callable per st.download_button: legge il file solo al momento del download."""
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+@st.fragment(run_every=2)
+def jobs_panel():
+    jm = get_job_manager()
+    jobs = jm.list()[:10]
+    if not jobs:
+        return
+    st.subheader("📋 Lavori")
+    for job in jobs:
+        job = jm.get(job["id"])
+        job_id, status = job["id"], job["status"]
+        with st.container(border=True):
+            col1, col2 = st.columns([3, 1])
+            col1.markdown(f"**{job['label'] or job_id}** · `{job_id}` · {JOB_STATUS.get(status, status)}")
+            col1.progress(job["done"] / max(job["total"], 1), text=f"{job['done']}/{job['total']}")
+            if job["error"]:
+                col1.caption(job["error"])
+            for error in job.get("errors") or ():
+                col1.caption(f"⚠️ {error}")
+            if job.get("cache"):
+                col1.caption(f"♻️ Dalla cache: {job['cache']['hits']} · generati: {job['cache']['misses']}")
+            if status in ("queued", "running"):
+                if col2.button("⛔ Annulla", key=f"cancel_{job_id}"):
+                    jm.cancel(job_id)
+            elif status in ("cancelled", "failed", "interrupted"):
+                if col2.button("▶️ Riprendi", key=f"resume_{job_id}"):
+                    jm.resume(job_id)
+            if status == "done":
+                col2.download_button("📥 SCARICA ZIP", file_reader(jm.result_path(job_id)),
+                                     f"Mockups_{job_id}.zip", "application/zip", key=f"zip_{job_id}",
+                                     on_click="ignore")
+            if status not in ("queued", "running") and col2.button("🗑️ Elimina", key=f"del_{job_id}"):
+                jm.delete(job_id)
+                st.rerun(scope="fragment")
+            perf_json = jm.perf_path(job_id)
+            if perf_json:
+                with st.expander("⏱️ Performance", expanded=False):
+                    with open(perf_json) as f:
+                        perf = json.load(f)
+                    st.caption(f"Tempo totale: {perf['wall_s']:.2f}s")
+                    rows = perf["stages"]
+                    st.dataframe([{k: v for k, v in r.items() if k != "slowest"} for r in rows],
+                                 use_container_width=True)
+                    for r in rows:
+                        if r["slowest"]:
+                            st.caption(f"**{r['stage']}** più lenti: " +
+                                       ", ".join(f"{s['item']} ({s['ms']:.0f} ms)" for s in r["slowest"]))
+                    c1, c2 = st.columns(2)
+                    c1.download_button("📄 JSON", file_reader(perf_json), "performance.json", "application/json",
+                                       key=f"pj_{job_id}", on_click="ignore")
+                    c2.download_button("📄 CSV", file_reader(jm.perf_path(job_id, "csv")), "performance.csv",
+                                       "text/csv", key=f"pc_{job_id}", on_click="ignore")
 
 # --- INTERFACCIA ---
 menu = st.sidebar.radio("Menu", ["📚 Templates", "🎯 Calibrazione", "⚡ Produzione"])
@@ -294,7 +186,9 @@ if menu == "📚 Templates":
     with col_btn1:
         if st.button("🔄 RICARICA"):
             st.session_state.templates_synced = False
-            st.cache_data.clear()
+            template_lib.clear()
+            plans.use_store(default_root("templates")).prune(
+                info.digest for cat in libreria.values() for info in cat.values())
             st.rerun()
 
     st.divider()
@@ -320,26 +214,21 @@ if menu == "📚 Templates":
 
             if st.button("💾 SALVA TEMPLATE"):
                 os.makedirs("templates", exist_ok=True)
-                salvati = []
-                errori = []
-                progress = st.progress(0)
-                for idx, f in enumerate(uploaded_templates):
+                files = {}
+                for f in uploaded_templates:
                     file_bytes = f.getbuffer().tobytes()
                     dest = os.path.join("templates", f.name)
                     with open(dest, "wb") as out:
                         out.write(file_bytes)
-                    ok = upload_template_github(f.name, file_bytes)
-                    if ok:
-                        salvati.append(f.name)
-                    else:
-                        errori.append(f.name)
-                    progress.progress((idx + 1) / len(uploaded_templates))
-                if salvati:
-                    st.success(f"✅ Salvati su GitHub: {', '.join(salvati)}")
-                if errori:
-                    st.warning(f"⚠️ Salvati solo in locale: {', '.join(errori)}")
+                    files[f.name] = file_bytes
+                progress = st.progress(0)
+                report = publish_templates_github(
+                    files, progress=lambda name, done, total: progress.progress(done / total, text=name))
+                if report.ok:
+                    st.success(f"✅ Salvati su GitHub: {', '.join(report.uploaded)}")
+                else:
+                    st.warning(f"⚠️ Salvati solo in locale: {', '.join(files)} ({report.error})")
                 st.session_state.uploader_key += 1
-                st.cache_data.clear()
                 st.rerun()
 
     # --- ELIMINA TEMPLATE ---
@@ -351,22 +240,15 @@ if menu == "📚 Templates":
         if all_templates:
             da_eliminare = st.multiselect("Seleziona template da eliminare:", all_templates)
             if da_eliminare and st.button("🗑️ ELIMINA SELEZIONATI", type="primary"):
-                eliminati = []
-                errori = []
                 for fn in da_eliminare:
                     path = os.path.join("templates", fn)
                     if os.path.exists(path):
                         os.remove(path)
-                    ok = delete_template_github(fn)
-                    if ok:
-                        eliminati.append(fn)
-                    else:
-                        errori.append(fn)
-                if eliminati:
-                    st.success(f"✅ Eliminati da GitHub: {', '.join(eliminati)}")
-                if errori:
-                    st.warning(f"⚠️ Eliminati solo in locale: {', '.join(errori)}")
-                st.cache_data.clear()
+                report = publish_templates_github(delete=da_eliminare)
+                if report.ok:
+                    st.success(f"✅ Eliminati da GitHub: {', '.join(report.deleted)}")
+                else:
+                    st.warning(f"⚠️ Eliminati solo in locale: {', '.join(da_eliminare)} ({report.error})")
                 st.rerun()
         else:
             st.info("Nessun template presente.")
@@ -378,33 +260,51 @@ if menu == "📚 Templates":
     for i, c in enumerate(libreria.keys()):
         with ts[i]:
             cols = st.columns(4)
-            for idx, (fn, img) in enumerate(libreria[c].items()):
-                cols[idx%4].image(img, caption=fn, use_column_width=True)
+            for idx, (fn, info) in enumerate(libreria[c].items()):
+                cols[idx%4].image(template_lib.thumbnail(info), caption=fn, use_column_width=True)
 
 elif menu == "🎯 Calibrazione":
     cat = st.selectbox("Categoria:", list(libreria.keys()))
     sel = st.selectbox("Template:", list(libreria[cat].keys()))
     if sel:
-        t_img = libreria[cat][sel]
+        t_img = template_lib.image(libreria[cat][sel])
         d = TEMPLATE_MAPS.get(sel, {"coords": (20, 10, 60, 80), "offset": 1})
         if 'cal' not in st.session_state or st.session_state.get('cur') != sel:
-            st.session_state.cal = d
+            st.session_state.cal = dict(d)
             st.session_state.cur = sel
-        c = list(st.session_state.cal["coords"])
-        st.session_state.cal["coords"] = c
-        col1, col2 = st.columns(2)
-        c[0] = col1.number_input("X %", 0.0, 100.0, float(c[0]))
-        c[1] = col2.number_input("Y %", 0.0, 100.0, float(c[1]))
-        c[2] = col1.number_input("W %", 0.0, 100.0, float(c[2]))
-        c[3] = col2.number_input("H %", 0.0, 100.0, float(c[3]))
-        st.session_state.cal["offset"] = st.slider("Offset", 0, 20, int(st.session_state.cal["offset"]))
+        cal = st.session_state.cal
+        c = list(cal["coords"])
+        cal["coords"] = c
+        modo = st.radio("Forma faccia:", ["▭ Rettangolo", "⬠ 4 angoli (prospettiva)"],
+                        index=1 if cal.get("quad") else 0, horizontal=True)
         p_img = t_img.copy().convert('RGB')
         draw = ImageDraw.Draw(p_img)
         w, h = p_img.size
-        draw.rectangle(
-            [int(c[0]*w/100), int(c[1]*h/100), int((c[0]+c[2])*w/100), int((c[1]+c[3])*h/100)],
-            outline="red", width=5
-        )
+        if modo.startswith("▭"):
+            cal.pop("quad", None)
+            col1, col2 = st.columns(2)
+            c[0] = col1.number_input("X %", 0.0, 100.0, float(c[0]))
+            c[1] = col2.number_input("Y %", 0.0, 100.0, float(c[1]))
+            c[2] = col1.number_input("W %", 0.0, 100.0, float(c[2]))
+            c[3] = col2.number_input("H %", 0.0, 100.0, float(c[3]))
+            cal["offset"] = st.slider("Offset", 0, 20, int(cal.get("offset", 1)))
+            draw.rectangle(
+                [int(c[0]*w/100), int(c[1]*h/100), int((c[0]+c[2])*w/100), int((c[1]+c[3])*h/100)],
+                outline="red", width=5
+            )
+        else:
+            # angoli in senso orario dall'alto a sinistra; si parte dal rettangolo attuale
+            quad = [list(p) for p in cal.get("quad") or
+                    [(c[0], c[1]), (c[0]+c[2], c[1]), (c[0]+c[2], c[1]+c[3]), (c[0], c[1]+c[3])]]
+            labels = ["↖ Alto sx", "↗ Alto dx", "↘ Basso dx", "↙ Basso sx"]
+            for (label, p), col in zip(zip(labels, quad), st.columns(4)):
+                p[0] = col.number_input(f"{label} X %", 0.0, 100.0, float(p[0]), key=f"q_{sel}_{label}_x")
+                p[1] = col.number_input(f"{label} Y %", 0.0, 100.0, float(p[1]), key=f"q_{sel}_{label}_y")
+            cal["quad"] = quad
+            # coords resta il box che contiene gli angoli, per chi non gestisce "quad"
+            xs, ys = [p[0] for p in quad], [p[1] for p in quad]
+            c[:] = [min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)]
+            draw.polygon([(p[0]*w/100, p[1]*h/100) for p in quad], outline="red", width=5)
         st.image(p_img, use_column_width=True)
         if st.button("💾 SALVA"):
             TEMPLATE_MAPS[sel] = st.session_state.cal
@@ -417,46 +317,55 @@ elif menu == "🎯 Calibrazione":
 elif menu == "⚡ Produzione":
     scelta = st.radio("Formato:", ["Verticali", "Orizzontali", "Quadrati"], horizontal=True)
     up = st.file_uploader("Carica design", type=['jpg', 'png'], key='preview')
+    d_img = None
     if up and libreria[scelta]:
-        d_img = Image.open(up)
+        try:
+            d_img = open_proxy(up, PREVIEW_WIDTH)
+        except DesignError as e:
+            st.error(f"❌ {e}")
+    if d_img is not None:
+        resampler = CoverResampler(d_img)
         cols = st.columns(4)
-        for i, (t_name, t_img) in enumerate(libreria[scelta].items()):
+        for i, (t_name, info) in enumerate(libreria[scelta].items()):
             with cols[i%4]:
-                res = composite_v3_fixed(t_img, d_img, t_name)
+                # template aperto solo per l'header: con il piano in cache i pixel non si decodificano
+                with Image.open(info.path) as tmpl:
+                    res = composite_v3_fixed(tmpl, d_img, t_name, maps=TEMPLATE_MAPS, resampler=resampler,
+                                             proxy_width=PREVIEW_WIDTH, auto=get_coord_store().auto)
                 st.image(res, caption=t_name, use_column_width=True)
     st.divider()
     batch = st.file_uploader("Batch Produzione", accept_multiple_files=True)
+    with st.expander("⚙️ Formato file", expanded=False):
+        col1, col2 = st.columns(2)
+        webp = col1.checkbox("WebP al posto di JPEG/PNG")
+        if webp:
+            webp_quality = col2.slider("Qualità WebP", 50, 100, 90)
+            encoder = EncoderSettings(webp=True, webp_quality=webp_quality)
+        else:
+            jpeg_quality = col1.slider("Qualità JPEG", 50, 100, 95)
+            subsampling = col2.selectbox("Sottocampionamento JPEG", SUBSAMPLING)
+            progressive = col1.checkbox("JPEG progressivo")
+            png_level = col2.slider("Compressione PNG", 0, 9, 6)
+            encoder = EncoderSettings(jpeg_quality=jpeg_quality, jpeg_progressive=progressive,
+                                      jpeg_subsampling=subsampling, png_compress_level=png_level)
     if st.button("🚀 GENERA TUTTI") and batch and libreria[scelta]:
-        zip_buf = io.BytesIO()
-        with zipfile.ZipFile(zip_buf, "a", zipfile.ZIP_DEFLATED) as zf:
-            progress = st.progress(0)
-            total = len(batch) * len(libreria[scelta])
-            count = 0
-            for b_file in batch:
-                b_img = Image.open(b_file)
-                base_name = os.path.splitext(b_file.name)[0]
-                if base_name.lower().endswith('.png'):
-                    base_name = base_name[:-4]
-                for t_name, t_img in libreria[scelta].items():
-                    res = composite_v3_fixed(t_img, b_img, t_name)
-                    is_tmpl_png = t_name.lower().endswith('.png') or res.mode == 'RGBA'
-                    save_fmt = 'PNG' if is_tmpl_png else 'JPEG'
-                    save_ext = '.png' if is_tmpl_png else '.jpg'
-                    buf = io.BytesIO()
-                    if save_fmt == 'PNG':
-                        res.save(buf, format='PNG')
-                    else:
-                        res.save(buf, format='JPEG', quality=95)
-                    t_clean = os.path.splitext(t_name)[0]
-                    if t_clean.lower().endswith('.png'):
-                        t_clean = t_clean[:-4]
-                    formato = t_clean.split('-')[0] if '-' in t_clean else t_clean
-                    nuovo_nome = f"{formato}-{base_name}{save_ext}"
-                    zf.writestr(f"{base_name}/{nuovo_nome}", buf.getvalue())
-                    count += 1
-                    progress.progress(count/total)
-        st.session_state.zip_ready = True
-        st.session_state.zip_data = zip_buf.getvalue()
-        st.success("Tutto pronto!")
-    if st.session_state.get('zip_ready'):
-        st.download_button("📥 SCARICA ZIP", st.session_state.zip_data, f"Mockups_{scelta}.zip", "application/zip")
+        template_paths = {t_name: info.path for t_name, info in libreria[scelta].items()}
+        # dimensioni delle facce dai piani in cache: i template si decodificano solo se il piano manca
+        faces = {}
+        for t_name, info in libreria[scelta].items():
+            with Image.open(info.path) as tmpl:
+                faces[t_name] = face_size(plan_v3(tmpl, t_name, TEMPLATE_MAPS, auto=get_coord_store().auto))
+        # solo header: i file oltre il budget restano fuori dal lavoro, con il motivo
+        valid = []
+        for b_file in batch:
+            try:
+                check_design(b_file, b_file.name, faces.values(), DESIGN_LIMITS)
+                valid.append(b_file)
+            except DesignError as e:
+                st.error(f"❌ {e}")
+        if valid:
+            job_id = get_job_manager().submit(
+                [(b_file.getbuffer(), b_file.name) for b_file in valid], template_paths, TEMPLATE_MAPS,
+                auto_path=AUTO_REGIONS_PATH, encoder=encoder, label=f"{scelta} · {len(valid)} design")
+            st.toast(f"🚀 Lavoro {job_id} in coda")
+    jobs_panel()
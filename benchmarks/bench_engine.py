@@ -0,0 +1,286 @@
+"""Benchmark riproducibile dei motori di composizione e del batch.
+
+    python -m benchmarks.bench_engine                      # dimensioni di stampa
+    python -m benchmarks.bench_engine --quick --out a.json # giro veloce
+
+Genera template sintetici (JPEG RGB calibrato, PNG RGBA calibrato, JPEG da
+rilevare in automatico, copertina) e design JPEG in una cartella temporanea;
+aggiunge i template reali di templates/ se presenti. Misura la latenza per
+stadio (percentili), il picco di RSS e il throughput end-to-end del percorso
+anteprima e del percorso "GENERA TUTTI". Ogni fase gira in un processo nuovo,
+così il picco di RSS è quello della fase e non di tutto il giro. Il risultato
+è un JSON confrontabile tra un giro e l'altro. Funziona offline.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+from mockup_engine import detect, plans
+from mockup_engine.batch import render_batch
+from mockup_engine.compositor import composite_v3_fixed, plan_v3
+from mockup_engine.encode import encode_result
+from mockup_engine.library import list_templates
+from mockup_engine.resample import CoverResampler, open_proxy
+from mockup_engine.soft import process_mockup
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREVIEW_WIDTH = 640
+
+
+def make_template(path, size, rng, alpha=False, copertina=False):
+    """Libro chiaro con ombre morbide su fondo uniforme; restituisce le coordinate in %."""
+    w, h = size
+    bg = 255 if copertina else 228
+    frame = np.full((h, w), bg, np.float32)
+    x1, y1, x2, y2 = int(w * 0.22), int(h * 0.1), int(w * 0.78), int(h * 0.9)
+    yy, xx = np.mgrid[y1:y2, x1:x2]
+    shade = 246 - 30 * ((xx - x1) / (x2 - x1)) ** 2 - 8 * np.sin(yy / h * np.pi)
+    frame[y1:y2, x1:x2] = shade
+    frame = cv2.GaussianBlur(frame, (0, 0), 1.5) + rng.normal(0, 1.0, frame.shape)
+    gray = np.clip(frame, 0, 255).astype(np.uint8)
+    rgb = np.dstack([gray, gray, (gray * 0.98).astype(np.uint8)])
+    if alpha:
+        a = np.zeros((h, w), np.uint8)
+        a[y1 - 20:y2 + 20, x1 - 20:x2 + 20] = 255
+        Image.fromarray(np.dstack([rgb, a]), 'RGBA').save(path)
+    else:
+        Image.fromarray(rgb).save(path, quality=92)
+    return [x1 * 100 / w, y1 * 100 / h, (x2 - x1) * 100 / w, (y2 - y1) * 100 / h]
+
+
+def make_design(path, size, rng):
+    """Design fotografico a bassa frequenza + dettaglio, salvato come JPEG di stampa."""
+    w, h = size
+    small = rng.integers(0, 256, (h // 32 + 1, w // 32 + 1, 3), dtype=np.uint8)
+    img = cv2.resize(cv2.GaussianBlur(small, (0, 0), 1.2), (w, h), interpolation=cv2.INTER_CUBIC)
+    img = np.clip(img.astype(np.int16) + rng.integers(-6, 7, (h, w, 1), dtype=np.int16), 0, 255).astype(np.uint8)
+    Image.fromarray(img).save(path, quality=95)
+
+
+def build_corpus(root, quick, use_real):
+    rng = np.random.default_rng(1234)
+    t_size = (1200, 1000) if quick else (3600, 3000)
+    d_size = (1500, 2000) if quick else (5400, 7200)
+    tdir = os.path.join(root, "templates")
+    os.makedirs(tdir)
+    maps = {}
+    specs = [("synt-rgb-calibrato.jpg", False, False, True),
+             ("synt-rgba-calibrato.png", True, False, True),
+             ("synt-rgb-auto.jpg", False, False, False),
+             ("synt-base_copertina-auto.jpg", False, True, False)]
+    for name, alpha, copertina, calibrated in specs:
+        coords = make_template(os.path.join(tdir, name), t_size, rng, alpha, copertina)
+        if calibrated:
+            maps[name] = {"coords": coords, "offset": 2}
+    if use_real and os.path.isdir(os.path.join(REPO_ROOT, "templates")):
+        real_dir = os.path.join(REPO_ROOT, "templates")
+        for name in list_templates(real_dir):
+            os.symlink(os.path.join(real_dir, name), os.path.join(tdir, name))
+        try:
+            with open(os.path.join(REPO_ROOT, "template_coordinates.json")) as f:
+                maps.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    ddir = os.path.join(root, "designs")
+    os.makedirs(ddir)
+    n_designs = 3 if quick else 6
+    for i in range(n_designs):
+        make_design(os.path.join(ddir, f"design-{i:02d}.jpg"), d_size, rng)
+    return tdir, ddir, maps
+
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {"n": int(ms.size), "mean_ms": round(float(ms.mean()), 3),
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p90_ms": round(float(np.percentile(ms, 90)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "max_ms": round(float(ms.max()), 3)}
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss è in KB su Linux; è il picco dall'avvio del processo
+    return round(resource.getrusage(who).ru_maxrss / 1024.0, 1)
+
+
+def _phase_main(conn, fn, args):
+    conn.send((fn(*args), peak_rss_mb(), peak_rss_mb(resource.RUSAGE_CHILDREN)))
+    conn.close()
+
+
+def run_phase(fn, *args):
+    """Esegue fn(*args) in un processo nuovo ("spawn").
+
+    Restituisce (risultato, picco di RSS della fase, picco dei suoi processi
+    figli, cioè dei worker del batch). ru_maxrss non si azzera: solo un
+    processo per fase dà un picco per fase.
+    """
+    ctx = mp.get_context("spawn")
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_phase_main, args=(send, fn, args))
+    proc.start()
+    send.close()
+    try:
+        return recv.recv()
+    except EOFError:
+        proc.join()
+        raise RuntimeError(f"{fn.__name__}: processo terminato con codice {proc.exitcode}") from None
+    finally:
+        recv.close()
+        proc.join()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - start, out
+
+
+def bench_stages(tdir, ddir, maps, repeat):
+    names = list_templates(tdir)
+    templates = {n: Image.open(os.path.join(tdir, n)) for n in names}
+    designs = [os.path.join(ddir, f) for f in sorted(os.listdir(ddir))]
+    soft_maps = {n: tuple(d["coords"]) for n, d in maps.items()}
+    stages = {k: [] for k in ("decode", "detect", "plan_build", "resize", "composite", "composite_proxy",
+                              "soft_mockup", "encode")}
+    for d_path in designs:
+        dt, design = timed(lambda: Image.open(d_path).convert('RGB'))
+        stages["decode"].append(dt)
+        for name, tmpl in templates.items():
+            gray = np.array(tmpl.convert('L'))
+            stages["detect"].append(timed(lambda: detect.detect_face_v3(gray, name))[0])
+        plans.invalidate_plans()
+        for name, tmpl in templates.items():
+            stages["plan_build"].append(timed(lambda: composite_v3_fixed(tmpl, Image.new('RGB', (8, 8)), name,
+                                                                         maps=maps))[0])
+        for _ in range(repeat):
+            resampler = CoverResampler(design)
+            for name, tmpl in templates.items():
+                size = plan_v3(tmpl, name, maps).box[2:]
+                stages["resize"].append(timed(lambda: CoverResampler(design).resize(size))[0])
+                dt, res = timed(lambda: composite_v3_fixed(tmpl, design, name, maps=maps, resampler=resampler))
+                stages["composite"].append(dt)
+                stages["encode"].append(timed(lambda: encode_result(res, name))[0])
+                stages["soft_mockup"].append(timed(lambda: process_mockup(tmpl, design, name, 5.0,
+                                                                          maps=soft_maps))[0])
+        proxy = open_proxy(d_path, PREVIEW_WIDTH)
+        proxy_rs = CoverResampler(proxy)
+        for name, tmpl in templates.items():
+            stages["composite_proxy"].append(timed(lambda: composite_v3_fixed(
+                tmpl, proxy, name, maps=maps, resampler=proxy_rs, proxy_width=PREVIEW_WIDTH))[0])
+    return {k: summarize(v) for k, v in stages.items() if v}
+
+
+def bench_preview(tdir, ddir, maps):
+    """Anteprima di una categoria: decodifica ridotta + render proxy di tutti i template.
+
+    I piani si costruiscono prima di misurare, come nell'app dopo la prima anteprima.
+    """
+    names = list_templates(tdir)
+    templates = {n: Image.open(os.path.join(tdir, n)) for n in names}
+    designs = [os.path.join(ddir, f) for f in sorted(os.listdir(ddir))]
+    warm = open_proxy(designs[0], PREVIEW_WIDTH)
+    for name, tmpl in templates.items():
+        composite_v3_fixed(tmpl, warm, name, maps=maps, proxy_width=PREVIEW_WIDTH)
+    per_design = []
+    for d_path in designs:
+        def run():
+            d_img = open_proxy(d_path, PREVIEW_WIDTH)
+            rs = CoverResampler(d_img)
+            for name, tmpl in templates.items():
+                composite_v3_fixed(tmpl, d_img, name, maps=maps, resampler=rs, proxy_width=PREVIEW_WIDTH)
+        per_design.append(timed(run)[0])
+    images = len(designs) * len(names)
+    return {"templates": len(names), "designs": len(designs), "per_design": summarize(per_design),
+            "images_per_s": round(images / sum(per_design), 2)}
+
+
+def bench_batch(tdir, ddir, maps, workers):
+    """Percorso "GENERA TUTTI" completo: render + codifica, piani a freddo."""
+    names = list_templates(tdir)
+    template_paths = {n: os.path.join(tdir, n) for n in names}
+    designs = [(os.path.join(ddir, f), f) for f in sorted(os.listdir(ddir))]
+    plans.invalidate_plans()
+    out_bytes = 0
+    start = time.perf_counter()
+    count = 0
+    for _, data in render_batch(designs, template_paths, maps, workers):
+        out_bytes += len(data)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return {"workers": workers, "images": count, "seconds": round(elapsed, 3),
+            "images_per_s": round(count / elapsed, 2), "output_mb": round(out_bytes / 1e6, 2)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m benchmarks.bench_engine")
+    p.add_argument("--quick", action="store_true", help="dimensioni ridotte per un giro rapido")
+    p.add_argument("--repeat", type=int, default=None, help="ripetizioni per design (default 3, 1 con --quick)")
+    p.add_argument("--workers", type=int, action="append",
+                   help="worker per il batch, ripetibile (default 1 e tutte le CPU)")
+    p.add_argument("--no-real-templates", action="store_true", help="ignora la cartella templates/ del repo")
+    p.add_argument("--out", default=None, help="file JSON (default bench_results/<data>.json)")
+    args = p.parse_args(argv)
+
+    repeat = args.repeat or (1 if args.quick else 3)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    workers = args.workers or sorted({1, cpus})
+    report = {
+        "meta": {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "git": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": cpus, "numpy": np.__version__, "pillow": PIL.__version__, "opencv": cv2.__version__,
+                 "quick": args.quick, "repeat": repeat},
+    }
+    with tempfile.TemporaryDirectory() as root:
+        tdir, ddir, maps = build_corpus(root, args.quick, not args.no_real_templates)
+        report["corpus"] = {"templates": list_templates(tdir), "designs": sorted(os.listdir(ddir))}
+        print("stadi...", file=sys.stderr)
+        report["stages"], stages_rss, _ = run_phase(bench_stages, tdir, ddir, maps, repeat)
+        print("anteprima...", file=sys.stderr)
+        report["preview"], preview_rss, _ = run_phase(bench_preview, tdir, ddir, maps)
+        report["peak_rss_mb"] = {"stages": stages_rss, "preview": preview_rss, "batch": []}
+        report["batch"] = []
+        for w in workers:
+            print(f"batch con {w} worker...", file=sys.stderr)
+            batch, batch_rss, workers_rss = run_phase(bench_batch, tdir, ddir, maps, w)
+            report["batch"].append(batch)
+            # con un worker il batch gira nel processo della fase: non ci sono figli
+            report["peak_rss_mb"]["batch"].append({"workers": w, "main": batch_rss,
+                                                   "worker": workers_rss if w > 1 else None})
+
+    out = args.out or os.path.join(REPO_ROOT, "bench_results",
+                                   datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({"stages": {k: v["p50_ms"] for k, v in report["stages"].items()},
+                      "preview": report["preview"]["images_per_s"],
+                      "batch": [(b["workers"], b["images_per_s"]) for b in report["batch"]],
+                      "peak_rss_mb": report["peak_rss_mb"]}, indent=1))
+    print(f"risultati in {out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,532 @@
+"""Equivalenza a immagini golden dei percorsi di rendering più veloci.
+
+    python -m benchmarks.golden record                        # impronte del riferimento
+    python -m benchmarks.golden check                         # tutti i modi
+    python -m benchmarks.golden check --mode v3-ingest --out golden.json
+
+record renderizza un corpus fisso di design su ogni template di templates/
+con le implementazioni di riferimento (v3-ref e v4-ref: la copia congelata
+dei motori di partenza in benchmarks/golden_reference.py, float64 a piena
+risoluzione) e salva in golden/ un'impronta per ogni immagine:
+
+    golden/manifest.json   versioni delle librerie e impronte (sha1 dei pixel, dimensioni, modo)
+    golden/designs/        il corpus, generato alla prima record e poi riusato
+    golden/thumbs/         miniature del riferimento, per misurare la deriva
+
+check rifà il riferimento e lo confronta con le impronte: se coincidono il
+riferimento di questo giro è identico al golden pixel per pixel, quindi ogni
+modo (MODES), compresi i motori attuali a piena risoluzione, si confronta con
+lui: errore massimo per pixel, PSNR e SSIM, con soglie per modo. Riferimento
+e modi girano design per design sullo stesso corpus, così escono insieme i
+tempi ("quanto più veloce") e le differenze ("ancora uguale"). Codice di
+uscita 1 se un modo supera le soglie o il riferimento non coincide con il
+golden. Funziona offline.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+
+from benchmarks import golden_reference
+from benchmarks.bench_engine import REPO_ROOT, make_design, summarize
+from mockup_engine import plans
+from mockup_engine.compositor import composite_v3_fixed, face_size, plan_v3
+from mockup_engine.ingest import open_design
+from mockup_engine.library import list_templates
+from mockup_engine.resample import CoverResampler, DesignSource, open_proxy
+from mockup_engine.soft import feather_face, plan_v4, prepare_face, process_mockup
+
+DEFAULT_DIR = os.path.join(REPO_ROOT, "golden")
+THUMB_SIDE = 256
+BLUR_RADIUS = 5.0           # sfumatura di default del calibratore
+APP_PREVIEW_WIDTH = 640     # anteprima di app.py
+CALIB_PREVIEW_WIDTH = 1000  # anteprima del calibratore
+
+
+def _no_session(scratch):
+    return contextlib.nullcontext()
+
+
+@dataclass(frozen=True)
+class Mode:
+    """Un modo di rendering; reference è il motore con cui va confrontato (None: è un riferimento).
+
+    open(ctx, path) prepara il design (misurato a parte), render(ctx, state, t_name)
+    restituisce l'immagine o None se il motore salta il template. Le soglie
+    None non si controllano; resized confronta con il riferimento ridotto alle
+    dimensioni del modo (anteprime).
+    """
+    open: object
+    render: object
+    reference: str = None
+    max_error: int = None
+    min_psnr: float = None
+    min_ssim: float = None
+    resized: bool = False
+    session: object = _no_session  # session(scratch): contesto attivo mentre il modo gira
+
+
+class Context:
+    """Template, coordinate V3 (template_coordinates.json) e V4 (le stesse come tuple) del giro."""
+
+    def __init__(self, templates_dir, coords_path):
+        self.templates_dir = templates_dir
+        self.names = list_templates(templates_dir)
+        try:
+            with open(coords_path) as f:
+                self.maps = json.load(f)
+        except (OSError, ValueError):
+            self.maps = {}
+        self.maps4 = {n: tuple(d["coords"]) for n, d in self.maps.items() if d.get("coords")}
+        self._templates = {}
+
+    def template(self, t_name):
+        tmpl = self._templates.get(t_name)
+        if tmpl is None:
+            tmpl = self._templates[t_name] = Image.open(os.path.join(self.templates_dir, t_name))
+        return tmpl
+
+    def faces_v3(self):
+        """Facce V3 di tutti i template: come nel batch, il design si decodifica per la più grande."""
+        return [face_size(plan_v3(self.template(t_name), t_name, self.maps)) for t_name in self.names]
+
+    def faces_v4(self):
+        found = (plan_v4(self.template(t_name), t_name, self.maps4) for t_name in self.names)
+        return [plan.box[2:] for plan in found if plan is not None]
+
+    def warm(self):
+        """Piani a piena risoluzione di tutti i template, fuori dalle misure."""
+        for t_name in self.names:
+            plan_v3(self.template(t_name), t_name, self.maps)
+            plan_v4(self.template(t_name), t_name, self.maps4)
+
+
+# --- modi ---
+
+def _open_full(ctx, path):
+    return CoverResampler(open_design(path))
+
+
+def _open_source(ctx, path):
+    return DesignSource(path, faces=ctx.faces_v3())
+
+
+def _open_source_rgb(ctx, path):
+    return DesignSource(path, faces=ctx.faces_v4(), mode='RGB')
+
+
+def _render_v3_ref(ctx, resampler, t_name):
+    return golden_reference.composite_v3_fixed(ctx.template(t_name), resampler.image, t_name, ctx.maps)
+
+
+def _render_v3(ctx, resampler, t_name):
+    return composite_v3_fixed(ctx.template(t_name), resampler.image, t_name, maps=ctx.maps, resampler=resampler)
+
+
+def _render_v3_ingest(ctx, source, t_name):
+    tmpl = ctx.template(t_name)
+    resampler = source.resampler()
+    return composite_v3_fixed(tmpl, resampler.image, t_name, maps=ctx.maps, resampler=resampler)
+
+
+@contextlib.contextmanager
+def _plan_store_session(scratch):
+    # piani dallo store su disco: il primo giro li scrive, i successivi li mappano
+    previous = plans.store_root()
+    plans.use_store(os.path.join(scratch, "plans"))
+    plans.invalidate_plans()
+    try:
+        yield
+    finally:
+        plans.use_store(previous)
+        plans.invalidate_plans()
+
+
+def _open_preview(width):
+    return lambda ctx, path: CoverResampler(open_proxy(path, width))
+
+
+def _render_v3_preview(ctx, resampler, t_name):
+    return composite_v3_fixed(ctx.template(t_name), resampler.image, t_name, maps=ctx.maps, resampler=resampler,
+                              proxy_width=APP_PREVIEW_WIDTH)
+
+
+def _open_full_rgb(ctx, path):
+    return CoverResampler(open_design(path).convert('RGB'))
+
+
+def _render_v4_ref(ctx, resampler, t_name):
+    return golden_reference.process_mockup(ctx.template(t_name), resampler.image, t_name, BLUR_RADIUS, ctx.maps4)
+
+
+def _render_v4(ctx, resampler, t_name):
+    return process_mockup(ctx.template(t_name), resampler.image, t_name, BLUR_RADIUS, resampler, maps=ctx.maps4)
+
+
+def _render_v4_ingest(ctx, source, t_name):
+    tmpl = ctx.template(t_name)
+    plan = plan_v4(tmpl, t_name, ctx.maps4)
+    if plan is None:
+        return None
+    resampler = source.resampler()
+    return process_mockup(tmpl, resampler.image, t_name, BLUR_RADIUS, resampler, maps=ctx.maps4)
+
+
+def _render_v4_preview(ctx, resampler, t_name):
+    # come l'anteprima del calibratore: il proxy passa da prepare_face, che lo converte in RGB
+    face = prepare_face(ctx.template(t_name), resampler.image, t_name, maps=ctx.maps4,
+                        proxy_width=CALIB_PREVIEW_WIDTH)
+    return feather_face(face, BLUR_RADIUS) if face is not None else None
+
+
+# Soglie tarate sul corpus contro mutazioni vere dei motori, non su "ciò che passa
+# oggi": tra parentesi il caso peggiore del percorso veloce e la mutazione che la
+# soglia deve fermare (misure del corpus con numpy 2.4, Pillow 12.3, OpenCV 5.0).
+MODES = {
+    "v3-ref": Mode(_open_full, _render_v3_ref),
+    # resize a due passi (REDUCING_GAP) e ombre in uint8 arrotondate: errore <= 3, PSNR >= 50.5;
+    # ombre /245 invece di /246 nel motore scendono a 45.1 dB, LANCZOS -> BILINEAR a 34 dB
+    "v3": Mode(_open_full, _render_v3, "v3-ref", max_error=3, min_psnr=49.0, min_ssim=0.995),
+    # draft JPEG alla scala della faccia più grande (49.5 dB); decodificare a metà della
+    # scala utile scende a 46.4 dB
+    "v3-ingest": Mode(_open_source, _render_v3_ingest, "v3-ref", min_psnr=48.0, min_ssim=0.99),
+    # piani mappati dallo store: stessi pixel del piano in memoria, quindi stesse soglie di v3
+    "v3-store": Mode(_open_full, _render_v3, "v3-ref", max_error=3, min_psnr=49.0, min_ssim=0.995,
+                     session=_plan_store_session),
+    # anteprime confrontate alla loro risoluzione: le righe fitte di bordi-netti sono il caso
+    # peggiore (24.9 dB, SSIM 0.857; le foto restano sopra 33 dB). La faccia spostata di un pixel
+    # dell'anteprima scende a 23.0 dB, un proxy a 1/4 della larghezza a 22.9 dB e SSIM 0.72
+    "v3-preview": Mode(_open_preview(APP_PREVIEW_WIDTH), _render_v3_preview, "v3-ref",
+                       min_psnr=23.5, min_ssim=0.84, resized=True),
+    "v4-ref": Mode(_open_full_rgb, _render_v4_ref),
+    # come v3 (49.9 dB); ombre /253 invece di /255 nel motore scendono a 42.1 dB, sfumatura
+    # di raggio 4 invece di 5 a 43.5 dB
+    "v4": Mode(_open_full_rgb, _render_v4, "v4-ref", max_error=3, min_psnr=48.0, min_ssim=0.995),
+    # 49.2 dB; a metà della scala utile 47.4 dB
+    "v4-ingest": Mode(_open_source_rgb, _render_v4_ingest, "v4-ref", min_psnr=48.0, min_ssim=0.99),
+    # 19.4 dB e SSIM 0.875 sulle righe fitte (le foto sopra 40 dB); faccia spostata di un pixel
+    # dell'anteprima a 14.2 dB e SSIM 0.62, proxy a 1/4 della larghezza a 16.7 dB
+    "v4-preview": Mode(_open_preview(CALIB_PREVIEW_WIDTH), _render_v4_preview, "v4-ref",
+                       min_psnr=18.0, min_ssim=0.85, resized=True),
+}
+ENGINES = [name for name, mode in MODES.items() if mode.reference is None]
+
+
+# --- corpus ---
+
+def make_corpus(ddir):
+    """Design fissi: due foto JPEG (verticale e orizzontale), un PNG trasparente, un PNG a bordi netti."""
+    os.makedirs(ddir, exist_ok=True)
+    rng = np.random.default_rng(2024)
+    make_design(os.path.join(ddir, "foto-verticale.jpg"), (3000, 4000), rng)
+    make_design(os.path.join(ddir, "foto-orizzontale.jpg"), (4200, 2800), rng)
+
+    yy, xx = np.mgrid[0:1600, 0:1600].astype(np.float32) / 1600
+    rgba = np.dstack([xx * 255, yy * 255, (1 - xx) * 200 + 30,
+                      np.where((xx - 0.5) ** 2 + (yy - 0.5) ** 2 < 0.16, 255, 0)]).astype(np.uint8)
+    Image.fromarray(rgba, 'RGBA').save(os.path.join(ddir, "trasparente.png"))
+
+    # righe sottili e testo: il caso peggiore per ricampionamento e decodifica ridotta
+    img = Image.new('RGB', (2000, 2800), (250, 248, 240))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, 2000, 7):
+        draw.line([(x, 0), (x, 700)], fill=(20, 20, 20), width=2)
+    for i in range(40):
+        draw.text((80, 800 + i * 48), f"Fotolibro {i:02d} - ABCDEFGHIJ abcdefghij 0123456789" * 2, fill=(30, 30, 120))
+    draw.rectangle([200, 2800 - 600, 1800, 2800 - 200], outline=(180, 20, 20), width=9)
+    img.save(os.path.join(ddir, "bordi-netti.png"))
+
+
+def corpus(ddir):
+    return [os.path.join(ddir, f) for f in sorted(os.listdir(ddir))]
+
+
+# --- metriche ---
+
+def fingerprint(img):
+    arr = np.asarray(img)
+    h = hashlib.sha1(f"{img.mode} {img.size[0]}x{img.size[1]} ".encode("ascii"))
+    h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def thumbnail(img):
+    thumb = img.copy()
+    thumb.thumbnail((THUMB_SIDE, THUMB_SIDE), Image.LANCZOS)
+    return thumb
+
+
+def psnr(a, b):
+    mse = float(np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2))
+    return math.inf if mse == 0 else 10 * math.log10(255.0 ** 2 / mse)
+
+
+def ssim(a, b):
+    """SSIM sulla luminanza, finestra gaussiana 11x11 con sigma 1.5 (Wang et al. 2004)."""
+    def luma(arr):
+        rgb = arr[..., :3] if arr.ndim == 3 else arr
+        gray = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2GRAY) if rgb.ndim == 3 else rgb
+        return gray.astype(np.float32)
+
+    def blur(z):
+        return cv2.GaussianBlur(z, (11, 11), 1.5)
+
+    x, y = luma(a), luma(b)
+    mx, my = blur(x), blur(y)
+    sxx = blur(x * x) - mx * mx
+    syy = blur(y * y) - my * my
+    sxy = blur(x * y) - mx * my
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    num = (2 * mx * my + c1) * (2 * sxy + c2)
+    den = (mx * mx + my * my + c1) * (sxx + syy + c2)
+    return float(np.mean(num / den))
+
+
+def compare(ref, out, resized=False):
+    """{max_error, psnr, ssim} di out rispetto a ref; error se dimensioni o modo non tornano."""
+    if ref.mode != out.mode:
+        return {"error": f"modo {out.mode} invece di {ref.mode}"}
+    a, b = np.asarray(ref), np.asarray(out)
+    if resized and a.shape != b.shape:
+        a = cv2.resize(a, (b.shape[1], b.shape[0]), interpolation=cv2.INTER_AREA)
+    if a.shape != b.shape:
+        return {"error": f"dimensioni {out.size} invece di {ref.size}"}
+    if np.array_equal(a, b):
+        return {"max_error": 0, "psnr": math.inf, "ssim": 1.0}
+    diff = cv2.absdiff(a, b)
+    return {"max_error": int(diff.max()), "psnr": psnr(a, b), "ssim": ssim(a, b)}
+
+
+def violations(mode, metrics):
+    if "error" in metrics:
+        return [metrics["error"]]
+    out = []
+    if mode.max_error is not None and metrics["max_error"] > mode.max_error:
+        out.append(f"errore massimo {metrics['max_error']} > {mode.max_error}")
+    if mode.min_psnr is not None and metrics["psnr"] < mode.min_psnr:
+        out.append(f"PSNR {metrics['psnr']:.2f} < {mode.min_psnr}")
+    if mode.min_ssim is not None and metrics["ssim"] < mode.min_ssim:
+        out.append(f"SSIM {metrics['ssim']:.4f} < {mode.min_ssim}")
+    return out
+
+
+# --- record / check ---
+
+def versions():
+    return {"numpy": np.__version__, "pillow": PIL.__version__, "opencv": cv2.__version__}
+
+
+def _key(engine, design, t_name):
+    return f"{engine}/{os.path.basename(design)}/{t_name}"
+
+
+def _thumb_name(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".png"
+
+
+def record(ctx, golden_dir):
+    ddir = os.path.join(golden_dir, "designs")
+    if not os.path.isdir(ddir) or not os.listdir(ddir):
+        print("genero il corpus...", file=sys.stderr)
+        make_corpus(ddir)
+    tdir = os.path.join(golden_dir, "thumbs")
+    os.makedirs(tdir, exist_ok=True)
+    entries = {}
+    for engine in ENGINES:
+        mode = MODES[engine]
+        for path in corpus(ddir):
+            print(f"{engine}: {os.path.basename(path)}", file=sys.stderr)
+            state = mode.open(ctx, path)
+            for t_name in ctx.names:
+                out = mode.render(ctx, state, t_name)
+                if out is None:
+                    continue
+                key = _key(engine, path, t_name)
+                thumbnail(out).save(os.path.join(tdir, _thumb_name(key)))
+                entries[key] = {"sha1": fingerprint(out), "size": list(out.size), "mode": out.mode}
+    manifest = {"versions": versions(), "templates": ctx.names,
+                "designs": [os.path.basename(p) for p in corpus(ddir)], "entries": entries}
+    with open(os.path.join(golden_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f"{len(entries)} impronte in {golden_dir}", file=sys.stderr)
+    return 0
+
+
+def _drift(golden_dir, key, out):
+    """PSNR tra le miniature del golden e di out, quando l'impronta non coincide."""
+    try:
+        with Image.open(os.path.join(golden_dir, "thumbs", _thumb_name(key))) as g:
+            golden = np.asarray(g.convert(out.mode))
+    except OSError:
+        return None
+    live = np.asarray(thumbnail(out))
+    return round(psnr(golden, live), 2) if golden.shape == live.shape else None
+
+
+def check(ctx, golden_dir, mode_names):
+    try:
+        with open(os.path.join(golden_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        print(f"Nessun golden in {golden_dir}: esegui prima 'record'.", file=sys.stderr)
+        return None
+    if manifest["versions"] != versions():
+        print(f"attenzione: golden registrato con {manifest['versions']}, ora {versions()}", file=sys.stderr)
+    designs = corpus(os.path.join(golden_dir, "designs"))
+    report = {"versions": versions(), "golden": {}, "modes": {}}
+    engines = [e for e in ENGINES if e in mode_names or any(MODES[m].reference == e for m in mode_names)]
+    with tempfile.TemporaryDirectory() as scratch:
+        for engine in engines:
+            candidates = [m for m in mode_names if MODES[m].reference == engine]
+            golden, seconds, opens, results = _check_engine(ctx, golden_dir, manifest, designs, engine, candidates,
+                                                     scratch)
+            report["golden"][engine] = golden
+            ref_total = sum(seconds[engine]) + sum(opens[engine])
+            for name in [engine] + candidates:
+                total = sum(seconds[name]) + sum(opens[name])
+                entry = results.get(name, {})
+                entry.update({"reference": MODES[name].reference, "seconds": round(total, 3),
+                              "open": summarize(opens[name]), "render": summarize(seconds[name]),
+                              "speedup": round(ref_total / total, 2) if total else None})
+                report["modes"][name] = entry
+    return report
+
+
+def _check_engine(ctx, golden_dir, manifest, designs, engine, candidates, scratch):
+    """Riferimento di engine contro il golden e modi candidates contro il riferimento, design per design.
+
+    I riferimenti di un design restano in memoria mentre passano i modi: ogni
+    modo gira per intero nella sua sessione (per esempio lo store dei piani),
+    senza toccare i tempi del riferimento.
+    """
+    ref_mode = MODES[engine]
+    golden = {"identical": 0, "different": [], "new": [], "missing": []}
+    seconds = {name: [] for name in [engine] + candidates}  # render delle coppie
+    opens = {name: [] for name in [engine] + candidates}    # preparazione dei design
+    results = {name: {"pairs": 0, "identical": 0, "max_error": 0, "min_psnr": None, "min_ssim": None,
+                      "failures": []} for name in candidates}
+    ctx.warm()
+    for path in designs:
+        print(f"{engine}: {os.path.basename(path)}", file=sys.stderr)
+        refs = {}
+        state = _timed(opens[engine], lambda: ref_mode.open(ctx, path))
+        for t_name in ctx.names:
+            key = _key(engine, path, t_name)
+            ref = _timed(seconds[engine], lambda: ref_mode.render(ctx, state, t_name))
+            entry = manifest["entries"].get(key)
+            if ref is None:
+                if entry is not None:
+                    golden["missing"].append(key)
+                continue
+            refs[t_name] = ref
+            if entry is None:
+                golden["new"].append(key)
+            elif fingerprint(ref) == entry["sha1"]:
+                golden["identical"] += 1
+            else:
+                golden["different"].append({"key": key, "thumb_psnr": _drift(golden_dir, key, ref)})
+
+        for name in candidates:
+            mode, res = MODES[name], results[name]
+            with mode.session(scratch):
+                ctx.warm()
+                state = _timed(opens[name], lambda: mode.open(ctx, path))
+                for t_name, ref in refs.items():
+                    out = _timed(seconds[name], lambda: mode.render(ctx, state, t_name))
+                    metrics = compare(ref, out, mode.resized) if out is not None else {"error": "nessun risultato"}
+                    res["pairs"] += 1
+                    failed = violations(mode, metrics)
+                    if failed:
+                        res["failures"].append({"key": _key(engine, path, t_name), "problems": failed})
+                    if "error" in metrics:
+                        continue
+                    res["identical"] += metrics["max_error"] == 0
+                    res["max_error"] = max(res["max_error"], metrics["max_error"])
+                    # None: tutte identiche (PSNR infinito)
+                    if metrics["psnr"] != math.inf:
+                        res["min_psnr"] = min(res["min_psnr"] or math.inf, round(metrics["psnr"], 3))
+                    res["min_ssim"] = min(res["min_ssim"] or 1.0, round(metrics["ssim"], 5))
+            # una sessione può aver svuotato i piani: si ricostruiscono fuori dalle misure
+            ctx.warm()
+    return golden, seconds, opens, results
+
+
+def _timed(samples, fn):
+    start = time.perf_counter()
+    out = fn()
+    samples.append(time.perf_counter() - start)
+    return out
+
+
+def _fmt_db(value):
+    return "∞" if value is None else f"{value:.2f}"
+
+
+def print_report(report):
+    for engine, golden in report["golden"].items():
+        print(f"{engine}: {golden['identical']} identiche al golden, {len(golden['different'])} diverse, "
+              f"{len(golden['new'])} nuove, {len(golden['missing'])} mancanti")
+        for d in golden["different"][:10]:
+            print(f"  diversa: {d['key']} (PSNR miniature {d['thumb_psnr']})")
+        if len(golden["different"]) > 10:
+            print(f"  ... e altre {len(golden['different']) - 10}")
+    print(f"{'modo':<12} {'rif.':<6} {'coppie':>6} {'ident.':>6} {'err.max':>7} {'PSNR min':>9} {'SSIM min':>8} "
+          f"{'open ms':>8} {'p50 ms':>9} {'totale s':>9} {'speedup':>7}  esito")
+    for name, m in report["modes"].items():
+        if m["reference"] is None:
+            quality = f"{'':>6} {'':>6} {'':>7} {'':>9} {'':>8}"
+            verdict = "riferimento"
+        else:
+            quality = (f"{m['pairs']:>6} {m['identical']:>6} {m['max_error']:>7} {_fmt_db(m['min_psnr']):>9} "
+                       f"{m['min_ssim'] if m['min_ssim'] is not None else 1.0:>8.4f}")
+            verdict = "ok" if not m["failures"] else f"{len(m['failures'])} oltre soglia"
+        print(f"{name:<12} {m['reference'] or '':<6} {quality} {m['open']['mean_ms']:>8.1f} {m['render']['p50_ms']:>9.1f} {m['seconds']:>9.2f} "
+              f"{m['speedup']:>7.2f}  {verdict}")
+        for f in m.get("failures", [])[:5]:
+            print(f"  {f['key']}: {'; '.join(f['problems'])}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m benchmarks.golden")
+    p.add_argument("command", choices=("record", "check"))
+    p.add_argument("--golden", default=DEFAULT_DIR, help="cartella del golden (default golden/ nel repo)")
+    p.add_argument("--templates-dir", default=os.path.join(REPO_ROOT, "templates"))
+    p.add_argument("--coords", default=os.path.join(REPO_ROOT, "template_coordinates.json"))
+    p.add_argument("--mode", action="append", choices=list(MODES), dest="modes",
+                   help="modi da confrontare, ripetibile (default tutti)")
+    p.add_argument("--out", default=None, help="report JSON di check")
+    args = p.parse_args(argv)
+
+    ctx = Context(args.templates_dir, args.coords)
+    if not ctx.names:
+        print(f"Nessun template in {args.templates_dir}.", file=sys.stderr)
+        return 2
+    if args.command == "record":
+        os.makedirs(args.golden, exist_ok=True)
+        return record(ctx, args.golden)
+
+    report = check(ctx, args.golden, args.modes or list(MODES))
+    if report is None:
+        return 2
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    failed = any(m.get("failures") for m in report["modes"].values())
+    drifted = any(g["different"] or g["missing"] for g in report["golden"].values())
+    return 1 if failed or drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Implementazioni di riferimento congelate per benchmarks.golden.
+
+Copia dei motori del commit di partenza (composite_v3_fixed di app.py e
+process_mockup di calibratore_mockup.py): float64, a piena risoluzione,
+senza piani né cache. L'unica modifica è che le coordinate arrivano come
+argomento invece che dalla TEMPLATE_MAPS globale. Non va ottimizzato né
+allineato al motore: è il metro con cui si misurano tutti i percorsi veloci.
+Le coordinate a quattro angoli ("quad") non esistevano: quei template non
+hanno riferimento (None).
+"""
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+
+# --- V3 (app.py) ---
+
+def find_book_region(tmpl_gray, bg_val):
+    h, w = tmpl_gray.shape
+    book_mask = tmpl_gray > (bg_val + 3)
+    rows, cols = np.any(book_mask, axis=1), np.any(book_mask, axis=0)
+    if not rows.any() or not cols.any():
+        return None
+    by1, by2 = np.where(rows)[0][[0, -1]]
+    bx1, bx2 = np.where(cols)[0][[0, -1]]
+    mid_y = (by1 + by2) // 2
+    row = tmpl_gray[mid_y]
+    face_x1 = bx1
+    for x in range(bx1, bx2 - 5):
+        if np.all(row[x:x+5] >= 240):
+            face_x1 = x
+            break
+    return {
+        'book_x1': int(bx1), 'book_x2': int(bx2),
+        'book_y1': int(by1), 'book_y2': int(by2),
+        'face_x1': int(face_x1)
+    }
+
+
+def composite_v3_fixed(tmpl_pil, cover_pil, template_name="", maps=None, border_offset=None):
+    maps = maps or {}
+    if maps.get(template_name, {}).get("quad"):
+        return None
+    has_alpha = False
+    alpha_mask = None
+    if (tmpl_pil.mode in ('RGBA', 'LA') or
+            (tmpl_pil.mode == 'P' and 'transparency' in tmpl_pil.info) or
+            template_name.lower().endswith('.png')):
+        has_alpha = True
+        tmpl_pil = tmpl_pil.convert('RGBA')
+        alpha_mask = tmpl_pil.split()[3]
+
+    tmpl_rgb = tmpl_pil.convert('RGB')
+    h, w = tmpl_rgb.size[1], tmpl_rgb.size[0]
+
+    if template_name in maps:
+        d = maps[template_name]
+        px, py, pw, ph = d["coords"]
+        bo = border_offset if border_offset is not None else d.get("offset", 1)
+        x1, y1 = int((px * w) / 100) + bo, int((py * h) / 100) + bo
+        tw, th = int((pw * w) / 100) - (bo * 2), int((ph * h) / 100) - (bo * 2)
+        target_aspect = tw / th
+        cw, ch = cover_pil.size
+        if cw/ch > target_aspect:
+            nw = int(ch * target_aspect)
+            crop = ((cw - nw)//2, 0, (cw - nw)//2 + nw, ch)
+        else:
+            nh = int(cw / target_aspect)
+            crop = (0, (ch - nh)//2, cw, (ch - nh)//2 + nh)
+        c_res = cover_pil.crop(crop).resize((tw, th), Image.LANCZOS)
+        tmpl_l = np.array(tmpl_rgb.convert('L')).astype(np.float64)
+        shadows = np.clip(tmpl_l[y1:y1+th, x1:x1+tw] / 246.0, 0, 1.0)
+        c_array = np.array(c_res.convert('RGB')).astype(np.float64)
+        for i in range(3):
+            c_array[:,:,i] *= shadows
+        final_face = Image.fromarray(c_array.astype(np.uint8))
+        if c_res.mode == 'RGBA':
+            tmpl_rgb.paste(final_face, (x1, y1), c_res)
+        else:
+            tmpl_rgb.paste(final_face, (x1, y1))
+        if has_alpha:
+            tmpl_rgb.putalpha(alpha_mask)
+        return tmpl_rgb
+
+    tmpl_gray = np.array(tmpl_rgb.convert('L'))
+    corners = [tmpl_gray[3,3], tmpl_gray[3,w-3], tmpl_gray[h-3,3], tmpl_gray[h-3,w-3]]
+    bg_val = float(np.median(corners))
+    region = find_book_region(tmpl_gray, bg_val)
+    if region is None or (region['book_x2'] - region['book_x1'] > w * 0.95):
+        margin_x, margin_y = int(w * 0.2), int(h * 0.1)
+        bx1, bx2, by1, by2 = margin_x, w - margin_x, margin_y, h - margin_y
+    else:
+        bx1, bx2, by1, by2 = region['book_x1'], region['book_x2'], region['book_y1'], region['book_y2']
+
+    if "base_copertina" in template_name.lower():
+        bx1, bx2, by1, by2 = 0, w-1, 0, h-1
+        for x in range(w):
+            if np.any(tmpl_gray[:, x] < 250):
+                bx1 = x
+                break
+        for x in range(w-1, -1, -1):
+            if np.any(tmpl_gray[:, x] < 250):
+                bx2 = x
+                break
+        for y in range(h):
+            if np.any(tmpl_gray[y, :] < 250):
+                by1 = y
+                break
+        for y in range(h-1, -1, -1):
+            if np.any(tmpl_gray[y, :] < 250):
+                by2 = y
+                break
+
+    bx1, bx2 = max(0, bx1 - 2), min(w - 1, bx2 + 2)
+    by1, by2 = max(0, by1 - 2), min(h - 1, by2 + 2)
+    tw, th = bx2 - bx1 + 1, by2 - by1 + 1
+    c_res = cover_pil.resize((tw, th), Image.LANCZOS)
+    c_arr = np.array(c_res.convert('RGB')).astype(np.float64)
+    sh = np.clip(tmpl_gray[by1:by2+1, bx1:bx2+1] / 246.0, 0, 1.0)
+    for i in range(3):
+        c_arr[:,:,i] *= sh
+    final_face = Image.fromarray(c_arr.astype(np.uint8))
+    if c_res.mode == 'RGBA':
+        tmpl_rgb.paste(final_face, (bx1, by1), c_res)
+    else:
+        tmpl_rgb.paste(final_face, (bx1, by1))
+    if has_alpha:
+        tmpl_rgb.putalpha(alpha_mask)
+    return tmpl_rgb
+
+
+# --- V4 (calibratore_mockup.py) ---
+
+def get_feathered_mask(size, blur_radius):
+    """Crea una maschera con i bordi sfumati variabile."""
+    if blur_radius == 0:
+        return Image.new("L", size, 255)
+
+    mask = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(mask)
+    # Crea un piccolo rientro per permettere alla sfocatura di agire sui bordi esterni
+    draw.rectangle([0, 0, size[0], size[1]], outline=0, width=int(blur_radius/2) + 1)
+    return mask.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+
+
+def find_book_region_auto(tmpl_gray, bg_val):
+    h, w = tmpl_gray.shape
+    book_mask = tmpl_gray > (bg_val + 3)
+    rows = np.any(book_mask, axis=1)
+    cols = np.any(book_mask, axis=0)
+    if not rows.any() or not cols.any(): return None
+    by1, by2 = np.where(rows)[0][[0, -1]]
+    bx1, bx2 = np.where(cols)[0][[0, -1]]
+
+    margin = 30
+    face_area = tmpl_gray[by1+margin:by2-margin, bx1+margin:bx2-margin]
+    face_val = float(np.median(face_area)) if face_area.size > 0 else 246.0
+    return {'bx1': bx1, 'bx2': bx2, 'by1': by1, 'by2': by2, 'face_val': face_val}
+
+
+def process_mockup(tmpl_pil, cover_pil, t_name, blur_rad, maps=None):
+    maps = maps or {}
+    tmpl_rgb = np.array(tmpl_pil.convert('RGB')).astype(np.float64)
+    tmpl_gray = np.array(tmpl_pil.convert('L')).astype(np.float64)
+    h, w, _ = tmpl_rgb.shape
+    cover = cover_pil.convert('RGB')
+
+    if t_name in maps:
+        px, py, pw, ph = maps[t_name]
+        x1, y1 = int((px * w) / 100), int((py * h) / 100)
+        tw, th = int((pw * w) / 100), int((ph * h) / 100)
+        face_val = 255.0
+    else:
+        corners = [tmpl_gray[3,3], tmpl_gray[3,w-3], tmpl_gray[h-3,3], tmpl_gray[h-3,w-3]]
+        reg = find_book_region_auto(tmpl_gray, np.median(corners))
+        if not reg: return None
+        x1, y1 = reg['bx1'], reg['by1']
+        tw, th = reg['bx2'] - x1 + 1, reg['by2'] - y1 + 1
+        face_val = reg['face_val']
+
+    c_res = np.array(cover.resize((tw, th), Image.LANCZOS)).astype(np.float64)
+
+    # Applicazione sfumatura dinamica
+    feather_mask = get_feathered_mask((tw, th), blur_rad)
+    feather_alpha = np.array(feather_mask).astype(np.float64) / 255.0
+    feather_alpha = np.expand_dims(feather_alpha, axis=2)
+
+    shadow_map = np.clip(tmpl_gray[y1:y1+th, x1:x1+tw] / face_val, 0, 1.0)
+    shadow_map = np.expand_dims(shadow_map, axis=2)
+
+    target_area_orig = tmpl_rgb[y1:y1+th, x1:x1+tw]
+    cover_applied = c_res * shadow_map
+
+    blended_area = (cover_applied * feather_alpha) + (target_area_orig * (1 - feather_alpha))
+
+    result = tmpl_rgb.copy()
+    result[y1:y1+th, x1:x1+tw] = blended_area
+
+    return Image.fromarray(np.clip(result, 0, 255).astype(np.uint8))
@@ -0,0 +1,175 @@
+"""Test di carico dell'API HTTP locale (mockup_engine.server).
+
+    python -m benchmarks.load_render_api                          # server in processo
+    python -m benchmarks.load_render_api --url http://127.0.0.1:8502 --clients 8 --requests 200
+
+Senza --url avvia il server in questo processo su una porta libera, con i
+template di templates/ (o quelli sintetici di bench_engine con --synthetic).
+I client inviano lo stesso design sintetico in parallelo; il risultato riporta
+latenza lato client (percentili), throughput, risposte per status e le
+metriche del server (/metrics). Funziona offline.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+
+from benchmarks.bench_engine import REPO_ROOT, build_corpus, make_design, peak_rss_mb, summarize
+
+
+def make_design_bytes(size):
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "design.jpg")
+        make_design(path, size, np.random.default_rng(1234))
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=30) as r:
+        return json.load(r)
+
+
+def post(url, data, timeout):
+    """(status, secondi) di una richiesta; gli errori HTTP contano come risposte."""
+    req = urllib.request.Request(url, data=data, method="POST", headers={"Content-Type": "application/octet-stream"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0  # connessione rifiutata o timeout
+    return status, time.perf_counter() - start
+
+
+def run_load(base_url, templates, data, clients, requests, fmt, width, timeout):
+    query = f"templates={quote(','.join(templates))}&format={fmt}&name=load-test.jpg"
+    if width:
+        query += f"&width={width}"
+    url = f"{base_url}/render?{query}"
+    # una richiesta a vuoto: il primo decode non entra nelle misure
+    post(url, data, timeout)
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            status, seconds = post(url, data, timeout)
+            with lock:
+                results.append((status, seconds))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+    elapsed = time.perf_counter() - start
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [s for status, s in results if status == 200]
+    return {"clients": clients, "requests": len(results), "templates": len(templates), "format": fmt,
+            "width": width, "seconds": round(elapsed, 3), "status": statuses,
+            "latency_ok": summarize(ok) if ok else None,
+            "requests_per_s": round(len(ok) / elapsed, 2),
+            "images_per_s": round(len(ok) * len(templates) / elapsed, 2)}
+
+
+def start_local_server(templates_dir, coords, workers, max_queue):
+    from mockup_engine.server import RenderService, make_server
+
+    service = RenderService(templates_dir, coords, None, workers=workers, max_queue=max_queue)
+    start = time.perf_counter()
+    service.warm()
+    print(f"piani pronti in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    server = make_server(service, port=0, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, service, f"http://{host}:{port}"
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m benchmarks.load_render_api")
+    p.add_argument("--url", default=None, help="server già avviato (default: server in questo processo)")
+    p.add_argument("--clients", type=int, action="append", help="client concorrenti, ripetibile (default 1, 4, 16)")
+    p.add_argument("--requests", type=int, default=40, help="richieste per livello di concorrenza")
+    p.add_argument("--templates", type=int, default=4, help="template per richiesta")
+    p.add_argument("--format", choices=("json", "zip", "image"), default="json")
+    p.add_argument("--width", type=int, default=None, help="anteprime ridotte a questa larghezza")
+    p.add_argument("--design-size", default="3000x4000", help="LxA del design sintetico")
+    p.add_argument("--synthetic", action="store_true", help="template sintetici invece di templates/ (solo in processo)")
+    p.add_argument("--workers", type=int, default=2, help="worker del server in processo")
+    p.add_argument("--max-queue", type=int, default=8, help="coda del server in processo")
+    p.add_argument("--timeout", type=float, default=120.0)
+    p.add_argument("--out", default=None, help="file JSON con il risultato")
+    args = p.parse_args(argv)
+
+    w, h = (int(v) for v in args.design_size.lower().split("x"))
+    data = make_design_bytes((w, h))
+    server = service = None
+    tmp = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            if args.synthetic:
+                tmp = tempfile.TemporaryDirectory()
+                tdir, _, maps = build_corpus(tmp.name, True, False)
+                coords = os.path.join(tmp.name, "template_coordinates.json")
+                with open(coords, "w") as f:
+                    json.dump(maps, f)
+            else:
+                tdir = os.path.join(REPO_ROOT, "templates")
+                coords = os.path.join(REPO_ROOT, "template_coordinates.json")
+            server, service, base_url = start_local_server(tdir, coords, args.workers, args.max_queue)
+        available = [t["name"] for t in get_json(f"{base_url}/templates")["templates"]]
+        if not available:
+            print("Nessun template sul server.", file=sys.stderr)
+            return 2
+        templates = available[:1] if args.format == "image" else available[:args.templates]
+        report = {"url": base_url, "design": f"{w}x{h}", "design_kb": round(len(data) / 1024, 1), "runs": []}
+        for clients in args.clients or [1, 4, 16]:
+            print(f"{clients} client...", file=sys.stderr)
+            report["runs"].append(run_load(base_url, templates, data, clients, args.requests, args.format,
+                                           args.width, args.timeout))
+        report["server"] = get_json(f"{base_url}/metrics")
+        if server is not None:
+            report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            service.close()
+        if tmp is not None:
+            tmp.cleanup()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps({"runs": [{k: r[k] for k in ("clients", "status", "requests_per_s", "images_per_s")} |
+                                {"p50_ms": r["latency_ok"] and r["latency_ok"]["p50_ms"],
+                                 "p99_ms": r["latency_ok"] and r["latency_ok"]["p99_ms"]}
+                                for r in report["runs"]],
+                      "server": {k: report["server"][k] for k in ("requests", "latency_ms", "throughput")}},
+                     indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
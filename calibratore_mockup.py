@@ -1,10 +1,18 @@
 import streamlit as st
-import numpy as np
-from PIL import Image, ImageFilter, ImageDraw
+from PIL import Image
 import os
 import io
+import hashlib
 import zipfile
 
+from mockup_engine import plans
+from mockup_engine.output import open_sink
+from mockup_engine.ingest import DesignError
+from mockup_engine.resample import DesignSource, open_proxy
+from mockup_engine.results import ResultCache, map_params, result_key
+from mockup_engine.soft import face_sizes, feather_face, prepare_face, process_mockup
+from mockup_engine.store import default_root
+
 # --- 1. CONFIGURAZIONE E COORDINATE DEFINITIVE ---
 st.set_page_config(page_title="PhotoBook V4.4 - Interactive Soft Edges", layout="wide")
 
@@ -21,19 +29,17 @@ TEMPLATE_MAPS = {
     "base_quadrata_temi_app.jpg": (27.8, 10.8, 44.5, 79.0),
 }
 
-# --- 2. FUNZIONE PER SFUMARE I BORDI (DINAMICA) ---
-def get_feathered_mask(size, blur_radius):
-    """Crea una maschera con i bordi sfumati variabile."""
-    if blur_radius == 0:
-        return Image.new("L", size, 255)
-    
-    mask = Image.new("L", size, 255)
-    draw = ImageDraw.Draw(mask)
-    # Crea un piccolo rientro per permettere alla sfocatura di agire sui bordi esterni
-    draw.rectangle([0, 0, size[0], size[1]], outline=0, width=int(blur_radius/2) + 1)
-    return mask.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+# Larghezza dell'anteprima real-time (px)
+PREVIEW_WIDTH = 1000
+
+# Piani dei template su disco, condivisi con app.py
+plans.use_store(default_root("templates"))
 
-# --- 3. LOGICA DI SMISTAMENTO ---
+# File già generati, condivisi con app.py: la chiave include il raggio della sfumatura
+RESULT_CACHE_PATH = ".result_cache"
+RESULT_ENCODER = ("JPEG", 95)
+
+# --- 2. LOGICA DI SMISTAMENTO ---
 def get_manual_cat(filename):
     fn = filename.lower()
     if any(x in fn for x in ["verticale", "bottom", "15x22", "20x30"]): return "Verticali"
@@ -41,61 +47,7 @@ def get_manual_cat(filename):
     if any(x in fn for x in ["quadrata", "20x20", "30x30"]): return "Quadrati"
     return "Altro"
 
-# --- 4. MOTORE DI COMPOSIZIONE IBRIDO ---
-def find_book_region_auto(tmpl_gray, bg_val):
-    h, w = tmpl_gray.shape
-    book_mask = tmpl_gray > (bg_val + 3)
-    rows = np.any(book_mask, axis=1)
-    cols = np.any(book_mask, axis=0)
-    if not rows.any() or not cols.any(): return None
-    by1, by2 = np.where(rows)[0][[0, -1]]
-    bx1, bx2 = np.where(cols)[0][[0, -1]]
-    
-    margin = 30
-    face_area = tmpl_gray[by1+margin:by2-margin, bx1+margin:bx2-margin]
-    face_val = float(np.median(face_area)) if face_area.size > 0 else 246.0
-    return {'bx1': bx1, 'bx2': bx2, 'by1': by1, 'by2': by2, 'face_val': face_val}
-
-def process_mockup(tmpl_pil, cover_pil, t_name, blur_rad):
-    tmpl_rgb = np.array(tmpl_pil.convert('RGB')).astype(np.float64)
-    tmpl_gray = np.array(tmpl_pil.convert('L')).astype(np.float64)
-    h, w, _ = tmpl_rgb.shape
-    cover = cover_pil.convert('RGB')
-
-    if t_name in TEMPLATE_MAPS:
-        px, py, pw, ph = TEMPLATE_MAPS[t_name]
-        x1, y1 = int((px * w) / 100), int((py * h) / 100)
-        tw, th = int((pw * w) / 100), int((ph * h) / 100)
-        face_val = 255.0
-    else:
-        corners = [tmpl_gray[3,3], tmpl_gray[3,w-3], tmpl_gray[h-3,3], tmpl_gray[h-3,w-3]]
-        reg = find_book_region_auto(tmpl_gray, np.median(corners))
-        if not reg: return None
-        x1, y1 = reg['bx1'], reg['by1']
-        tw, th = reg['bx2'] - x1 + 1, reg['by2'] - y1 + 1
-        face_val = reg['face_val']
-
-    c_res = np.array(cover.resize((tw, th), Image.LANCZOS)).astype(np.float64)
-    
-    # Applicazione sfumatura dinamica
-    feather_mask = get_feathered_mask((tw, th), blur_rad)
-    feather_alpha = np.array(feather_mask).astype(np.float64) / 255.0
-    feather_alpha = np.expand_dims(feather_alpha, axis=2)
-
-    shadow_map = np.clip(tmpl_gray[y1:y1+th, x1:x1+tw] / face_val, 0, 1.0)
-    shadow_map = np.expand_dims(shadow_map, axis=2)
-
-    target_area_orig = tmpl_rgb[y1:y1+th, x1:x1+tw]
-    cover_applied = c_res * shadow_map
-    
-    blended_area = (cover_applied * feather_alpha) + (target_area_orig * (1 - feather_alpha))
-    
-    result = tmpl_rgb.copy()
-    result[y1:y1+th, x1:x1+tw] = blended_area
-    
-    return Image.fromarray(np.clip(result, 0, 255).astype(np.uint8))
-
-# --- 5. INTERFACCIA STREAMLIT ---
+# --- 4. INTERFACCIA STREAMLIT ---
 st.title("📖 PhotoBook Production - V4.4 (Preview Sfumatura)")
 
 @st.cache_data
@@ -139,28 +91,61 @@ with col_up:
 
 if disegni and libreria[categoria]:
     if st.button("🚀 GENERA E SCARICA ZIP"):
-        zip_io = io.BytesIO()
-        with zipfile.ZipFile(zip_io, "a") as zf:
+        if st.session_state.get('zip_sink') is not None:
+            st.session_state.zip_sink.discard()
+        sink = open_sink("zip", compression=zipfile.ZIP_STORED)
+        cache = ResultCache(RESULT_CACHE_PATH)
+        with sink:
             bar = st.progress(0)
             target_list = libreria[categoria]
             total_ops = len(disegni) * len(target_list)
-            curr = 0
-            for d_file in disegni:
-                d_img = Image.open(d_file)
+            faces = face_sizes(target_list, TEMPLATE_MAPS)
+            for d_idx, d_file in enumerate(disegni):
+                d_digest = hashlib.sha1(d_file.getbuffer()).hexdigest()
+                # decodificato solo se serve, una volta, alla scala della faccia più grande; V4 non usa l'alpha
+                source = DesignSource(d_file, d_file.name, faces.values(), mode='RGB')
                 d_name = os.path.splitext(d_file.name)[0]
-                for t_name, t_img in target_list.items():
-                    res = process_mockup(t_img, d_img, t_name, sfumatura)
-                    if res:
-                        buf = io.BytesIO()
-                        res.save(buf, format='JPEG', quality=95)
-                        zf.writestr(f"{d_name}/{t_name}.jpg", buf.getvalue())
-                    curr += 1
-                    bar.progress(curr / total_ops)
-        st.download_button("📥 SCARICA ZIP", zip_io.getvalue(), f"Mockups_Sfumati_{sfumatura}.zip")
+                try:
+                    for t_idx, (t_name, t_img) in enumerate(target_list.items(), 1):
+                        t_digest = plans.template_hash(t_img)
+                        key = t_digest and result_key(d_digest, t_digest, ("v4", map_params(TEMPLATE_MAPS, t_name),
+                                                                           sfumatura, source.size), RESULT_ENCODER)
+                        data = cache.read(key, ".jpg") if key and cache.find(key) else None
+                        if data is None and t_name in faces:
+                            resampler = source.resampler()
+                            res = process_mockup(t_img, resampler.image, t_name, sfumatura, resampler,
+                                                 maps=TEMPLATE_MAPS)
+                            if res:
+                                buf = io.BytesIO()
+                                res.save(buf, format='JPEG', quality=95)
+                                data = buf.getvalue()
+                                if key:
+                                    cache.put(key, ".jpg", data)
+                        if data is not None:
+                            sink.add(f"{d_name}/{t_name}.jpg", data)
+                        bar.progress((d_idx * len(target_list) + t_idx) / total_ops)
+                except DesignError as e:
+                    st.error(f"❌ {e}")
+        st.session_state.zip_sink = sink
+        st.caption(f"♻️ Dalla cache: {cache.hits} · generati: {cache.misses}")
+        st.download_button("📥 SCARICA ZIP", sink.reader(), f"Mockups_Sfumati_{sfumatura}.zip", on_click="ignore")
 
     # --- ANTEPRIMA REAL-TIME ---
     st.divider()
     st.subheader(f"👁️ Anteprima Real-Time (Sfumatura: {sfumatura}px)")
     t_preview_name = list(libreria[categoria].keys())[0]
-    preview = process_mockup(libreria[categoria][t_preview_name], Image.open(disegni[-1]), t_preview_name, sfumatura)
-    st.image(preview, use_column_width=True)
+    # resize e ombre restano in sessione per la coppia (design, template):
+    # muovendo lo slider si ricalcola solo la sfumatura, sul proxy
+    preview_key = (disegni[-1].file_id, t_preview_name)
+    cached = st.session_state.get('preview_face')
+    if cached is None or cached[0] != preview_key:
+        try:
+            d_proxy = open_proxy(disegni[-1], PREVIEW_WIDTH)
+            face = prepare_face(libreria[categoria][t_preview_name], d_proxy, t_preview_name,
+                                maps=TEMPLATE_MAPS, proxy_width=PREVIEW_WIDTH)
+        except DesignError as e:
+            st.error(f"❌ {e}")
+            face = None
+        cached = st.session_state.preview_face = (preview_key, face)
+    if cached[1] is not None:
+        st.image(feather_face(cached[1], sfumatura), use_column_width=True)
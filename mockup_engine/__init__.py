@@ -0,0 +1,35 @@
+"""Motore di composizione dei mockup condiviso da app.py e calibratore_mockup.py.
+
+L'import del pacchetto non carica numpy, Pillow né OpenCV e non ha effetti
+collaterali: i sottomoduli vengono importati alla prima richiesta.
+
+    from mockup_engine import composite_v3_fixed
+"""
+import importlib
+
+_EXPORTS = {
+    "composite_v3_fixed": "mockup_engine.compositor",
+    "process_mockup": "mockup_engine.soft",
+    "render_batch": "mockup_engine.batch",
+    "JobManager": "mockup_engine.jobs",
+    "RenderService": "mockup_engine.server",
+    "open_sink": "mockup_engine.output",
+    "EncoderSettings": "mockup_engine.encode",
+    "CoverResampler": "mockup_engine.resample",
+    "open_design": "mockup_engine.ingest",
+    "StageTimer": "mockup_engine.timing",
+    "TemplateLibrary": "mockup_engine.catalog",
+    "get_manual_cat": "mockup_engine.library",
+    "list_templates": "mockup_engine.library",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'mockup_engine' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
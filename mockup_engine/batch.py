@@ -0,0 +1,362 @@
+"""Batch "GENERA TUTTI": rendering e codifica delle coppie (design, template) in parallelo."""
+import contextlib
+import contextvars
+import importlib.machinery
+import multiprocessing as mp
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image
+
+from mockup_engine import plans, timing
+from mockup_engine.compositor import composite_v3_fixed, face_sizes
+from mockup_engine.coords import AutoRegions
+from mockup_engine.encode import DEFAULT_SETTINGS, encode_result
+from mockup_engine.ingest import DEFAULT_LIMITS, DesignError, check_design
+from mockup_engine.resample import DesignSource
+from mockup_engine.results import map_params, result_key
+
+DEFAULT_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+
+# Thread di codifica nel batch senza processi: zlib, libjpeg e libwebp
+# rilasciano il GIL, quindi l'encode di una coppia procede durante il composite della successiva
+ENCODE_THREADS = 2
+
+# Stato del processo worker: template e coordinate arrivano una sola volta
+# dall'initializer, i task portano solo i nomi.
+_worker = {}
+
+
+def design_base_name(filename):
+    base_name = os.path.splitext(filename)[0]
+    if base_name.lower().endswith('.png'):
+        base_name = base_name[:-4]
+    return base_name
+
+
+def output_name(t_name, base_name, ext):
+    """Percorso nello ZIP: <design>/<formato>-<design>.<ext>."""
+    t_clean = os.path.splitext(t_name)[0]
+    if t_clean.lower().endswith('.png'):
+        t_clean = t_clean[:-4]
+    formato = t_clean.split('-')[0] if '-' in t_clean else t_clean
+    return f"{base_name}/{formato}-{base_name}{ext}"
+
+
+def _init_worker(template_paths, maps, auto_path=None, timed=False, encoder=DEFAULT_SETTINGS, store_root=None,
+                 limits=DEFAULT_LIMITS):
+    # con i piani su disco il worker mappa base e ombre senza decodificare i template
+    if store_root is not None:
+        plans.use_store(store_root)
+    _worker['templates'] = {name: Image.open(path) for name, path in template_paths.items()}
+    _worker['timed'] = timed
+    _worker['encoder'] = encoder
+    _worker['maps'] = maps
+    _worker['auto'] = AutoRegions(auto_path) if auto_path else None
+    _worker['limits'] = limits
+    _worker['design'] = (None, None)
+    _worker['faces'] = None
+
+
+def _batch_faces(template_paths, maps, auto_path):
+    """Facce di tutti i template del batch, dai piani (i template si aprono solo per l'header)."""
+    templates = {name: Image.open(path) for name, path in template_paths.items()}
+    try:
+        return list(face_sizes(templates, maps, AutoRegions(auto_path) if auto_path else None).values())
+    finally:
+        for tmpl in templates.values():
+            tmpl.close()
+
+
+def _worker_faces():
+    if _worker['faces'] is None:
+        with timing.stage("plan"):
+            _worker['faces'] = list(face_sizes(_worker['templates'], _worker['maps'], _worker['auto']).values())
+    return _worker['faces']
+
+
+def _open_design(path, base_name):
+    # I task sono ordinati per design: si tiene aperto solo l'ultimo, con i
+    # suoi resize già calcolati. Si decodifica una volta, alla scala della
+    # faccia più grande del batch. Un design illeggibile resta segnato: le sue
+    # altre coppie falliscono subito, senza rileggere il file.
+    cur_path, source = _worker['design']
+    if cur_path != path:
+        source = DesignSource(path, base_name, _worker_faces(), _worker['limits'])
+        _worker['design'] = (path, source)
+    if isinstance(source, DesignError):
+        raise source.with_traceback(None)
+    try:
+        with timing.stage("decode"):
+            return source.resampler()
+    except DesignError as e:
+        _worker['design'] = (path, e)
+        raise
+
+
+def _composite(design_path, base_name, t_name):
+    resampler = _open_design(design_path, base_name)
+    return composite_v3_fixed(_worker['templates'][t_name], resampler.image, t_name,
+                              maps=_worker['maps'], resampler=resampler, auto=_worker['auto'])
+
+
+def _encode(res, base_name, t_name):
+    ext, data = encode_result(res, t_name, _worker['encoder'])
+    return output_name(t_name, base_name, ext), data
+
+
+def _active(timer, task):
+    if timer is None:
+        return contextlib.nullcontext()
+    return timer.active(f"{task[1]} × {task[2]}")
+
+
+def _render_task(task):
+    """(nome_nel_zip, bytes, errore, tempi) per una coppia; i tempi tornano al processo principale.
+
+    Con un design illeggibile (DesignError) nome e bytes sono None ed errore è il messaggio.
+    """
+    design_path, base_name, t_name = task
+    timer = timing.StageTimer() if _worker['timed'] else None
+    try:
+        with _active(timer, task):
+            arcname, data = _encode(_composite(design_path, base_name, t_name), base_name, t_name)
+    except DesignError as e:
+        return None, None, str(e), timer.export() if timer else None
+    return arcname, data, None, timer.export() if timer else None
+
+
+def _render_pipelined(tasks, timer):
+    """Composite nel thread corrente, encode su ENCODE_THREADS thread; stesso ordine dei task."""
+    with ThreadPoolExecutor(ENCODE_THREADS) as pool:
+        window = deque()
+        for task in tasks:
+            design_path, base_name, t_name = task
+            try:
+                with _active(timer, task):
+                    res = _composite(design_path, base_name, t_name)
+                    # il contesto porta al thread il timer e l'etichetta della coppia
+                    ctx = contextvars.copy_context()
+            except DesignError as e:
+                window.append(str(e))
+            else:
+                window.append(pool.submit(ctx.run, _encode, res, base_name, t_name))
+            if len(window) > ENCODE_THREADS:
+                yield _pipelined_result(window.popleft())
+        while window:
+            yield _pipelined_result(window.popleft())
+
+
+def _pipelined_result(item):
+    # nella finestra un design illeggibile occupa il posto della coppia con il suo messaggio
+    if isinstance(item, str):
+        return None, None, item
+    arcname, data = item.result()
+    return arcname, data, None
+
+
+def _collect(result, timer):
+    arcname, data, error, stats = result
+    if stats is not None:
+        timer.merge(stats)
+    return arcname, data, error
+
+
+def _pool_context():
+    # "fork" copia solo il thread chiamante: i lock tenuti in quel momento da
+    # altri thread (server di Streamlit, JobManager, encode) restano chiusi per
+    # sempre nel figlio. Si usa quindi solo da un processo con un solo thread
+    # (la CLI); altrimenti "forkserver", o "spawn" dove non c'è, con i processi
+    # di _WORKER_PROCESSES: i worker non rieseguono il __main__ del chiamante.
+    if sys.platform.startswith('linux') and threading.active_count() == 1:
+        return mp.get_context('fork')
+    if 'forkserver' in mp.get_all_start_methods():
+        ctx = _WorkerContext('forkserver')
+        # il forkserver carica il motore una volta; i worker partono già con numpy e OpenCV
+        ctx.set_forkserver_preload(['mockup_engine.batch'])
+        return ctx
+    return _WorkerContext('spawn')
+
+
+_main_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _engine_main():
+    # forkserver e spawn preparano ogni worker rieseguendo il __main__ del
+    # chiamante se ha un __file__ ma nessuno spec: sotto Streamlit è lo script
+    # dell'app. Ai worker basta questo modulo: mentre il processo parte il
+    # __main__ ha uno spec "__main__", che multiprocessing non reimporta.
+    main = sys.modules.get('__main__')
+    if main is None or getattr(main, '__spec__', None) is not None:
+        yield
+        return
+    with _main_lock:
+        main.__spec__ = importlib.machinery.ModuleSpec('__main__', None)
+        try:
+            yield
+        finally:
+            main.__spec__ = None
+
+
+class _SpawnWorker(mp.context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        with _engine_main():
+            return mp.context.SpawnProcess._Popen(process_obj)
+
+
+_WORKER_PROCESSES = {'spawn': _SpawnWorker}
+
+if hasattr(mp.context, 'ForkServerProcess'):
+    class _ForkServerWorker(mp.context.ForkServerProcess):
+        @staticmethod
+        def _Popen(process_obj):
+            with _engine_main():
+                return mp.context.ForkServerProcess._Popen(process_obj)
+
+    _WORKER_PROCESSES['forkserver'] = _ForkServerWorker
+
+
+class _WorkerContext(mp.context.BaseContext):
+    """Contesto "forkserver" o "spawn" i cui processi partono con _engine_main."""
+
+    def __init__(self, method):
+        self._name = method
+        self.Process = _WORKER_PROCESSES[method]
+
+
+def render_batch(designs, template_paths, maps, workers=None, auto_path=None, timer=None,
+                 encoder=DEFAULT_SETTINGS, skip=(), cache=None, limits=DEFAULT_LIMITS, errors=None):
+    """Genera (nome_nel_zip, bytes) per ogni coppia, nello stesso ordine del loop sequenziale.
+
+    designs è una lista di (path, nome_file_originale), template_paths un dict
+    {nome_template: path}; auto_path è il file dei box rilevati in automatico
+    (AutoRegions) condiviso con l'app. Con workers > 1 usa un pool di processi limitato:
+    al più 2 task in volo per worker, così la memoria non cresce con il batch.
+    Con timer (timing.StageTimer) vi si sommano i tempi per stadio di ogni coppia;
+    encoder (encode.EncoderSettings) sceglie formato e parametri dei file.
+    Con un solo worker la codifica gira su thread in parallelo al composite.
+    I worker usano lo stesso store dei piani su disco del processo chiamante (plans.use_store).
+    skip contiene gli indici (nell'ordine design × template) delle coppie da saltare.
+    Con cache (results.ResultCache) le coppie già generate con gli stessi
+    parametri escono dalla cache; solo le altre vengono renderizzate e poi salvate.
+    Ogni design è decodificato una volta, alla scala utile per la faccia più
+    grande del batch (ingest). Un design illeggibile o oltre il budget di
+    limits (ingest.DesignLimits) non ferma il batch se c'è errors (una lista):
+    vi si aggiunge il messaggio della DesignError, una volta per design, e le
+    sue coppie si saltano. Senza errors il batch si ferma con DesignError.
+    """
+    for _, arcname, data in render_pairs(designs, template_paths, maps, workers, auto_path, timer, encoder,
+                                         skip, cache, limits, errors):
+        yield arcname, data
+
+
+def render_pairs(designs, template_paths, maps, workers=None, auto_path=None, timer=None,
+                 encoder=DEFAULT_SETTINGS, skip=(), cache=None, limits=DEFAULT_LIMITS, errors=None):
+    """Come render_batch, ma genera (indice, nome_nel_zip, bytes): indice è la
+    posizione della coppia nell'ordine design × template, anche quando si saltano
+    coppie (skip, design illeggibili)."""
+    tasks = [(path, design_base_name(filename), t_name)
+             for path, filename in designs for t_name in template_paths]
+    indices = [i for i in range(len(tasks)) if i not in skip]
+    tasks = [tasks[i] for i in indices]
+    failed = set()
+
+    def fail(design_path, message):
+        if design_path in failed:
+            return
+        if errors is None:
+            raise DesignError(message)
+        failed.add(design_path)
+        errors.append(message)
+
+    if cache is None:
+        rendered = _render_tasks(tasks, template_paths, maps, workers, auto_path, timer, encoder, limits)
+        try:
+            for i, task, (arcname, data, error) in zip(indices, tasks, rendered):
+                if error is not None:
+                    fail(task[0], error)
+                    continue
+                yield i, arcname, data
+        finally:
+            rendered.close()
+        return
+
+    # lookup nel processo principale: ai worker arrivano solo le coppie mancanti;
+    # i file trovati si leggono solo al momento di restituirli. La scala di
+    # decodifica dipende dalle facce di tutto il batch: entra nella chiave come
+    # dimensione del design decodificato, letta dall'header.
+    faces = _batch_faces(template_paths, maps, auto_path)
+    sizes = {}
+    keys, found = [], []
+    for design_path, base_name, t_name in tasks:
+        if design_path not in sizes:
+            try:
+                sizes[design_path] = check_design(design_path, base_name, faces, limits)[0]
+            except DesignError as e:
+                sizes[design_path] = None
+                fail(design_path, str(e))
+        size = sizes[design_path]
+        if size is None:
+            keys.append(None)
+            found.append(None)
+            continue
+        key = result_key(plans.file_hash(design_path), plans.file_hash(template_paths[t_name]),
+                         ("v3", map_params(maps, t_name), size), encoder)
+        keys.append(key)
+        found.append(cache.find(key))
+    missing = [task for task, key, ext in zip(tasks, keys, found) if key is not None and ext is None]
+    rendered = _render_tasks(missing, template_paths, maps, workers, auto_path, timer, encoder, limits)
+    try:
+        for i, task, key, ext in zip(indices, tasks, keys, found):
+            if key is None:
+                continue
+            data = cache.read(key, ext) if ext is not None else None
+            if data is not None:
+                yield i, output_name(task[2], task[1], ext), data
+                continue
+            if ext is None:
+                arcname, data, error = next(rendered)
+            else:
+                # eliminato dalla cache dopo il lookup: si rigenera qui
+                arcname, data, error = next(_render_tasks([task], template_paths, maps, 1, auto_path, timer,
+                                                          encoder, limits))
+            if error is not None:
+                fail(task[0], error)
+                continue
+            cache.put(key, os.path.splitext(arcname)[1], data)
+            yield i, arcname, data
+    finally:
+        # un batch interrotto chiude subito anche il pool
+        rendered.close()
+
+
+def _render_tasks(tasks, template_paths, maps, workers, auto_path, timer, encoder, limits):
+    if not tasks:
+        return
+    workers = min(workers or DEFAULT_WORKERS, len(tasks))
+    timed = timer is not None
+    if workers <= 1:
+        _init_worker(template_paths, maps, auto_path, timed, encoder, limits=limits)
+        yield from _render_pipelined(tasks, timer)
+        return
+
+    with ProcessPoolExecutor(workers, mp_context=_pool_context(), initializer=_init_worker,
+                             initargs=(template_paths, maps, auto_path, timed, encoder, plans.store_root(),
+                                       limits)) as ex:
+        pending = iter(tasks)
+        window = deque()
+        for task in pending:
+            window.append(ex.submit(_render_task, task))
+            if len(window) >= workers * 2:
+                break
+        while window:
+            result = window.popleft().result()
+            for task in pending:
+                window.append(ex.submit(_render_task, task))
+                break
+            yield _collect(result, timer)
@@ -0,0 +1,33 @@
+"""Kernel di fusione condivisi dai motori V3 e V4.
+
+Lavorano su uint8 con pesi float32 tramite OpenCV: niente upcast a float64,
+niente loop Python sui canali. Rispetto al vecchio calcolo in float64 i
+risultati differiscono al massimo di ±1 livello (arrotondamento invece di
+troncamento).
+"""
+import cv2
+import numpy as np
+
+
+def shade(cover, shadow, out=None):
+    """Moltiplica ogni canale di cover (uint8, th×tw×C) per le ombre in un solo passaggio.
+
+    shadow è float32 th×tw×C (TemplatePlan.shadow_rgb, già ripetuta sui
+    canali) oppure th×tw, che qui va ripetuta a ogni chiamata. out può essere
+    lo stesso array di cover o un buffer preallocato della stessa forma.
+    """
+    if out is None:
+        out = np.empty_like(cover)
+    if shadow.ndim == 2:
+        shadow = cv2.merge([shadow] * cover.shape[2])
+    cv2.multiply(cover, shadow, dst=out, dtype=cv2.CV_8U)
+    return out
+
+
+def feather(face, base, weights, out=None):
+    """out = face * weights + base * (1 - weights); weights float32 th×tw in [0, 1]."""
+    if out is None:
+        out = np.empty_like(face)
+    inv = np.subtract(np.float32(1.0), weights, dtype=np.float32)
+    cv2.blendLinear(face, base, weights, inv, dst=out)
+    return out
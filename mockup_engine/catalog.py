@@ -0,0 +1,142 @@
+"""Indice dei template e cache delle immagini decodificate.
+
+L'indice contiene solo metadati letti dall'header (dimensioni, modo, hash);
+i pixel vengono decodificati alla prima richiesta in una cache LRU condivisa
+dal processo, con un limite in byte. Le immagini in cache sono condivise:
+chi le usa non deve modificarle (convert/copy creano nuovi oggetti).
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from PIL import Image
+
+from mockup_engine.library import CATEGORIES, TEMPLATE_EXTS, get_manual_cat
+from mockup_engine.plans import file_hash
+
+DEFAULT_BUDGET = 512 * 1024 * 1024
+THUMB_WIDTH = 400
+
+
+@dataclass(frozen=True)
+class TemplateInfo:
+    name: str
+    category: str
+    path: str
+    size: tuple   # (w, h)
+    mode: str
+    digest: str   # sha1 del file
+
+    @property
+    def nbytes(self):
+        """Memoria dell'immagine decodificata (Pillow tiene i modi a più bande a 4 byte per pixel)."""
+        return self.size[0] * self.size[1] * (1 if self.mode in ("1", "L", "P") else 4)
+
+
+class TemplateLibrary:
+    """Indice della cartella dei template più cache LRU (budget in byte) dei decodificati."""
+
+    def __init__(self, folder="templates", budget=DEFAULT_BUDGET):
+        self.folder = folder
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._infos = {}      # (nome, mtime_ns, size) -> TemplateInfo
+        self._by_name = {}
+        self._images = OrderedDict()  # chiave -> (immagine, byte)
+        self._lock = threading.Lock()
+
+    def index(self):
+        """{categoria: {nome: TemplateInfo}}, in ordine di nome; rilegge solo i file cambiati."""
+        lib = {cat: {} for cat in CATEGORIES}
+        if not os.path.exists(self.folder):
+            return lib
+        infos = {}
+        for entry in sorted(os.scandir(self.folder), key=lambda e: e.name):
+            if not entry.is_file() or not entry.name.lower().endswith(TEMPLATE_EXTS):
+                continue
+            st = entry.stat()
+            key = (entry.name, st.st_mtime_ns, st.st_size)
+            info = self._infos.get(key)
+            if info is None:
+                info = self._read_info(entry.name, entry.path)
+                if info is None:
+                    continue
+            infos[key] = info
+            lib[info.category][info.name] = info
+        with self._lock:
+            self._infos = infos
+            self._by_name = {info.name: info for info in infos.values()}
+        return lib
+
+    def info(self, name):
+        """TemplateInfo dall'ultimo index(), None se il template non c'è."""
+        return self._by_name.get(name)
+
+    def image(self, info):
+        """Template decodificato (immagine condivisa, da non modificare)."""
+        return self._cached((info.digest, None), info.nbytes, lambda: self._decode(info))
+
+    def thumbnail(self, info, width=THUMB_WIDTH):
+        """Versione ridotta per le gallerie, anch'essa in cache."""
+        w, h = info.size
+        th = max(1, round(h * width / w))
+        return self._cached((info.digest, width), width * th * 4, lambda: self._decode_thumb(info, width))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._images), "bytes": self.used, "budget": self.budget,
+                    "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.used = 0
+
+    def _cached(self, key, nbytes, load):
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        img = load()
+        if nbytes > self.budget:
+            return img
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = (img, nbytes)
+                self.used += nbytes
+            while self.used > self.budget:
+                _, (_, freed) = self._images.popitem(last=False)
+                self.used -= freed
+        return img
+
+    def _read_info(self, name, path):
+        try:
+            with Image.open(path) as img:
+                size, mode = img.size, img.mode
+        except OSError:
+            return None
+        return TemplateInfo(name, get_manual_cat(name), path, size, mode, file_hash(path))
+
+    @staticmethod
+    def _decode(info):
+        # Image.open + load: l'immagine conserva filename, da cui i piani ricavano l'hash
+        img = Image.open(info.path)
+        img.load()
+        return img
+
+    @staticmethod
+    def _decode_thumb(info, width):
+        with Image.open(info.path) as img:
+            img.draft('RGB', (width, width * img.size[1] // img.size[0]))
+            if img.mode in ('1', 'P'):
+                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            # copia senza filename: una miniatura non va scambiata per il template
+            thumb = img.copy() if img.mode in ('RGB', 'RGBA', 'L', 'LA') else img.convert('RGB')
+        thumb.thumbnail((width, thumb.size[1]), Image.LANCZOS)
+        return thumb
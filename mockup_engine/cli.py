@@ -0,0 +1,132 @@
+"""Batch da riga di comando, senza Streamlit.
+
+    python -m mockup_engine designs/ --category Verticali --out mockups.zip --workers 8
+
+L'uscita può essere un .zip, un .tar, "-" (tar su stdout) o una cartella.
+"""
+import argparse
+import json
+import os
+import sys
+
+from mockup_engine.encode import SUBSAMPLING, EncoderSettings
+
+DESIGN_EXTS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp')
+
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="python -m mockup_engine", description="Genera i mockup di un batch di design.")
+    p.add_argument("designs", help="cartella con i design")
+    which = p.add_mutually_exclusive_group(required=True)
+    which.add_argument("--category", help="categoria di template (Verticali, Orizzontali, Quadrati, Altro)")
+    which.add_argument("--template", action="append", dest="templates", metavar="NOME",
+                       help="template da usare, ripetibile")
+    p.add_argument("--out", required=True, help="file .zip/.tar, '-' per tar su stdout, oppure cartella")
+    p.add_argument("--workers", type=int, default=None, help="processi di rendering (default: CPU disponibili)")
+    p.add_argument("--templates-dir", default="templates")
+    p.add_argument("--coords", default="template_coordinates.json", help="coordinate calibrate dei template")
+    p.add_argument("--plan-cache", default=None, metavar="DIR",
+                   help="piani dei template su disco (default: .template_cache accanto a --templates-dir)")
+    p.add_argument("--no-plan-cache", action="store_true", help="non leggere né scrivere i piani su disco")
+    p.add_argument("--result-cache", default=None, metavar="DIR",
+                   help="riusa i file già generati con gli stessi parametri, salvati in DIR")
+    p.add_argument("--auto-regions", default=None,
+                   help="file dei box rilevati in automatico (default: template_auto_regions.json accanto a --coords)")
+    lim = p.add_argument_group("budget dei design")
+    lim.add_argument("--max-megapixels", type=float, default=100,
+                     help="pixel decodificati per design, dopo la riduzione dei JPEG")
+    lim.add_argument("--max-memory-mb", type=int, default=768, help="memoria stimata per decodificare un design")
+    enc = p.add_argument_group("codifica")
+    enc.add_argument("--jpeg-quality", type=int, default=95)
+    enc.add_argument("--progressive", action="store_true", help="JPEG progressivi")
+    enc.add_argument("--subsampling", choices=SUBSAMPLING, default="auto",
+                     help="sottocampionamento colore dei JPEG")
+    enc.add_argument("--png-level", type=int, default=6, choices=range(10), metavar="0-9",
+                     help="compressione zlib dei PNG")
+    enc.add_argument("--webp", action="store_true", help="scrive WebP al posto di JPEG e PNG")
+    enc.add_argument("--webp-quality", type=int, default=90)
+    p.add_argument("-q", "--quiet", action="store_true")
+    return p
+
+
+def _encoder(args):
+    return EncoderSettings(jpeg_quality=args.jpeg_quality, jpeg_progressive=args.progressive,
+                           jpeg_subsampling=args.subsampling, png_compress_level=args.png_level,
+                           webp=args.webp, webp_quality=args.webp_quality)
+
+
+def _load_maps(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _open_output(out):
+    from mockup_engine.output import open_sink
+
+    if out == "-":
+        return open_sink("tar", sys.stdout.buffer)
+    if out.lower().endswith(".zip"):
+        return open_sink("zip", out)
+    if out.lower().endswith(".tar"):
+        return open_sink("tar", out)
+    return open_sink("dir", out)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from mockup_engine import plans
+    from mockup_engine.batch import render_batch
+    from mockup_engine.ingest import DesignLimits
+    from mockup_engine.library import list_templates
+    from mockup_engine.store import default_root
+
+    if args.category:
+        names = list_templates(args.templates_dir, args.category)
+    else:
+        available = set(list_templates(args.templates_dir))
+        missing = [t for t in args.templates if t not in available]
+        if missing:
+            print(f"Template non trovati in {args.templates_dir}: {', '.join(missing)}", file=sys.stderr)
+            return 2
+        names = args.templates
+    if not names:
+        print("Nessun template selezionato.", file=sys.stderr)
+        return 2
+    designs = [(os.path.join(args.designs, f), f) for f in sorted(os.listdir(args.designs))
+               if f.lower().endswith(DESIGN_EXTS)]
+    if not designs:
+        print(f"Nessun design in {args.designs}.", file=sys.stderr)
+        return 2
+
+    template_paths = {t: os.path.join(args.templates_dir, t) for t in names}
+    if not args.no_plan_cache:
+        plans.use_store(args.plan_cache or default_root(args.templates_dir))
+    auto_path = args.auto_regions or os.path.join(os.path.dirname(os.path.abspath(args.coords)),
+                                                  "template_auto_regions.json")
+    cache = None
+    if args.result_cache:
+        from mockup_engine.results import ResultCache
+
+        cache = ResultCache(args.result_cache)
+    limits = DesignLimits(int(args.max_megapixels * 1_000_000), args.max_memory_mb * 1024 * 1024)
+    total = len(designs) * len(names)
+    # un design illeggibile si segnala e si salta: l'archivio contiene gli altri
+    errors = []
+    with _open_output(args.out) as sink:
+        for count, (arcname, data) in enumerate(
+                render_batch(designs, template_paths, _load_maps(args.coords), args.workers, auto_path,
+                             encoder=_encoder(args), cache=cache, limits=limits, errors=errors), 1):
+            sink.add(arcname, data)
+            if not args.quiet:
+                print(f"\r{count}/{total}", end="", file=sys.stderr, flush=True)
+    if not args.quiet:
+        print(file=sys.stderr)
+        if cache is not None:
+            print(f"cache: {cache.hits} riutilizzati, {cache.misses} generati", file=sys.stderr)
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
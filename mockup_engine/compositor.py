@@ -0,0 +1,149 @@
+"""Motore V3: composizione del design sulla faccia del template con le ombre originali."""
+import cv2
+import numpy as np
+from PIL import Image
+
+from mockup_engine import blend, detect, plans, timing, warp
+from mockup_engine.resample import CoverResampler
+
+
+def template_has_alpha(tmpl_pil, template_name):
+    return (tmpl_pil.mode in ('RGBA', 'LA') or
+            (tmpl_pil.mode == 'P' and 'transparency' in tmpl_pil.info) or
+            template_name.lower().endswith('.png'))
+
+def build_plan_v3(tmpl_pil, template_name, d, bo, auto=None):
+    base = plans.load_base(tmpl_pil, template_has_alpha(tmpl_pil, template_name))
+    # RGBA -> L ignora l'alpha come RGB -> L: stessi grigi, senza copiare la base
+    tmpl_gray = np.array(Image.fromarray(base).convert('L'))
+    h, w = tmpl_gray.shape
+
+    if d is not None and d.get("quad"):
+        corners = warp.face_quad(d["quad"], w, h)
+        box = warp.quad_box(corners, w, h)
+        x1, y1, tw, th = box
+        shadows = np.clip(tmpl_gray[y1:y1+th, x1:x1+tw].astype(np.float32) / 246.0, 0, 1.0)
+        return plans.TemplatePlan(box, shadows, base, "crop", warp.build_warp(corners, box))
+
+    if d is not None:
+        x1, y1, tw, th = plans.face_box(d["coords"], bo, w, h)
+        shadows = np.clip(tmpl_gray[y1:y1+th, x1:x1+tw].astype(np.float32) / 246.0, 0, 1.0)
+        return plans.TemplatePlan((x1, y1, tw, th), shadows, base, "crop")
+
+    digest = plans.template_hash(tmpl_pil)
+    kind = detect.detect_kind_v3(template_name)
+    box = auto.get(digest, kind) if auto is not None and digest else None
+    if box is None:
+        box = detect.detect_face_v3(tmpl_gray, template_name)
+        if auto is not None and digest:
+            auto.put(digest, kind, box)
+    bx1, by1, tw, th = box
+    sh = np.clip(tmpl_gray[by1:by1+th, bx1:bx1+tw].astype(np.float32) / 246.0, 0, 1.0)
+    return plans.TemplatePlan((bx1, by1, tw, th), sh, base, "stretch")
+
+def plan_v3(tmpl_pil, template_name, maps=None, border_offset=None, proxy_width=None, auto=None):
+    """Piano del template per il motore V3 (dalla cache se già calcolato)."""
+    d = (maps or {}).get(template_name)
+    bo = None
+    if d is not None and d.get("quad"):
+        # quattro angoli: l'offset non si applica
+        params = ("v3", template_name, ("quad",) + tuple(tuple(p) for p in d["quad"]), None)
+        return plans.get_plan(tmpl_pil, params, lambda t: build_plan_v3(t, template_name, d, None, auto),
+                              proxy_width)
+    if d is not None:
+        bo = border_offset if border_offset is not None else d.get("offset", 1)
+    params = ("v3", template_name, tuple(d["coords"]) if d else None, bo)
+    return plans.get_plan(tmpl_pil, params, lambda t: build_plan_v3(t, template_name, d, bo, auto), proxy_width)
+
+def _aspect_crop(size, target_aspect):
+    """Box centrale di size con il rapporto target_aspect."""
+    cw, ch = size
+    if cw/ch > target_aspect:
+        nw = int(ch * target_aspect)
+        return ((cw - nw)//2, 0, (cw - nw)//2 + nw, ch)
+    nh = int(cw / target_aspect)
+    return (0, (ch - nh)//2, cw, (ch - nh)//2 + nh)
+
+def _paste_face(plan, face, mask=None):
+    """Risultato in un solo buffer nuovo, copia della base, in cui cambia solo la faccia.
+
+    face è uint8 (th, tw, 3), mask uint8 (th, tw) opzionale. L'alpha dei
+    template trasparenti resta quello della base.
+    """
+    x1, y1, tw, th = plan.box
+    if plan.alpha is None:
+        # fromarray è la copia; Pillow tiene l'RGB a 4 byte per pixel
+        out = Image.fromarray(np.asarray(plan.base))
+        out.paste(Image.fromarray(face), (x1, y1), Image.fromarray(mask) if mask is not None else None)
+        return out
+    if mask is None:
+        out = np.array(plan.base)
+        # copia i tre canali colore nella ROI senza toccare l'alpha
+        cv2.mixChannels([face], [out[y1:y1+th, x1:x1+tw]], [0, 0, 1, 1, 2, 2])
+        # RGBA: Pillow usa direttamente il buffer, senza altre copie
+        return Image.fromarray(out)
+    # faccia RGBA con l'alpha della base: il paste con maschera lo lascia invariato
+    face_a = np.empty((th, tw, 4), np.uint8)
+    cv2.mixChannels([face, plan.base[y1:y1+th, x1:x1+tw]], [face_a], [0, 0, 1, 1, 2, 2, 6, 3])
+    out = Image.fromarray(np.asarray(plan.base)).copy()
+    out.paste(Image.fromarray(face_a), (x1, y1), Image.fromarray(mask))
+    return out
+
+def _composite_warped(plan, resampler):
+    """Faccia in prospettiva: un remap del design ridimensionato, poi ombre e maschera del quadrilatero."""
+    x1, y1, tw, th = plan.box
+    fw, fh = plan.warp.face_size
+    with timing.stage("resize"):
+        c_res = resampler.resize((fw, fh), _aspect_crop(resampler.size, fw / fh))
+    with timing.stage("warp"):
+        src = np.asarray(c_res if c_res.mode in ('RGB', 'RGBA') else c_res.convert('RGB'))
+        warped = warp.apply_warp(plan.warp, src)
+    with timing.stage("shadow"):
+        face = np.ascontiguousarray(warped[..., :3])
+        blend.shade(face, plan.shadow_rgb, out=face)
+        mask = plan.warp.mask
+        if warped.shape[2] == 4:
+            mask = cv2.multiply(np.asarray(mask), np.ascontiguousarray(warped[..., 3]), scale=1/255)
+    with timing.stage("paste"):
+        return _paste_face(plan, face, np.asarray(mask))
+
+def composite_v3_fixed(tmpl_pil, cover_pil, template_name="", border_offset=None, maps=None, resampler=None,
+                       proxy_width=None, auto=None):
+    """Applica il design sulla faccia del libro; senza coordinate in maps la faccia è rilevata in automatico.
+
+    resampler (CoverResampler dello stesso design) evita di ripetere il resize
+    quando più template chiedono la stessa faccia. Una voce di maps con "quad"
+    (quattro angoli in percentuale) deforma il design in prospettiva con le
+    tabelle di remap del piano. Con proxy_width il render
+    avviene su un piano ridotto a quella larghezza (anteprime). auto (AutoRegions)
+    conserva i box rilevati, così un template non calibrato si analizza una volta sola.
+    """
+    with timing.stage("plan"):
+        plan = plan_v3(tmpl_pil, template_name, maps, border_offset, proxy_width, auto)
+    x1, y1, tw, th = plan.box
+    if resampler is None:
+        resampler = CoverResampler(cover_pil)
+    if plan.warp is not None:
+        return _composite_warped(plan, resampler)
+
+    with timing.stage("resize"):
+        if plan.fit == "crop":
+            c_res = resampler.resize((tw, th), _aspect_crop(resampler.size, tw / th))
+        else:
+            c_res = resampler.resize((tw, th))
+
+    with timing.stage("shadow"):
+        c_array = np.array(c_res.convert('RGB'))
+        face = blend.shade(c_array, plan.shadow_rgb, out=c_array)
+    with timing.stage("paste"):
+        return _paste_face(plan, face, np.asarray(c_res.getchannel('A')) if c_res.mode == 'RGBA' else None)
+
+def face_size(plan):
+    """(larghezza, altezza) a cui il design viene ridimensionato per il piano."""
+    if plan.warp is not None:
+        return plan.warp.face_size
+    return plan.box[2], plan.box[3]
+
+def face_sizes(templates, maps=None, auto=None):
+    """{nome: (larghezza, altezza)} delle facce dei template {nome: immagine}, per ingest."""
+    return {t_name: face_size(plan_v3(tmpl, t_name, maps, auto=auto)) for t_name, tmpl in templates.items()}
@@ -0,0 +1,203 @@
+"""Coordinate dei template con cache in processo e revalidazione su GitHub.
+
+La lettura è sempre locale (memoria o template_coordinates.json); GitHub viene
+ricontrollato in background allo scadere del TTL con una richiesta
+condizionata (If-None-Match), che con risposta 304 non consuma rate limit.
+"""
+import base64
+import copy
+import json
+import os
+import threading
+import time
+
+import requests
+
+from mockup_engine.fsutil import write_json
+
+DEFAULT_TTL = 60.0
+
+
+class AutoRegions:
+    """Box delle facce rilevati in automatico, per hash del template.
+
+    Sono dati derivati: restano nel file locale e non vanno su GitHub.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def get(self, digest, kind):
+        with self._lock:
+            if self._entries is None:
+                self._entries = _read_json(self.path) or {}
+            box = self._entries.get(f"{kind}:{digest}")
+        return tuple(box) if box else None
+
+    def put(self, digest, kind, box):
+        with self._lock:
+            # rilegge il file: altri processi (worker del batch) possono aver aggiunto voci
+            entries = _read_json(self.path) or {}
+            entries.update(self._entries or {})
+            entries[f"{kind}:{digest}"] = [int(v) for v in box]
+            self._entries = entries
+            write_json(self.path, entries)
+
+
+class CoordinateStore:
+    """Coordinate servite dalla copia locale, revalidata su GitHub allo scadere del TTL.
+
+    Una save() non riuscita su GitHub resta in locale e vince sulla copia
+    remota finché un salvataggio non va a buon fine: le revalidazioni la
+    ignorano, come ignorano il risultato di una richiesta partita prima di
+    una save().
+    """
+
+    def __init__(self, gh, remote_path, local_path, defaults, ttl=DEFAULT_TTL, auto_path=None):
+        self.gh = gh
+        self.remote_path = remote_path
+        self.local_path = local_path
+        self.defaults = defaults
+        self.ttl = ttl
+        self._maps = None
+        self._etag = None
+        self._sha = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._generation = 0   # incrementata da ogni save()
+        self._unpublished = False  # l'ultima save() non è arrivata su GitHub
+        self._lock = threading.Lock()
+        self.auto = AutoRegions(auto_path) if auto_path else None
+
+    def get(self):
+        """Mappa corrente {template: {"coords", "offset"}}: una copia profonda, modificabile dal chiamante."""
+        with self._lock:
+            if self._maps is None:
+                self._maps = self._read_local()
+            stale = time.monotonic() - self._checked_at > self.ttl
+            first = self._maps is None
+        if first:
+            # nessun file locale: l'unico caso in cui si aspetta GitHub
+            self.refresh()
+            with self._lock:
+                if self._maps is None:
+                    self._maps = copy.deepcopy(self.defaults)
+        elif stale:
+            self._refresh_in_background()
+        with self._lock:
+            return copy.deepcopy(self._maps)
+
+    def refresh(self):
+        """Richiesta condizionata a GitHub; True se la mappa è cambiata."""
+        with self._lock:
+            generation = self._generation
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+        try:
+            resp = self.gh.session.get(self.gh.contents_url(self.remote_path), headers=headers, timeout=5)
+        except requests.RequestException:
+            return False
+        finally:
+            with self._lock:
+                self._checked_at = time.monotonic()
+        if resp.status_code != 200:
+            return False
+        try:
+            # un 200 non JSON (proxy, portale captive) vale come GitHub non raggiungibile
+            body = resp.json()
+            maps = json.loads(base64.b64decode(body.get("content", "")).decode("utf-8"))
+        except (ValueError, AttributeError):
+            return False
+        with self._lock:
+            # una save() durante la richiesta, o non ancora su GitHub, vince sulla copia remota
+            if self._generation != generation or self._unpublished:
+                return False
+            self._etag = resp.headers.get("ETag")
+            self._sha = body.get("sha")
+            changed = maps != self._maps
+            self._maps = maps
+            if changed:
+                self._write_local(maps)
+        return changed
+
+    def save(self, maps):
+        """Salva in locale e su GitHub; True se il commit su GitHub è riuscito."""
+        # copia profonda: le voci del chiamante (lo stato della calibrazione in
+        # sessione) continuano a cambiare dopo il salvataggio
+        maps = copy.deepcopy(maps)
+        with self._lock:
+            self._write_local(maps)
+            self._maps = maps
+            self._generation += 1
+            self._unpublished = True
+            generation = self._generation
+            sha = self._sha
+        content = json.dumps(maps, indent=2)
+        payload = {"message": f"Update {self.remote_path}",
+                   "content": base64.b64encode(content.encode("utf-8")).decode("utf-8"),
+                   "branch": self.gh.branch}
+        sha = sha or self._remote_sha()
+        if sha:
+            payload["sha"] = sha
+        try:
+            resp = self.gh.session.put(self.gh.contents_url(self.remote_path), json=payload, timeout=10)
+        except requests.RequestException:
+            return False
+        if resp.status_code not in (200, 201):
+            return False
+        try:
+            new_sha = resp.json().get("content", {}).get("sha")
+        except (ValueError, AttributeError):
+            new_sha = None
+        self.invalidate()
+        with self._lock:
+            self._sha = new_sha
+            if self._generation == generation:
+                self._unpublished = False
+            # GitHub può servire per qualche secondo la versione vecchia:
+            # la copia appena salvata resta valida per un TTL
+            self._checked_at = time.monotonic()
+        return True
+
+    def invalidate(self):
+        """Scarta l'ETag in cache: si riferisce alla versione di GitHub precedente all'ultima save()."""
+        with self._lock:
+            self._etag = None
+
+    def _remote_sha(self):
+        try:
+            resp = self.gh.session.get(self.gh.contents_url(self.remote_path), timeout=5)
+            if resp.status_code == 200:
+                return resp.json().get("sha")
+        except (requests.RequestException, ValueError, AttributeError):
+            pass
+        return None
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def _read_local(self):
+        return _read_json(self.local_path)
+
+    def _write_local(self, maps):
+        write_json(self.local_path, maps)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,86 @@
+"""Rilevamento automatico della faccia del libro nei template non calibrati.
+
+Solo riduzioni su array interi (proiezioni booleane + argmax), nessun loop
+Python sui pixel.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _first_last(mask):
+    """Primo e ultimo indice True di un vettore booleano, None se è tutto False."""
+    if not mask.any():
+        return None
+    return int(np.argmax(mask)), int(len(mask) - 1 - np.argmax(mask[::-1]))
+
+
+def find_book_region(tmpl_gray, bg_val):
+    book_mask = tmpl_gray > (bg_val + 3)
+    rows = _first_last(np.any(book_mask, axis=1))
+    cols = _first_last(np.any(book_mask, axis=0))
+    if rows is None or cols is None:
+        return None
+    by1, by2 = rows
+    bx1, bx2 = cols
+    # inizio della faccia: prima finestra di 5 pixel chiari sulla riga centrale
+    row = tmpl_gray[(by1 + by2) // 2]
+    face_x1 = bx1
+    if bx2 - 5 > bx1:
+        bright = sliding_window_view(row[bx1:bx2] >= 240, 5).all(axis=1)[:bx2 - 5 - bx1]
+        if bright.any():
+            face_x1 = bx1 + int(np.argmax(bright))
+    return {
+        'book_x1': bx1, 'book_x2': bx2,
+        'book_y1': by1, 'book_y2': by2,
+        'face_x1': face_x1
+    }
+
+
+def find_book_region_auto(tmpl_gray, bg_val):
+    """Variante del calibratore: box del libro e valore mediano della faccia."""
+    book_mask = tmpl_gray > (bg_val + 3)
+    rows = _first_last(np.any(book_mask, axis=1))
+    cols = _first_last(np.any(book_mask, axis=0))
+    if rows is None or cols is None:
+        return None
+    by1, by2 = rows
+    bx1, bx2 = cols
+
+    margin = 30
+    face_area = tmpl_gray[by1+margin:by2-margin, bx1+margin:bx2-margin]
+    face_val = float(np.median(face_area)) if face_area.size > 0 else 246.0
+    return {'bx1': bx1, 'bx2': bx2, 'by1': by1, 'by2': by2, 'face_val': face_val}
+
+
+def content_bounds(tmpl_gray, threshold=250):
+    """Box (x1, x2, y1, y2) dei pixel più scuri di threshold; tutto il frame se non ce ne sono."""
+    h, w = tmpl_gray.shape
+    dark = tmpl_gray < threshold
+    cols = _first_last(dark.any(axis=0)) or (0, w - 1)
+    rows = _first_last(dark.any(axis=1)) or (0, h - 1)
+    return cols[0], cols[1], rows[0], rows[1]
+
+
+def detect_face_v3(tmpl_gray, template_name):
+    """Box della faccia (x1, y1, tw, th) come lo cerca il motore V3 senza coordinate."""
+    h, w = tmpl_gray.shape
+    if "base_copertina" in template_name.lower():
+        bx1, bx2, by1, by2 = content_bounds(tmpl_gray)
+    else:
+        corners = [tmpl_gray[3,3], tmpl_gray[3,w-3], tmpl_gray[h-3,3], tmpl_gray[h-3,w-3]]
+        bg_val = float(np.median(corners))
+        region = find_book_region(tmpl_gray, bg_val)
+        if region is None or (region['book_x2'] - region['book_x1'] > w * 0.95):
+            margin_x, margin_y = int(w * 0.2), int(h * 0.1)
+            bx1, bx2, by1, by2 = margin_x, w - margin_x, margin_y, h - margin_y
+        else:
+            bx1, bx2, by1, by2 = region['book_x1'], region['book_x2'], region['book_y1'], region['book_y2']
+
+    bx1, bx2 = max(0, bx1 - 2), min(w - 1, bx2 + 2)
+    by1, by2 = max(0, by1 - 2), min(h - 1, by2 + 2)
+    return bx1, by1, bx2 - bx1 + 1, by2 - by1 + 1
+
+
+def detect_kind_v3(template_name):
+    """Chiave del tipo di rilevamento: il risultato dipende anche dal nome."""
+    return "v3-copertina" if "base_copertina" in template_name.lower() else "v3"
@@ -0,0 +1,56 @@
+"""Codifica dei risultati del batch con impostazioni per formato.
+
+Le impostazioni di default producono gli stessi file di prima (JPEG qualità
+95, PNG con compressione zlib 6).
+"""
+import io
+from dataclasses import dataclass
+
+from mockup_engine import timing
+
+SUBSAMPLING = ("auto", "4:4:4", "4:2:2", "4:2:0")
+
+
+@dataclass(frozen=True)
+class EncoderSettings:
+    jpeg_quality: int = 95
+    jpeg_progressive: bool = False
+    jpeg_subsampling: str = "auto"  # "auto" lascia decidere a Pillow in base alla qualità
+    png_compress_level: int = 6
+    webp: bool = False  # WebP al posto di JPEG e PNG (mantiene la trasparenza)
+    webp_quality: int = 90
+    webp_lossless: bool = False
+
+    def save_args(self, fmt):
+        """Formato Pillow e parametri di save() per "JPEG", "PNG" o "WEBP"."""
+        if fmt == "JPEG":
+            args = {"quality": self.jpeg_quality}
+            if self.jpeg_progressive:
+                args["progressive"] = True
+            if self.jpeg_subsampling != "auto":
+                args["subsampling"] = self.jpeg_subsampling
+            return args
+        if fmt == "PNG":
+            return {"compress_level": self.png_compress_level}
+        return {"quality": self.webp_quality, "lossless": self.webp_lossless}
+
+
+DEFAULT_SETTINGS = EncoderSettings()
+
+
+def output_format(res, t_name, settings=DEFAULT_SETTINGS):
+    """(formato Pillow, estensione) del risultato: PNG per i template con trasparenza, JPEG altrimenti."""
+    if settings.webp:
+        return "WEBP", ".webp"
+    if t_name.lower().endswith('.png') or res.mode == 'RGBA':
+        return "PNG", ".png"
+    return "JPEG", ".jpg"
+
+
+def encode_result(res, t_name, settings=DEFAULT_SETTINGS):
+    """Codifica il risultato; restituisce (estensione, bytes)."""
+    fmt, ext = output_format(res, t_name, settings)
+    buf = io.BytesIO()
+    with timing.stage("encode"):
+        res.save(buf, format=fmt, **settings.save_args(fmt))
+    return ext, buf.getvalue()
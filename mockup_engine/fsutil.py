@@ -0,0 +1,32 @@
+"""Scritture atomiche: un file temporaneo nella stessa cartella, poi os.replace.
+
+Chi legge trova il file vecchio o quello nuovo, mai uno scritto a metà; se
+la scrittura fallisce il temporaneo (TMP_PREFIX) viene eliminato.
+"""
+import json
+import os
+import tempfile
+
+TMP_PREFIX = ".tmp-"
+
+
+def atomic_write(path, data):
+    """Sostituisce path con data: bytes, oppure una funzione che scrive nel file binario aperto."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if callable(data):
+                data(out)
+            else:
+                out.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def write_json(path, data):
+    atomic_write(path, json.dumps(data, indent=2).encode("utf-8"))
@@ -0,0 +1,244 @@
+"""Accesso al repository GitHub dei template con sessione HTTP condivisa."""
+import base64
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from mockup_engine.fsutil import atomic_write, write_json
+from mockup_engine.library import TEMPLATE_EXTS
+
+API_ROOT = "https://api.github.com"
+MANIFEST_NAME = ".sync_manifest.json"
+
+
+class GitHubRepo:
+    """Repository remoto: URL delle API e una requests.Session con pool di connessioni.
+
+    api_root si può puntare a un server locale che imita le API (test, sviluppo).
+    """
+
+    def __init__(self, repo, token="", branch="main", api_root=API_ROOT, pool_size=16):
+        self.repo = repo
+        self.branch = branch
+        self.api_root = api_root.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github.v3+json"
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+
+    def contents_url(self, path):
+        return f"{self.api_root}/repos/{self.repo}/contents/{path}"
+
+    def git_url(self, path):
+        """URL della Git Data API (blobs, trees, commits, refs)."""
+        return f"{self.api_root}/repos/{self.repo}/git/{path}"
+
+
+def git_blob_sha(data):
+    """sha del blob come lo calcola git (e lo riporta l'API contents)."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+@dataclass
+class SyncReport:
+    downloaded: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    failed: list = field(default_factory=list)
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+def _load_manifest(dest):
+    try:
+        with open(os.path.join(dest, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(dest, manifest):
+    write_json(os.path.join(dest, MANIFEST_NAME), manifest)
+
+
+def _local_state(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _needs_download(dest, name, remote_sha, manifest):
+    """True se il file locale manca o è rimasto alla versione sincronizzata prima
+    di una modifica remota; le modifiche solo locali non vengono sovrascritte."""
+    local_path = os.path.join(dest, name)
+    if not os.path.exists(local_path):
+        return True
+    entry = manifest.get(name)
+    mtime_ns, size = _local_state(local_path)
+    if entry and entry.get("mtime_ns") == mtime_ns and entry.get("size") == size:
+        return entry.get("sha") != remote_sha
+    with open(local_path, "rb") as f:
+        local_sha = git_blob_sha(f.read())
+    if local_sha == remote_sha:
+        manifest[name] = {"sha": remote_sha, "mtime_ns": mtime_ns, "size": size}
+        return False
+    # senza una voce nel manifest vale la versione remota
+    return entry is None or entry.get("sha") == local_sha
+
+
+def sync_templates(gh, remote_dir="templates", dest="templates", max_workers=8, timeout=15):
+    """Scarica solo i template nuovi o cambiati su GitHub, in parallelo.
+
+    Confronta lo sha di ogni file nell'elenco della cartella remota con il
+    manifest locale; ogni file è scritto su un temporaneo e poi rinominato.
+    Restituisce un SyncReport, None se l'elenco remoto non è disponibile.
+    """
+    start = time.perf_counter()
+    os.makedirs(dest, exist_ok=True)
+    resp = gh.session.get(gh.contents_url(remote_dir), timeout=10)
+    if resp.status_code != 200:
+        return None
+    manifest = _load_manifest(dest)
+    original = json.dumps(manifest, sort_keys=True)
+    report = SyncReport()
+    todo = []
+    for f in resp.json():
+        if not f["name"].lower().endswith(TEMPLATE_EXTS):
+            continue
+        if _needs_download(dest, f["name"], f["sha"], manifest):
+            todo.append(f)
+        else:
+            report.skipped.append(f["name"])
+
+    def fetch(f):
+        dl = gh.session.get(f["download_url"], timeout=timeout)
+        if dl.status_code != 200:
+            return f, None
+        local_path = os.path.join(dest, f["name"])
+        atomic_write(local_path, dl.content)
+        return f, len(dl.content)
+
+    if todo:
+        with ThreadPoolExecutor(min(max_workers, len(todo))) as ex:
+            for f, size in ex.map(_safe(fetch), todo):
+                if size is None:
+                    report.failed.append(f["name"])
+                    continue
+                mtime_ns, local_size = _local_state(os.path.join(dest, f["name"]))
+                manifest[f["name"]] = {"sha": f["sha"], "mtime_ns": mtime_ns, "size": local_size}
+                report.downloaded.append(f["name"])
+                report.bytes += size
+    # un sync senza novità non riscrive il manifest: niente scritture inutili su disco
+    if json.dumps(manifest, sort_keys=True) != original:
+        _save_manifest(dest, manifest)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _safe(fetch):
+    def run(f):
+        try:
+            return fetch(f)
+        except (requests.RequestException, OSError):
+            return f, None
+    return run
+
+
+class PublishError(Exception):
+    pass
+
+
+@dataclass
+class PublishReport:
+    commit: str = None
+    uploaded: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+    error: str = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return self.commit is not None
+
+
+def _call(gh, method, path, timeout, **kwargs):
+    resp = gh.session.request(method, gh.git_url(path), timeout=timeout, **kwargs)
+    if resp.status_code not in (200, 201):
+        raise PublishError(f"{method} git/{path}: HTTP {resp.status_code}")
+    return resp.json()
+
+
+def _head(gh, timeout):
+    ref = _call(gh, "GET", f"ref/heads/{gh.branch}", timeout)
+    commit_sha = ref["object"]["sha"]
+    return commit_sha, _call(gh, "GET", f"commits/{commit_sha}", timeout)["tree"]["sha"]
+
+
+def publish_templates(gh, files=None, delete=(), remote_dir="templates", message=None,
+                      max_workers=8, progress=None, timeout=30):
+    """Carica e/o elimina più template con un solo commit (Git Data API).
+
+    files è un dict {nome: bytes}, delete un elenco di nomi. I blob partono
+    in parallelo, poi un tree, un commit e un aggiornamento del ref; se il
+    branch si è mosso nel frattempo il commit si rifà una volta sul nuovo head.
+    progress(nome, fatti, totale) è chiamata a ogni blob caricato.
+    In caso di errore su GitHub non cambia nulla e report.error lo descrive.
+    """
+    start = time.perf_counter()
+    files = files or {}
+    report = PublishReport()
+    try:
+        blobs = {}
+        if files:
+            def upload(item):
+                name, data = item
+                body = {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+                return name, _call(gh, "POST", "blobs", timeout, json=body)["sha"]
+
+            with ThreadPoolExecutor(min(max_workers, len(files))) as ex:
+                for name, sha in ex.map(upload, files.items()):
+                    blobs[name] = sha
+                    if progress is not None:
+                        progress(name, len(blobs), len(files))
+
+        tree = [{"path": f"{remote_dir}/{name}", "mode": "100644", "type": "blob", "sha": sha}
+                for name, sha in blobs.items()]
+        # sha None su un path del tree di base lo rimuove
+        tree += [{"path": f"{remote_dir}/{name}", "mode": "100644", "type": "blob", "sha": None}
+                 for name in delete if name not in blobs]
+        if not tree:
+            return report
+        if message is None:
+            parts = []
+            if blobs:
+                parts.append(f"add/update {len(blobs)} template")
+            if delete:
+                parts.append(f"delete {len(delete)} template")
+            message = "Templates: " + ", ".join(parts)
+
+        for attempt in range(2):
+            parent, base_tree = _head(gh, timeout)
+            new_tree = _call(gh, "POST", "trees", timeout, json={"base_tree": base_tree, "tree": tree})["sha"]
+            commit = _call(gh, "POST", "commits", timeout,
+                           json={"message": message, "tree": new_tree, "parents": [parent]})["sha"]
+            resp = gh.session.patch(gh.git_url(f"refs/heads/{gh.branch}"), timeout=timeout,
+                                    json={"sha": commit, "force": False})
+            if resp.status_code == 200:
+                report.commit = commit
+                break
+            # 422: il ref non è più un antenato del commit (push concorrente)
+            if resp.status_code != 422 or attempt == 1:
+                raise PublishError(f"PATCH git/refs/heads/{gh.branch}: HTTP {resp.status_code}")
+        report.uploaded = list(blobs)
+        report.deleted = [name for name in delete if name not in blobs]
+    except (PublishError, requests.RequestException, KeyError, ValueError) as e:
+        report.error = str(e) or type(e).__name__
+    report.seconds = time.perf_counter() - start
+    return report
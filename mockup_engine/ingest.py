@@ -0,0 +1,133 @@
+"""Apertura dei design di stampa con memoria limitata.
+
+Un design da 10k px in CMYK o a 16 bit, decodificato per intero, occupa
+centinaia di MB per finire su una faccia di meno di 2000 px. Qui si legge
+prima l'header: i JPEG vengono decodificati con draft() alla scala più
+piccola (1/2, 1/4, 1/8) che copre ancora le facce richieste, il budget si
+controlla sulle dimensioni effettive prima del load e il modo si converte
+una volta sola, in RGB o RGBA.
+"""
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MAX_PIXELS = 100_000_000
+DEFAULT_MAX_BYTES = 768 * 1024 * 1024
+
+
+class DesignError(ValueError):
+    """Design illeggibile o oltre il budget; il messaggio cita il file."""
+
+
+@dataclass(frozen=True)
+class DesignLimits:
+    max_pixels: int = DEFAULT_MAX_PIXELS  # pixel decodificati (dopo draft)
+    max_bytes: int = DEFAULT_MAX_BYTES    # memoria stimata di decodifica + conversione
+
+
+DEFAULT_LIMITS = DesignLimits()
+
+
+def _band_bytes(mode):
+    """Byte per pixel di un'immagine Pillow nel modo dato."""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+def _target_mode(img):
+    if img.mode in ('RGBA', 'LA', 'PA', 'La') or (img.mode == 'P' and 'transparency' in img.info):
+        return 'RGBA'
+    return 'RGB'
+
+
+def draft_size(size, faces):
+    """Dimensione minima del design che copre (come cover crop) ogni faccia in faces; None senza facce."""
+    w, h = size
+    k = max((max(fw / w, fh / h) for fw, fh in faces), default=None)
+    if k is None or k >= 1:
+        return None
+    return math.ceil(w * k), math.ceil(h * k)
+
+
+def _name(fp, name):
+    if name:
+        return name
+    return os.path.basename(fp) if isinstance(fp, (str, os.PathLike)) else getattr(fp, "name", "design")
+
+
+def close_design(img):
+    """Chiude un'immagine di inspect_design; a differenza di Image.close non chiude i file del chiamante."""
+    with img:
+        pass
+
+
+def inspect_design(fp, name=None, faces=(), limits=DEFAULT_LIMITS):
+    """Design aperto (solo header) e ridotto con draft per faces; DesignError oltre il budget.
+
+    L'immagine restituita non è ancora decodificata: la sua size è quella che
+    avrà dopo decode_design.
+    """
+    name = _name(fp, name)
+    try:
+        img = Image.open(fp)
+    except Image.DecompressionBombError as e:
+        raise DesignError(f"{name}: {e}") from None
+    except OSError:
+        raise DesignError(f"{name}: formato non riconosciuto") from None
+    full = img.size
+    target = draft_size(full, faces)
+    if target is not None and img.format == "JPEG":
+        img.draft('RGB' if img.mode == 'RGB' else None, target)
+    w, h = img.size
+    needed = w * h * (_band_bytes(img.mode) + (4 if img.mode not in ('RGB', 'RGBA') else 0))
+    if w * h > limits.max_pixels or needed > limits.max_bytes:
+        close_design(img)
+        size = f"{full[0]}×{full[1]} px" + (f" (letti {w}×{h})" if (w, h) != full else "")
+        raise DesignError(f"{name}: {size}, {img.mode}: servono ~{needed / 2**20:.0f} MB, "
+                          f"oltre il limite di {limits.max_pixels / 1e6:.0f} MP / {limits.max_bytes / 2**20:.0f} MB")
+    return img
+
+
+def decode_design(img, name=None):
+    """Decodifica l'immagine di inspect_design e la converte una volta sola in RGB o RGBA."""
+    name = _name(img.filename or "design", name)
+    try:
+        img.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise DesignError(f"{name}: file danneggiato ({e})") from None
+    target = _target_mode(img)
+    if img.mode == target:
+        return img
+    if img.mode.startswith('I;16') or img.mode == 'I':
+        # a 16 bit: convert('L') taglierebbe a 255 invece di riscalare
+        gray = (np.clip(np.asarray(img, dtype=np.uint32), 0, 65535) >> 8).astype(np.uint8)
+        return Image.fromarray(gray).convert('RGB')
+    return img.convert(target)
+
+
+def check_design(fp, name=None, faces=(), limits=DEFAULT_LIMITS):
+    """Solo header: (dimensione dopo draft, modo) o DesignError. fp torna all'inizio."""
+    pos = fp.tell() if hasattr(fp, "tell") else None
+    try:
+        img = inspect_design(fp, name, faces, limits)
+        close_design(img)
+        return img.size, img.mode
+    finally:
+        if pos is not None:
+            fp.seek(pos)
+
+
+def open_design(fp, name=None, faces=(), limits=DEFAULT_LIMITS):
+    """Design decodificato alla scala utile per faces, in RGB o RGBA.
+
+    faces sono le (larghezza, altezza) delle facce in cui finirà il design;
+    senza facce si decodifica a piena risoluzione.
+    """
+    name = _name(fp, name)
+    return decode_design(inspect_design(fp, name, faces, limits), name)
@@ -0,0 +1,274 @@
+"""Batch in background: lavori con id, avanzamento persistente, annulla e riprendi.
+
+Ogni lavoro ha una cartella in .jobs/<id>/:
+
+    job.json       parametri (design, template, coordinate, codifica) e stato
+    designs/       i file caricati, per poter riprendere dopo un riavvio
+    out/           un file per ogni coppia (design, template) completata
+    done.jsonl     manifest delle coppie completate, una riga per coppia
+    timer.json     tempi grezzi delle esecuzioni precedenti, sommati a ogni ripresa
+    result.zip     l'archivio finale, costruito a lavoro concluso
+    perf.json/csv  tempi per stadio di tutte le esecuzioni
+
+Con cache_root le coppie già generate con gli stessi parametri escono dalla
+cache dei risultati (results.ResultCache); job.json riporta quante.
+Un design illeggibile o oltre il budget non ferma il lavoro: il messaggio
+finisce in "errors" di job.json e l'archivio contiene gli altri design.
+
+Un solo thread esegue i lavori in coda, uno alla volta; lo stato in memoria
+è condiviso da tutte le sessioni del processo. Nessun servizio esterno: alla
+ripartenza i lavori rimasti "running" diventano "interrupted" e si possono
+riprendere dalle coppie mancanti.
+"""
+import json
+import os
+import queue
+import secrets
+import shutil
+import threading
+import time
+from dataclasses import asdict
+
+from mockup_engine.batch import render_pairs
+from mockup_engine.encode import DEFAULT_SETTINGS, EncoderSettings
+from mockup_engine.fsutil import atomic_write, write_json
+from mockup_engine.ingest import DEFAULT_LIMITS
+from mockup_engine.output import open_sink
+from mockup_engine.results import DEFAULT_BUDGET, ResultCache
+from mockup_engine.timing import StageTimer
+
+DEFAULT_ROOT = ".jobs"
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED, INTERRUPTED = (
+    "queued", "running", "done", "cancelled", "failed", "interrupted")
+RESUMABLE = (CANCELLED, FAILED, INTERRUPTED)
+
+
+class JobManager:
+    def __init__(self, root=DEFAULT_ROOT, workers=None, cache_root=None, cache_budget=DEFAULT_BUDGET,
+                 limits=DEFAULT_LIMITS):
+        self.root = root
+        self.workers = workers
+        self.limits = limits
+        self.cache_root = cache_root
+        self.cache_budget = cache_budget
+        self._queue = queue.Queue()
+        self._cancel = {}    # id -> threading.Event
+        self._progress = {}  # id -> coppie completate (lavoro in corso)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # all'avvio nessun lavoro è davvero in esecuzione
+        for job in self.list():
+            if job["status"] in (QUEUED, RUNNING):
+                self._update(job["id"], status=INTERRUPTED)
+        threading.Thread(target=self._runner, daemon=True, name="mockup-jobs").start()
+
+    def submit(self, designs, template_paths, maps, auto_path=None, encoder=DEFAULT_SETTINGS, label=""):
+        """Mette in coda un batch; designs è una lista di (bytes o file object, nome_originale). Restituisce l'id."""
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        job_dir = self._dir(job_id)
+        os.makedirs(os.path.join(job_dir, "designs"))
+        stored = []
+        for idx, (src, name) in enumerate(designs):
+            fname = f"{idx:05d}"
+            with open(os.path.join(job_dir, "designs", fname), "wb") as out:
+                if isinstance(src, (bytes, bytearray, memoryview)):
+                    out.write(src)
+                else:
+                    shutil.copyfileobj(src, out)
+            stored.append([fname, name])
+        job = {"id": job_id, "label": label, "created": time.time(), "status": QUEUED,
+               "designs": stored, "templates": dict(template_paths), "maps": maps,
+               "auto_path": auto_path, "encoder": asdict(encoder),
+               "total": len(stored) * len(template_paths), "error": None, "errors": [], "finished": None,
+               "cache": None}
+        write_json(os.path.join(job_dir, "job.json"), job)
+        self._enqueue(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        with self._lock:
+            event = self._cancel.get(job_id)
+        if event is not None:
+            event.set()
+
+    def resume(self, job_id):
+        """Rimette in coda un lavoro interrotto, annullato o fallito: riparte dalle coppie mancanti."""
+        job = self._load(job_id)
+        if job is None or job["status"] not in RESUMABLE:
+            return False
+        self._update(job_id, status=QUEUED, error=None)
+        self._enqueue(job_id)
+        return True
+
+    def get(self, job_id):
+        """Stato del lavoro con "done" (coppie completate); None se non esiste."""
+        job = self._load(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            done = self._progress.get(job_id)
+        if done is None:
+            done = len(_read_manifest(self._dir(job_id)))
+        job["done"] = done
+        return job
+
+    def list(self):
+        """Tutti i lavori, dal più recente."""
+        jobs = []
+        for name in os.listdir(self.root):
+            job = self._load(name)
+            if job is not None:
+                jobs.append(job)
+        return sorted(jobs, key=lambda j: j["created"], reverse=True)
+
+    def result_path(self, job_id):
+        path = os.path.join(self._dir(job_id), "result.zip")
+        return path if os.path.exists(path) else None
+
+    def perf_path(self, job_id, ext="json"):
+        path = os.path.join(self._dir(job_id), f"perf.{ext}")
+        return path if os.path.exists(path) else None
+
+    def delete(self, job_id):
+        job = self._load(job_id)
+        if job is None or job["status"] in (QUEUED, RUNNING):
+            return False
+        shutil.rmtree(self._dir(job_id), ignore_errors=True)
+        return True
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            self._cancel[job_id] = threading.Event()
+        self._queue.put(job_id)
+
+    def _runner(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:  # il thread deve sopravvivere a qualsiasi errore del lavoro
+                self._update(job_id, status=FAILED, error=str(e) or type(e).__name__)
+            finally:
+                with self._lock:
+                    self._progress.pop(job_id, None)
+                    self._cancel.pop(job_id, None)
+
+    def _run(self, job_id):
+        job = self._load(job_id)
+        with self._lock:
+            cancel = self._cancel.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        if cancel is not None and cancel.is_set():
+            self._update(job_id, status=CANCELLED)
+            return
+        job_dir = self._dir(job_id)
+        out_dir = os.path.join(job_dir, "out")
+        os.makedirs(out_dir, exist_ok=True)
+        done = _read_manifest(job_dir)
+        designs = [(os.path.join(job_dir, "designs", fname), name) for fname, name in job["designs"]]
+        # a ogni ripresa i design si rileggono: gli errori sono quelli di questa esecuzione
+        errors = []
+        self._update(job_id, status=RUNNING, errors=errors)
+        with self._lock:
+            self._progress[job_id] = len(done)
+
+        timer, timed = _load_timer(job_dir)
+        cache = ResultCache(self.cache_root, self.cache_budget) if self.cache_root else None
+        results = render_pairs(designs, job["templates"], job["maps"], self.workers, job["auto_path"],
+                               timer=timer, encoder=EncoderSettings(**job["encoder"]), skip=set(done),
+                               cache=cache, limits=self.limits, errors=errors)
+        try:
+            with open(os.path.join(job_dir, "done.jsonl"), "a+") as manifest:
+                # un'interruzione può aver lasciato l'ultima riga a metà
+                if manifest.tell() > 0:
+                    manifest.seek(manifest.tell() - 1)
+                    if manifest.read(1) != "\n":
+                        manifest.write("\n")
+                for i, arcname, data in results:
+                    atomic_write(os.path.join(out_dir, f"{i:06d}"), data)
+                    # la riga si scrive solo dopo il file: il manifest non cita mai output mancanti
+                    manifest.write(json.dumps({"i": i, "arcname": arcname}) + "\n")
+                    manifest.flush()
+                    done[i] = arcname
+                    timed += 1
+                    with self._lock:
+                        self._progress[job_id] = len(done)
+                    if cancel is not None and cancel.is_set():
+                        results.close()
+                        self._update(job_id, status=CANCELLED, errors=errors, cache=cache and cache.stats())
+                        return
+        finally:
+            # annullato o fallito: i tempi di questa esecuzione si sommano alla ripresa
+            _save_timer(job_dir, timer, timed)
+
+        with timer.measure("zip"):
+            with open_sink("zip", os.path.join(job_dir, "result.zip.part")) as sink:
+                # le coppie dei design illeggibili non sono nel manifest
+                for i in sorted(done):
+                    with open(os.path.join(out_dir, f"{i:06d}"), "rb") as f:
+                        sink.add(done[i], f.read())
+        os.replace(os.path.join(job_dir, "result.zip.part"), os.path.join(job_dir, "result.zip"))
+        shutil.rmtree(out_dir, ignore_errors=True)
+        timer.stop()
+        perf = json.loads(timer.to_json())
+        # un'esecuzione terminata senza salvare i tempi (riavvio) li lascia incompleti
+        perf["pairs"] = timed
+        perf["partial"] = timed < len(done)
+        write_json(os.path.join(job_dir, "perf.json"), perf)
+        atomic_write(os.path.join(job_dir, "perf.csv"), timer.to_csv().encode("utf-8"))
+        self._update(job_id, status=DONE, finished=time.time(), errors=errors, cache=cache and cache.stats())
+
+    def _dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def _load(self, job_id):
+        try:
+            with open(os.path.join(self._dir(job_id), "job.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._load(job_id)
+            if job is None:
+                return
+            job.update(changes)
+            write_json(os.path.join(self._dir(job_id), "job.json"), job)
+
+
+def _read_manifest(job_dir):
+    """{indice coppia: nome nello ZIP} delle coppie completate."""
+    done = {}
+    try:
+        with open(os.path.join(job_dir, "done.jsonl")) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # riga troncata da un'interruzione
+                done[entry["i"]] = entry["arcname"]
+    except OSError:
+        pass
+    return done
+
+
+def _load_timer(job_dir):
+    """StageTimer con i tempi delle esecuzioni precedenti e quante coppie coprono."""
+    timer = StageTimer()
+    try:
+        with open(os.path.join(job_dir, "timer.json")) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return timer, 0
+    timer.merge(saved["stages"])
+    # il tempo totale riparte da quello già speso
+    timer.started -= saved["wall_s"]
+    return timer, saved["pairs"]
+
+
+def _save_timer(job_dir, timer, pairs):
+    write_json(os.path.join(job_dir, "timer.json"),
+               {"wall_s": time.perf_counter() - timer.started, "pairs": pairs, "stages": timer.export()})
@@ -0,0 +1,26 @@
+"""Template su disco: estensioni ammesse e smistamento per categoria."""
+import os
+
+TEMPLATE_EXTS = ('.jpg', '.jpeg', '.png')
+CATEGORIES = ("Verticali", "Orizzontali", "Quadrati", "Altro")
+
+
+def get_manual_cat(filename):
+    fn = filename.lower()
+    if any(x in fn for x in ["vertical", "15x22", "20x30", "bottom", "copertina_verticale"]):
+        return "Verticali"
+    if any(x in fn for x in ["orizzontal", "orrizontale", "orrizontale-preview-app", "20x15", "27x20", "32x24", "40x30"]):
+        return "Orizzontali"
+    if any(x in fn for x in ["quadrat", "20x20", "30x30"]):
+        return "Quadrati"
+    return "Altro"
+
+
+def list_templates(folder="templates", category=None):
+    """Nomi dei template nella cartella, in ordine, eventualmente di una sola categoria."""
+    if not os.path.exists(folder):
+        return []
+    names = sorted(f for f in os.listdir(folder) if f.lower().endswith(TEMPLATE_EXTS))
+    if category is not None:
+        names = [f for f in names if get_manual_cat(f) == category]
+    return names
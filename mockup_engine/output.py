@@ -0,0 +1,128 @@
+"""Destinazioni dei risultati del batch: ZIP su file temporaneo, cartella o archivio tar.
+
+Ogni voce viene scritta appena pronta, così la memoria resta limitata alle
+immagini in lavorazione qualunque sia la dimensione del batch.
+"""
+import io
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+
+# Sotto questa soglia lo ZIP resta in RAM, oltre passa su disco
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+# Formati già compressi: deflate costa CPU e non riduce quasi nulla
+STORED_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def entry_compression(arcname):
+    """ZIP_STORED per le immagini già compresse, ZIP_DEFLATED per il resto."""
+    if arcname.lower().endswith(STORED_EXTS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class ZipSink:
+    """ZIP scritto in modo incrementale su un file temporaneo (o su target se indicato).
+
+    Senza compression il metodo è scelto per voce (entry_compression).
+    """
+
+    def __init__(self, target=None, compression=None):
+        if target is None:
+            self.fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, suffix=".zip")
+        else:
+            self.fileobj = open(target, "w+b")
+        self.compression = compression
+        self._zf = zipfile.ZipFile(self.fileobj, "w", zipfile.ZIP_DEFLATED if compression is None else compression)
+
+    def add(self, arcname, data):
+        compression = entry_compression(arcname) if self.compression is None else self.compression
+        self._zf.writestr(arcname, data, compress_type=compression)
+
+    def close(self):
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
+
+    def reader(self):
+        """Callable per st.download_button: legge lo ZIP dal file solo al momento del download."""
+        fileobj = self.fileobj
+
+        def read():
+            fileobj.seek(0)
+            return fileobj.read()
+        return read
+
+    def discard(self):
+        self.close()
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DirSink:
+    """Scrive ogni voce come file in una cartella, mantenendo le sottocartelle per design."""
+
+    def __init__(self, target):
+        self.target = target
+        os.makedirs(target, exist_ok=True)
+
+    def add(self, arcname, data):
+        path = os.path.join(self.target, *arcname.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            out.write(data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TarSink:
+    """Archivio tar in streaming su un path o su un file object non posizionabile (es. stdout)."""
+
+    def __init__(self, target):
+        if isinstance(target, (str, os.PathLike)):
+            self._tf = tarfile.open(target, "w")
+        else:
+            self._tf = tarfile.open(fileobj=target, mode="w|")
+
+    def add(self, arcname, data):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tf.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        if self._tf is not None:
+            self._tf.close()
+            self._tf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(kind="zip", target=None, **kwargs):
+    """Crea la destinazione: "zip" (default, file temporaneo se target è None), "dir" o "tar"."""
+    if kind == "zip":
+        return ZipSink(target, **kwargs)
+    if kind == "dir":
+        return DirSink(target)
+    if kind == "tar":
+        return TarSink(target)
+    raise ValueError(f"Destinazione non supportata: {kind}")
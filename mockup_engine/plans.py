@@ -0,0 +1,179 @@
+"""Piani di rendering dei template.
+
+Tutto ciò che dipende solo dal template (base con l'eventuale alpha, box
+della faccia, mappa delle ombre) viene calcolato una volta e riusato per ogni
+design. La base è in sola lettura e condivisa: ogni render ne fa una sola
+copia, il buffer di uscita, e vi modifica solo la faccia.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+
+import cv2
+import numpy as np
+
+MAX_PLANS = 48
+
+_plans = OrderedDict()
+_hashes = {}
+_lock = threading.Lock()
+_store = None  # store.PlanStore su disco, sotto la cache in memoria
+
+
+@dataclass(eq=False)
+class TemplatePlan:
+    """Dati precalcolati di un template per un dato set di coordinate."""
+    box: tuple          # (x1, y1, tw, th) della faccia in pixel
+    shadow: np.ndarray  # float32 (th, tw), ombre della faccia in [0, 1]
+    base: np.ndarray    # uint8 (h, w, 3) o (h, w, 4) con alpha, in sola lettura
+    fit: str = "crop"   # "crop" ritaglia il design al formato, "stretch" lo deforma
+    warp: object = None  # warp.FaceWarp per le facce in prospettiva (coordinate "quad")
+
+    @property
+    def size(self):
+        return self.base.shape[1], self.base.shape[0]
+
+    @cached_property
+    def shadow_rgb(self):
+        """Ombre ripetute sui tre canali (float32 th×tw×3) per blend.shade; calcolate al primo uso."""
+        shadow = cv2.merge([np.asarray(self.shadow)] * 3)
+        shadow.flags.writeable = False
+        return shadow
+
+    @property
+    def rgb(self):
+        """Canali colore della base (vista, senza copia)."""
+        return self.base if self.base.shape[2] == 3 else self.base[..., :3]
+
+    @property
+    def alpha(self):
+        """Alpha della base (vista), None per i template opachi."""
+        return self.base[..., 3] if self.base.shape[2] == 4 else None
+
+
+def file_hash(path):
+    """sha1 del contenuto del file, memorizzato per (path, mtime, size)."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    digest = _hashes.get(memo_key)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _hashes[memo_key] = digest
+    return digest
+
+
+def template_hash(tmpl_pil):
+    """Hash del file da cui è stato aperto il template, None se non è su disco."""
+    path = getattr(tmpl_pil, "filename", "")
+    if not path or not os.path.exists(path):
+        return None
+    return file_hash(path)
+
+
+def load_base(tmpl_pil, keep_alpha):
+    """Base del template in sola lettura: RGBA se keep_alpha, altrimenti RGB; una sola conversione."""
+    mode = 'RGBA' if keep_alpha else 'RGB'
+    base = np.array(tmpl_pil if tmpl_pil.mode == mode else tmpl_pil.convert(mode))
+    base.flags.writeable = False
+    return base
+
+
+def face_box(coords, offset, w, h):
+    """Converte coordinate in percentuale in (x1, y1, tw, th) con bordo interno."""
+    px, py, pw, ph = coords
+    x1, y1 = int((px * w) / 100) + offset, int((py * h) / 100) + offset
+    tw, th = int((pw * w) / 100) - (offset * 2), int((ph * h) / 100) - (offset * 2)
+    return x1, y1, tw, th
+
+
+def scale_plan(plan, width):
+    """Copia ridotta del piano (larghezza massima width) per le anteprime."""
+    w, h = plan.size
+    if w <= width:
+        return plan
+    f = width / w
+    pw, ph = width, max(1, round(h * f))
+    x1, y1, tw, th = plan.box
+    px1, py1 = min(round(x1 * f), pw - 1), min(round(y1 * f), ph - 1)
+    ptw, pth = max(1, min(round(tw * f), pw - px1)), max(1, min(round(th * f), ph - py1))
+
+    def shrink(arr, size):
+        small = cv2.resize(arr, size, interpolation=cv2.INTER_AREA)
+        small.flags.writeable = False
+        return small
+    face_warp = None
+    if plan.warp is not None:
+        from mockup_engine.warp import scale_warp
+        face_warp = scale_warp(plan.warp, (ptw, pth))
+    return TemplatePlan((px1, py1, ptw, pth), shrink(plan.shadow, (ptw, pth)),
+                        shrink(np.asarray(plan.base), (pw, ph)), plan.fit, face_warp)
+
+
+def get_plan(tmpl_pil, params, build, proxy_width=None):
+    """Piano del template per i parametri dati, costruito con build() solo se manca.
+
+    La chiave è l'hash del contenuto del file più i parametri (motore, coordinate,
+    offset...), quindi un template modificato o ricalibrato genera un nuovo piano.
+    Con proxy_width restituisce la versione ridotta, anch'essa in cache.
+    """
+    if proxy_width is not None:
+        # i proxy restano solo in memoria: si ricavano in fretta dal piano intero
+        return _get_plan(tmpl_pil, tuple(params) + ("proxy", proxy_width),
+                         lambda t: _scaled_or_none(get_plan(t, params, build), proxy_width), None)
+    return _get_plan(tmpl_pil, tuple(params), build, _store)
+
+
+def _get_plan(tmpl_pil, params, build, store):
+    digest = template_hash(tmpl_pil)
+    if digest is None:
+        return build(tmpl_pil)
+    key = (digest,) + params
+    with _lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = store.load(digest, params) if store is not None else None
+    if plan is None:
+        plan = build(tmpl_pil)
+        if plan is None:
+            return None
+        if store is not None:
+            store.save(digest, params, plan)
+    with _lock:
+        _plans[key] = plan
+        while len(_plans) > MAX_PLANS:
+            _plans.popitem(last=False)
+    return plan
+
+
+def _scaled_or_none(plan, width):
+    return scale_plan(plan, width) if plan is not None else None
+
+
+def use_store(root):
+    """Attiva i piani su disco in root (None li disattiva); vale per tutto il processo."""
+    global _store
+    if root is None:
+        _store = None
+    elif _store is None or _store.root != root:
+        from mockup_engine.store import PlanStore
+        _store = PlanStore(root)
+    return _store
+
+
+def store_root():
+    return _store.root if _store is not None else None
+
+
+def invalidate_plans():
+    """Svuota la cache dei piani (es. dopo il salvataggio della calibrazione)."""
+    with _lock:
+        _plans.clear()
@@ -0,0 +1,123 @@
+"""Ridimensionamento del design condiviso tra i template di uno stesso batch.
+
+I template di una categoria chiedono spesso la stessa faccia (stesso ritaglio,
+stessa dimensione o quasi): il risultato e il livello intermedio ridotto
+vengono calcolati una sola volta per design.
+"""
+from collections import OrderedDict
+
+from PIL import Image
+
+from mockup_engine.ingest import DEFAULT_LIMITS, close_design, decode_design, inspect_design
+
+# Come reducing_gap di Pillow: il passo intero con Image.reduce si ferma a
+# 3x la dimensione finale, poi LANCZOS. A 3.0 il risultato non si distingue
+# da un LANCZOS diretto dalla risoluzione piena.
+REDUCING_GAP = 3.0
+MAX_ENTRIES = 16
+
+
+def open_proxy(fp, max_side):
+    """Apre il design ridotto a circa 2*max_side per le anteprime.
+
+    Sui JPEG draft() decodifica il file già in scala 1/2, 1/4 o 1/8 invece che
+    alla risoluzione di stampa; oltre il budget di ingest solleva DesignError.
+    """
+    img = inspect_design(fp, faces=[(2 * max_side, 2 * max_side)])
+    if img.mode in ('1', 'P'):
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    img.thumbnail((2 * max_side, 2 * max_side), Image.LANCZOS)
+    return img
+
+
+class CoverResampler:
+    """Cache dei ridimensionamenti di un design, chiave (box di ritaglio, dimensione)."""
+
+    def __init__(self, cover_pil):
+        if cover_pil.mode in ('1', 'P'):
+            has_alpha = cover_pil.mode == 'P' and 'transparency' in cover_pil.info
+            cover_pil = cover_pil.convert('RGBA' if has_alpha else 'RGB')
+        self.image = cover_pil
+        self._sized = OrderedDict()
+        self._reduced = OrderedDict()
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        while len(cache) > MAX_ENTRIES:
+            cache.popitem(last=False)
+        return value
+
+    def _source(self, box, size):
+        """Ritaglio del design già ridotto di un fattore intero, se conviene."""
+        bw, bh = box[2] - box[0], box[3] - box[1]
+        factor = int(min(bw / size[0], bh / size[1]) / REDUCING_GAP)
+        if factor < 2:
+            return self.image.crop(box) if box != (0, 0) + self.image.size else self.image
+        key = (box, factor)
+        reduced = self._reduced.get(key)
+        if reduced is None:
+            reduced = self._remember(self._reduced, key, self.image.reduce(factor, box=box))
+        else:
+            self._reduced.move_to_end(key)
+        return reduced
+
+    def resize(self, size, box=None):
+        """Equivale a cover.crop(box).resize(size, LANCZOS), calcolato una volta sola."""
+        box = tuple(box) if box is not None else (0, 0) + self.image.size
+        key = (box, tuple(size))
+        res = self._sized.get(key)
+        if res is not None:
+            self._sized.move_to_end(key)
+            return res
+        res = self._source(box, size).resize(size, Image.LANCZOS)
+        return self._remember(self._sized, key, res)
+
+
+class DesignSource:
+    """Un design del batch, decodificato una volta sola alla scala della faccia più grande.
+
+    faces sono le (larghezza, altezza) delle facce di tutti i template in cui
+    finirà il design: la scala di draft le copre tutte, così il file si legge
+    una volta per design anche quando le facce sono diverse. Il risultato di una
+    coppia dipende quindi dalle altre facce: chi ne fa una chiave di results
+    vi include size. mode="RGB" scarta l'alpha prima del resize, per i motori
+    che non lo usano (V4).
+    """
+
+    def __init__(self, fp, name=None, faces=(), limits=DEFAULT_LIMITS, mode=None):
+        self.fp = fp
+        self.name = name
+        self.faces = list(faces)
+        self.limits = limits
+        self.mode = mode
+        self._size = None
+        self._resampler = None
+
+    def _inspect(self):
+        if hasattr(self.fp, "seek"):
+            self.fp.seek(0)
+        return inspect_design(self.fp, self.name, self.faces, self.limits)
+
+    @property
+    def size(self):
+        """Dimensione del design decodificato; la prima volta legge solo l'header."""
+        if self._size is None:
+            img = self._inspect()
+            close_design(img)
+            self._size = img.size
+        return self._size
+
+    def resampler(self):
+        """CoverResampler del design, decodificato alla prima chiamata."""
+        if self._resampler is None:
+            img = self._inspect()
+            design = decode_design(img, self.name)
+            if self.mode is not None and design.mode != self.mode:
+                design = design.convert(self.mode)
+            self._size = img.size
+            self._resampler = CoverResampler(design)
+        return self._resampler
@@ -0,0 +1,145 @@
+"""Cache su disco dei file generati, indirizzata per contenuto.
+
+La chiave di una coppia è l'hash di tutto ciò che ne determina i byte: hash
+del design, hash del template, parametri del motore (coordinate e offset,
+oppure raggio della sfumatura) e impostazioni di codifica. Rilanciare un
+batch dopo aver ricalibrato un template rigenera solo le coppie di quel
+template; le altre escono dalla cache già codificate.
+
+    <root>/<prime due cifre della chiave>/<chiave>.<ext>
+
+L'ordine LRU è la data di modifica dei file (aggiornata a ogni lettura);
+oltre il budget si eliminano i più vecchi fino a EVICT_TO del budget.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from mockup_engine.fsutil import TMP_PREFIX, atomic_write
+
+DEFAULT_DIRNAME = ".result_cache"
+DEFAULT_BUDGET = 2 * 1024 * 1024 * 1024
+EVICT_TO = 0.9
+EXTS = (".jpg", ".png", ".webp")
+
+# da incrementare quando cambia l'output del motore a parità di parametri
+VERSION = 2
+
+
+def result_key(design_digest, template_digest, params, encoder):
+    """Chiave di una coppia; params e encoder devono avere un repr stabile."""
+    raw = repr((VERSION, design_digest, template_digest, params, encoder))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def map_params(maps, t_name):
+    """Coordinate del template in forma confrontabile (None: faccia rilevata in automatico)."""
+    d = (maps or {}).get(t_name)
+    return json.dumps(d, sort_keys=True) if d is not None else None
+
+
+class ResultCache:
+    """File codificati per chiave, con budget in byte; hits/misses contano le richieste di questa istanza."""
+
+    def __init__(self, root=DEFAULT_DIRNAME, budget=DEFAULT_BUDGET):
+        self.root = root
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self._used = None  # byte su disco, calcolati al primo put
+        self._lock = threading.Lock()
+
+    def find(self, key):
+        """Estensione del file in cache per key, None se manca; lo segna come usato di recente."""
+        for ext in EXTS:
+            try:
+                os.utime(self._path(key, ext))
+            except OSError:
+                continue
+            return ext
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def read(self, key, ext):
+        """Byte del file trovato da find(), None se nel frattempo è stato eliminato.
+
+        Il riuso si conta qui, a lettura riuscita: un file sparito dopo find() va rigenerato.
+        """
+        try:
+            with open(self._path(key, ext), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, ext, data):
+        """Salva il file; gli errori di I/O non interrompono il batch."""
+        path = self._path(key, ext)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data)
+        except OSError:
+            return False
+        with self._lock:
+            if self._used is None:
+                self._used = sum(size for _, size, _ in self._entries())
+            else:
+                self._used += len(data)
+            if self._used > self.budget:
+                self._evict()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            self._used = 0
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def _entries(self):
+        """(path, byte, mtime) di tutti i file in cache."""
+        entries = []
+        try:
+            shards = [e for e in os.scandir(self.root) if e.is_dir()]
+        except OSError:
+            return entries
+        for shard in shards:
+            try:
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and not entry.name.startswith(TMP_PREFIX):
+                        st = entry.stat()
+                        entries.append((entry.path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self):
+        # lo stato vero è il disco: altri processi possono aver scritto o cancellato
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        used = sum(size for _, size, _ in entries)
+        target = self.budget * EVICT_TO
+        for path, size, _ in entries:
+            if used <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            used -= size
+        self._used = used
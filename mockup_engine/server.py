@@ -0,0 +1,459 @@
+"""API HTTP locale per i mockup su richiesta, accanto all'app e senza Streamlit.
+
+    python -m mockup_engine.server --port 8502 --workers 2
+
+    POST /render?templates=20x20-crea la tua grafica.jpg,30x30-crea la tua grafica.jpg
+         corpo: i byte del design (JPEG, PNG, TIFF, WebP)
+    GET  /templates   template disponibili, con categoria e dimensioni
+    GET  /metrics     richieste, latenza (percentili), throughput e tempi per stadio
+    GET  /health
+
+Parametri di /render: templates (separati da virgola, ripetibile), name (nome
+del design nei file), width (anteprima ridotta a quella larghezza), format:
+json (default, immagini in base64), zip, oppure image per un solo template.
+
+Stesso motore (composite_v3_fixed), stesse coordinate (template_coordinates.json,
+riletto quando cambia) e stessi box automatici di app.py. I piani dei template
+si calcolano all'avvio e restano in memoria tra una richiesta e l'altra. I
+render girano su un pool di thread limitato (numpy, OpenCV e Pillow rilasciano
+il GIL): oltre workers + max_queue richieste il server risponde 503 con
+Retry-After invece di accodare senza limite. Nessun servizio esterno.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PIL import Image
+
+from mockup_engine import plans, timing
+from mockup_engine.batch import DEFAULT_WORKERS, design_base_name, output_name
+from mockup_engine.catalog import TemplateLibrary
+from mockup_engine.compositor import composite_v3_fixed, face_size, plan_v3
+from mockup_engine.coords import AutoRegions
+from mockup_engine.encode import DEFAULT_SETTINGS, EncoderSettings, encode_result
+from mockup_engine.ingest import DEFAULT_LIMITS, DesignError, DesignLimits
+from mockup_engine.resample import DesignSource
+from mockup_engine.results import map_params, result_key
+from mockup_engine.timing import StageTimer
+
+DEFAULT_PORT = 8502
+DEFAULT_QUEUE = 16
+MAX_BODY = 64 * 1024 * 1024
+MAX_TEMPLATES = 8     # template per richiesta
+LATENCY_WINDOW = 1024  # richieste recenti su cui si calcolano i percentili
+THROUGHPUT_WINDOW = 60.0
+RETRY_AFTER = 1
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+
+class RequestError(Exception):
+    """Errore della richiesta: status HTTP e messaggio per il client."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Busy(Exception):
+    """Pool e coda pieni."""
+
+
+class Metrics:
+    """Contatori, latenze recenti e tempi per stadio delle richieste di render."""
+
+    def __init__(self, keep=LATENCY_WINDOW):
+        self.started = time.time()
+        self.timer = StageTimer()
+        self.counts = {"ok": 0, "client_error": 0, "error": 0, "rejected": 0}
+        self.images = 0
+        self.waiting = 0  # accettate, in attesa di un thread del pool
+        self.running = 0
+        self._recent = deque(maxlen=keep)  # (fine, secondi, immagini)
+        self._lock = threading.Lock()
+
+    def add(self, key, seconds=None, images=0):
+        with self._lock:
+            self.counts[key] += 1
+            if key == "ok":
+                self.images += images
+                self._recent.append((time.time(), seconds, images))
+
+    def moved(self, waiting=0, running=0):
+        with self._lock:
+            self.waiting += waiting
+            self.running += running
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            recent = list(self._recent)
+            out = {"uptime_s": round(now - self.started, 1), "requests": dict(self.counts),
+                   "images": self.images, "waiting": self.waiting, "running": self.running}
+        if recent:
+            ms = np.array([r[1] for r in recent]) * 1000.0
+            out["latency_ms"] = {"n": int(ms.size), "mean": round(float(ms.mean()), 2),
+                                 "p50": round(float(np.percentile(ms, 50)), 2),
+                                 "p90": round(float(np.percentile(ms, 90)), 2),
+                                 "p99": round(float(np.percentile(ms, 99)), 2),
+                                 "max": round(float(ms.max()), 2)}
+        else:
+            out["latency_ms"] = None
+        # la finestra non va oltre l'avvio né oltre le richieste ancora nel deque
+        window = min(THROUGHPUT_WINDOW, now - self.started)
+        if len(recent) == self._recent.maxlen:
+            window = min(window, now - recent[0][0])
+        last = [r for r in recent if r[0] >= now - window]
+        window = max(window, 1e-3)
+        out["throughput"] = {"window_s": round(window, 1), "requests_per_s": round(len(last) / window, 3),
+                             "images_per_s": round(sum(r[2] for r in last) / window, 3)}
+        out["stages"] = self.timer.rows()
+        return out
+
+
+class RenderService:
+    """Render su richiesta di un design sui template indicati, con piani caldi e pool limitato.
+
+    cache (results.ResultCache) riusa le immagini già generate per lo stesso
+    design, template, coordinate e codifica (per esempio lo stesso file
+    caricato di nuovo).
+    """
+
+    def __init__(self, templates_dir="templates", coords_path="template_coordinates.json", auto_path=None,
+                 workers=DEFAULT_WORKERS, max_queue=DEFAULT_QUEUE, encoder=DEFAULT_SETTINGS, limits=DEFAULT_LIMITS,
+                 cache=None, max_templates=MAX_TEMPLATES):
+        self.library = TemplateLibrary(templates_dir)
+        self.coords_path = coords_path
+        self.auto = AutoRegions(auto_path) if auto_path else None
+        self.workers = workers
+        self.encoder = encoder
+        self.limits = limits
+        self.cache = cache
+        self.max_templates = max_templates
+        self.metrics = Metrics()
+        self._maps = ({}, None)  # (coordinate, mtime_ns del file)
+        self._maps_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="mockup-render")
+        self.library.index()
+
+    def maps(self):
+        """Coordinate calibrate, rilette solo quando il file cambia."""
+        try:
+            mtime = os.stat(self.coords_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._maps_lock:
+            maps, seen = self._maps
+            if mtime != seen:
+                try:
+                    with open(self.coords_path) as f:
+                        maps = json.load(f)
+                except (OSError, ValueError):
+                    maps = {}
+                self._maps = (maps, mtime)
+        return maps
+
+    def templates(self):
+        lib = self.library.index()
+        return [{"name": info.name, "category": cat, "size": list(info.size)}
+                for cat, infos in lib.items() for info in infos.values()]
+
+    def warm(self, names=None):
+        """Calcola (o legge dallo store) i piani dei template; restituisce quanti."""
+        maps = self.maps()
+        self.library.index()
+        names = names or [t["name"] for t in self.templates()]
+        for t_name in names:
+            info = self.library.info(t_name)
+            if info is None:
+                continue
+            with Image.open(info.path) as tmpl:
+                plan_v3(tmpl, t_name, maps, auto=self.auto)
+        return len(names)
+
+    def submit(self, data, names, design_name="design", width=None):
+        """Future con [(template, nome_file, estensione, bytes)]; Busy se pool e coda sono pieni."""
+        if not names:
+            raise RequestError(400, "nessun template indicato")
+        if len(names) > self.max_templates:
+            raise RequestError(400, f"al massimo {self.max_templates} template per richiesta")
+        self.library.index()
+        missing = [t for t in names if self.library.info(t) is None]
+        if missing:
+            raise RequestError(404, f"template non trovati: {', '.join(missing)}")
+        if not self._slots.acquire(blocking=False):
+            self.metrics.add("rejected")
+            raise Busy()
+        self.metrics.moved(waiting=1)
+        try:
+            future = self._pool.submit(self._run, data, names, design_name, width)
+        except BaseException:
+            self.metrics.moved(waiting=-1)
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, data, names, design_name, width):
+        self.metrics.moved(waiting=-1, running=1)
+        try:
+            with self.metrics.timer.active(design_name):
+                return self._render(data, names, design_name, width)
+        finally:
+            self.metrics.moved(running=-1)
+
+    def _render(self, data, names, design_name, width):
+        maps = self.maps()
+        base_name = design_base_name(design_name)
+        infos = [(t_name, self.library.info(t_name)) for t_name in names]
+        # template aperti solo per l'header: con i piani caldi i pixel non si decodificano.
+        # Il design si decodifica una volta, alla scala della faccia più grande.
+        faces = []
+        with timing.stage("plan"):
+            for t_name, info in infos:
+                with Image.open(info.path) as tmpl:
+                    faces.append(face_size(plan_v3(tmpl, t_name, maps, proxy_width=width, auto=self.auto)))
+        source = DesignSource(io.BytesIO(data), design_name, faces, self.limits)
+        digest = hashlib.sha1(data).hexdigest() if self.cache is not None else None
+        out = []
+        for t_name, info in infos:
+            key = None
+            if self.cache is not None:
+                # la scala di decodifica dipende da tutte le facce della richiesta
+                params = ("v3", map_params(maps, t_name), source.size) + ((width,) if width else ())
+                key = result_key(digest, info.digest, params, self.encoder)
+                ext = self.cache.find(key)
+                cached = self.cache.read(key, ext) if ext is not None else None
+                if cached is not None:
+                    out.append((t_name, output_name(t_name, base_name, ext), ext, cached))
+                    continue
+            with Image.open(info.path) as tmpl:
+                with timing.stage("decode"):
+                    resampler = source.resampler()
+                res = composite_v3_fixed(tmpl, resampler.image, t_name, maps=maps, resampler=resampler,
+                                         proxy_width=width, auto=self.auto)
+            ext, encoded = encode_result(res, t_name, self.encoder)
+            if key is not None:
+                self.cache.put(key, ext, encoded)
+            out.append((t_name, output_name(t_name, base_name, ext), ext, encoded))
+        return out
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "mockup-engine"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._json(200, {"status": "ok"})
+        elif path == "/metrics":
+            self._json(200, self.service.metrics.snapshot())
+        elif path == "/templates":
+            self._json(200, {"templates": self.service.templates()})
+        else:
+            self._json(404, {"error": f"percorso sconosciuto: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            self._json(404, {"error": f"percorso sconosciuto: {url.path}"})
+            return
+        start = time.perf_counter()
+        metrics = self.service.metrics
+        try:
+            query = parse_qs(url.query)
+            names = [t.strip() for v in query.get("templates", []) + query.get("template", [])
+                     for t in v.split(",") if t.strip()]
+            fmt = query.get("format", ["json"])[0]
+            if fmt not in ("json", "zip", "image"):
+                raise RequestError(400, f"format sconosciuto: {fmt}")
+            if fmt == "image" and len(names) != 1:
+                raise RequestError(400, "format=image richiede un solo template")
+            width = _int_param(query, "width")
+            design_name = query.get("name", ["design"])[0]
+            data = self._body()
+            images = self.service.submit(data, names, design_name, width).result()
+        except Busy:
+            self.send_response(503)
+            self.send_header("Retry-After", str(RETRY_AFTER))
+            self._send_json({"error": "server occupato, riprova"})
+            return
+        except RequestError as e:
+            metrics.add("client_error")
+            self._json(e.status, {"error": str(e)})
+            return
+        except DesignError as e:
+            metrics.add("client_error")
+            self._json(422, {"error": str(e)})
+            return
+        except Exception as e:
+            metrics.add("error")
+            self._json(500, {"error": str(e) or type(e).__name__})
+            return
+
+        seconds = time.perf_counter() - start
+        metrics.add("ok", seconds, len(images))
+        if fmt == "image":
+            _, _, ext, data = images[0]
+            self._send(200, CONTENT_TYPES[ext], data)
+        elif fmt == "zip":
+            from mockup_engine.output import open_sink
+
+            with open_sink("zip") as sink:
+                for _, arcname, _, data in images:
+                    sink.add(arcname, data)
+            self._send(200, "application/zip", sink.reader()())
+        else:
+            self._json(200, {"ms": round(seconds * 1000, 1), "images": [
+                {"template": t_name, "name": arcname, "content_type": CONTENT_TYPES[ext],
+                 "data": base64.b64encode(data).decode("ascii")} for t_name, arcname, ext, data in images]})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _body(self):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise RequestError(411, "manca Content-Length")
+        try:
+            length = int(length)
+        except ValueError:
+            raise RequestError(400, "Content-Length non valido") from None
+        if length <= 0:
+            raise RequestError(400, "corpo vuoto: serve il file del design")
+        if length > self.server.max_body:
+            # il corpo non si legge: la connessione va chiusa
+            self.close_connection = True
+            raise RequestError(413, f"design oltre {self.server.max_body // 2**20} MB")
+        return self.rfile.read(length)
+
+    def _json(self, status, payload):
+        self.send_response(status)
+        self._send_json(payload)
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _int_param(query, name):
+    value = query.get(name, [None])[0]
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise RequestError(400, f"{name} deve essere un intero") from None
+    if value <= 0:
+        raise RequestError(400, f"{name} deve essere positivo")
+    return value
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, max_body=MAX_BODY, quiet=False):
+    """ThreadingHTTPServer collegato a service; port=0 sceglie una porta libera (server_address)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.service = service
+    server.max_body = max_body
+    server.quiet = quiet
+    return server
+
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="python -m mockup_engine.server", description="API HTTP locale dei mockup.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="render in parallelo (thread)")
+    p.add_argument("--max-queue", type=int, default=DEFAULT_QUEUE,
+                   help="richieste in attesa oltre i worker; poi 503")
+    p.add_argument("--max-templates", type=int, default=MAX_TEMPLATES, help="template per richiesta")
+    p.add_argument("--max-body-mb", type=int, default=MAX_BODY // 2**20, help="dimensione massima del design caricato")
+    p.add_argument("--templates-dir", default="templates")
+    p.add_argument("--coords", default="template_coordinates.json", help="coordinate calibrate dei template")
+    p.add_argument("--plan-cache", default=None, metavar="DIR",
+                   help="piani dei template su disco (default: .template_cache accanto a --templates-dir)")
+    p.add_argument("--no-plan-cache", action="store_true", help="non leggere né scrivere i piani su disco")
+    p.add_argument("--result-cache", default=None, metavar="DIR",
+                   help="riusa le immagini già generate con gli stessi parametri, salvate in DIR")
+    p.add_argument("--auto-regions", default=None,
+                   help="file dei box rilevati in automatico (default: template_auto_regions.json accanto a --coords)")
+    p.add_argument("--no-warm", action="store_true", help="non calcolare i piani all'avvio")
+    lim = p.add_argument_group("budget dei design")
+    lim.add_argument("--max-megapixels", type=float, default=100,
+                     help="pixel decodificati per design, dopo la riduzione dei JPEG")
+    lim.add_argument("--max-memory-mb", type=int, default=768, help="memoria stimata per decodificare un design")
+    enc = p.add_argument_group("codifica")
+    enc.add_argument("--jpeg-quality", type=int, default=95)
+    enc.add_argument("--webp", action="store_true", help="risponde in WebP al posto di JPEG e PNG")
+    enc.add_argument("--webp-quality", type=int, default=90)
+    p.add_argument("-q", "--quiet", action="store_true", help="non stampa una riga per richiesta")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from mockup_engine.store import default_root
+
+    if not args.no_plan_cache:
+        plans.use_store(args.plan_cache or default_root(args.templates_dir))
+    auto_path = args.auto_regions or os.path.join(os.path.dirname(os.path.abspath(args.coords)),
+                                                  "template_auto_regions.json")
+    cache = None
+    if args.result_cache:
+        from mockup_engine.results import ResultCache
+
+        cache = ResultCache(args.result_cache)
+    service = RenderService(
+        args.templates_dir, args.coords, auto_path, workers=max(1, args.workers), max_queue=max(0, args.max_queue),
+        encoder=EncoderSettings(jpeg_quality=args.jpeg_quality, webp=args.webp, webp_quality=args.webp_quality),
+        limits=DesignLimits(int(args.max_megapixels * 1_000_000), args.max_memory_mb * 1024 * 1024),
+        cache=cache, max_templates=args.max_templates)
+    if not args.no_warm:
+        start = time.perf_counter()
+        count = service.warm()
+        print(f"piani pronti: {count} template in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    server = make_server(service, args.host, args.port, args.max_body_mb * 2**20, args.quiet)
+    host, port = server.server_address[:2]
+    print(f"in ascolto su http://{host}:{port} ({service.workers} worker)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Motore V4: composizione con bordi sfumati (calibratore)."""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from mockup_engine import blend, detect, plans
+from mockup_engine.resample import CoverResampler
+
+
+MAX_MASKS = 32
+
+_masks = OrderedDict()
+_masks_lock = threading.Lock()
+
+
+def _edge_line(n, blur_radius):
+    # come il rettangolo [0, 0, w, h] del disegno originale: bordo nero di
+    # int(r/2)+1 pixel, sul lato finale uno in meno perché cade fuori dall'immagine
+    k = int(blur_radius/2) + 1
+    line = np.full(n, 255, np.uint8)
+    line[:k] = 0
+    line[max(n - k + 1, 0):] = 0
+    return line
+
+
+def _blur(a, blur_radius):
+    return np.asarray(Image.fromarray(a).filter(ImageFilter.GaussianBlur(radius=blur_radius)))
+
+
+def _span(values):
+    """(inizio, fine) del tratto a 255; (0, 0) se non c'è."""
+    full = np.flatnonzero(values == 255)
+    if full.size == 0:
+        return 0, 0
+    return int(full[0]), int(full[-1]) + 1
+
+
+class FeatherMask:
+    """Maschera sfumata calcolata per profili 1-D, identica a quella di PIL sull'immagine intera.
+
+    Il GaussianBlur di PIL passa prima sulle righe, poi sulle colonne: dopo
+    il primo passaggio la colonna x vale p[x] (o 0 nelle fasce nere), quindi
+    il risultato dipende solo da p[x] e basta sfocare una colonna per ogni
+    valore distinto di p. inner è il rettangolo (x0, y0, x1, y1) dove la
+    maschera vale 255; fuori ci sono solo le fasce di bordo.
+    """
+
+    def __init__(self, size, blur_radius):
+        w, h = size
+        self.size = size
+        p = _blur(_edge_line(w, blur_radius)[None, :], blur_radius)[0]
+        rows = _edge_line(h, blur_radius) // 255
+        levels, self._col_level = np.unique(p, return_inverse=True)
+        # _table[i, y]: colonna sfocata per il livello levels[i]
+        self._table = np.stack([_blur((v * rows).astype(np.uint8)[:, None], blur_radius)[:, 0]
+                                for v in levels])
+        x0, x1 = _span(p)
+        y0, y1 = _span(self._table[-1]) if levels[-1] == 255 else (0, 0)
+        self.inner = (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else (0, 0, 0, 0)
+
+    def values(self, ys=slice(None), xs=slice(None)):
+        """Maschera uint8 nella finestra (ys, xs)."""
+        return self._table[self._col_level[xs]][:, ys].T
+
+    def bands(self):
+        """Fasce (ys, xs) che coprono tutto il bordo fuori da inner, senza sovrapposizioni."""
+        w, h = self.size
+        x0, y0, x1, y1 = self.inner
+        if x1 == x0:
+            return [(slice(0, h), slice(0, w))]
+        out = [(slice(0, y0), slice(0, w)), (slice(y1, h), slice(0, w)),
+               (slice(y0, y1), slice(0, x0)), (slice(y0, y1), slice(x1, w))]
+        return [(ys, xs) for ys, xs in out if ys.stop > ys.start and xs.stop > xs.start]
+
+
+def feather_mask(size, blur_radius):
+    """FeatherMask per (size, blur_radius), da una cache LRU."""
+    key = (tuple(size), blur_radius)
+    with _masks_lock:
+        mask = _masks.get(key)
+        if mask is not None:
+            _masks.move_to_end(key)
+            return mask
+    mask = FeatherMask(key[0], blur_radius)
+    with _masks_lock:
+        _masks[key] = mask
+        while len(_masks) > MAX_MASKS:
+            _masks.popitem(last=False)
+    return mask
+
+
+def get_feathered_mask(size, blur_radius):
+    """Crea una maschera con i bordi sfumati variabile."""
+    if blur_radius == 0:
+        return Image.new("L", size, 255)
+    return Image.fromarray(np.ascontiguousarray(feather_mask(size, blur_radius).values()))
+
+def build_plan_v4(tmpl_pil, t_name, maps):
+    tmpl_rgb = plans.load_base(tmpl_pil, False)
+    tmpl_gray = np.array(tmpl_pil.convert('L')).astype(np.float32)
+    h, w, _ = tmpl_rgb.shape
+
+    if t_name in maps:
+        x1, y1, tw, th = plans.face_box(maps[t_name], 0, w, h)
+        face_val = 255.0
+    else:
+        corners = [tmpl_gray[3,3], tmpl_gray[3,w-3], tmpl_gray[h-3,3], tmpl_gray[h-3,w-3]]
+        reg = detect.find_book_region_auto(tmpl_gray, np.median(corners))
+        if not reg: return None
+        x1, y1 = reg['bx1'], reg['by1']
+        tw, th = reg['bx2'] - x1 + 1, reg['by2'] - y1 + 1
+        face_val = reg['face_val']
+
+    shadow_map = np.clip(tmpl_gray[y1:y1+th, x1:x1+tw] / np.float32(face_val), 0, 1.0)
+    return plans.TemplatePlan((int(x1), int(y1), int(tw), int(th)), shadow_map, tmpl_rgb, "stretch")
+
+class SoftFace:
+    """Parte di process_mockup che non dipende dal raggio: piano e faccia già ombreggiata.
+
+    Per l'anteprima va tenuta per la coppia (design, template) corrente: al
+    cambio del raggio si rifà solo la sfumatura (feather_face).
+    """
+
+    def __init__(self, plan, face, scale=1.0):
+        self.plan = plan
+        self.face = face
+        self.scale = scale  # lato del piano / lato del template (proxy < 1)
+
+
+def plan_v4(tmpl_pil, t_name, maps=None, proxy_width=None):
+    """Piano del template per il motore V4; None se il rilevamento della faccia fallisce."""
+    maps = maps or {}
+    params = ("v4", t_name, maps.get(t_name))
+    return plans.get_plan(tmpl_pil, params, lambda t: build_plan_v4(t, t_name, maps), proxy_width)
+
+
+def face_sizes(templates, maps=None):
+    """{nome: (larghezza, altezza)} delle facce per il motore V4; mancano i template senza faccia rilevata."""
+    sizes = {}
+    for t_name, tmpl in templates.items():
+        plan = plan_v4(tmpl, t_name, maps)
+        if plan is not None:
+            sizes[t_name] = plan.box[2:]
+    return sizes
+
+
+def prepare_face(tmpl_pil, cover_pil, t_name, resampler=None, maps=None, proxy_width=None):
+    """SoftFace per la coppia; None se il rilevamento della faccia fallisce.
+
+    Con proxy_width il piano e il resize sono ridotti a quella larghezza.
+    """
+    plan = plan_v4(tmpl_pil, t_name, maps, proxy_width)
+    if plan is None: return None
+    x1, y1, tw, th = plan.box
+    if resampler is None:
+        resampler = CoverResampler(cover_pil.convert('RGB'))
+
+    c_res = np.array(resampler.resize((tw, th)))
+    face = blend.shade(c_res, plan.shadow_rgb, out=c_res)
+    face.flags.writeable = False
+    return SoftFace(plan, face, plan.size[0] / tmpl_pil.size[0])
+
+
+def feather_face(soft_face, blur_rad):
+    """Compone la faccia sul template con bordi sfumati di blur_rad pixel (del template a piena risoluzione)."""
+    plan, cover_applied = soft_face.plan, soft_face.face
+    x1, y1, tw, th = plan.box
+    blur_rad = blur_rad * soft_face.scale
+
+    # Applicazione sfumatura dinamica: la faccia si compone a parte, la base
+    # condivisa si copia una volta sola nell'immagine di uscita
+    face = cover_applied
+    if blur_rad != 0:
+        # la maschera vale 255 all'interno: si fondono solo le fasce di bordo
+        mask = feather_mask((tw, th), blur_rad)
+        base_area = plan.rgb[y1:y1+th, x1:x1+tw]
+        face = np.array(cover_applied)
+        for ys, xs in mask.bands():
+            weights = mask.values(ys, xs).astype(np.float32) / 255.0
+            face[ys, xs] = blend.feather(np.ascontiguousarray(cover_applied[ys, xs]),
+                                         np.ascontiguousarray(base_area[ys, xs]), weights)
+
+    result = Image.fromarray(np.asarray(plan.base))
+    result.paste(Image.fromarray(face), (x1, y1))
+    return result
+
+
+def process_mockup(tmpl_pil, cover_pil, t_name, blur_rad, resampler=None, maps=None):
+    """Applica il design con le ombre del template e bordi sfumati di blur_rad pixel.
+
+    maps associa il nome del template a (x, y, w, h) in percentuale; senza voce
+    la faccia è rilevata in automatico. None se il rilevamento fallisce.
+    """
+    soft_face = prepare_face(tmpl_pil, cover_pil, t_name, resampler, maps)
+    if soft_face is None: return None
+    return feather_face(soft_face, blur_rad)
@@ -0,0 +1,101 @@
+"""Piani dei template su disco, in file .npy mappati in memoria.
+
+Struttura, accanto alla cartella dei template (di solito .template_cache/):
+
+    <hash del template>/rgb.npy            base RGB (template senza alpha)
+    <hash del template>/rgba.npy           base RGBA dei template con alpha
+    <hash del template>/<chiave>.shadow.npy  ombre della faccia per un set di parametri
+    <hash del template>/<chiave>.map_x.npy   tabelle di remap e maschera delle facce
+    <hash del template>/<chiave>.map_y.npy   in prospettiva (solo coordinate "quad")
+    <hash del template>/<chiave>.mask.npy
+    <hash del template>/<chiave>.json        box e fit; scritto per ultimo
+
+La chiave dipende dai parametri del piano (motore, coordinate, offset): una
+ricalibrazione o un template modificato producono file nuovi, costruiti alla
+prima richiesta. Ogni processo (sessione Streamlit, worker del batch, CLI)
+apre i file in sola lettura con np.load(mmap_mode='r'): nessuna copia, e le
+pagine sono condivise tra i processi tramite la page cache.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from mockup_engine.fsutil import atomic_write, write_json
+from mockup_engine.plans import TemplatePlan
+from mockup_engine.warp import FaceWarp
+
+DEFAULT_DIRNAME = ".template_cache"
+WARP_PARTS = ("map_x", "map_y", "mask")
+
+
+def default_root(templates_dir="templates"):
+    """Cartella dello store accanto a quella dei template."""
+    return os.path.join(os.path.dirname(os.path.abspath(templates_dir)), DEFAULT_DIRNAME)
+
+
+def params_key(params):
+    return hashlib.sha1(repr(tuple(params)).encode("utf-8")).hexdigest()[:20]
+
+
+class PlanStore:
+    def __init__(self, root):
+        self.root = root
+
+    def load(self, digest, params):
+        """TemplatePlan mappato dal disco, None se manca o non è leggibile."""
+        folder = os.path.join(self.root, digest)
+        key = params_key(params)
+        try:
+            with open(os.path.join(folder, key + ".json")) as f:
+                meta = json.load(f)
+            base = np.load(os.path.join(folder, "rgba.npy" if meta["alpha"] else "rgb.npy"), mmap_mode="r")
+            shadow = np.load(os.path.join(folder, key + ".shadow.npy"), mmap_mode="r")
+            face_warp = None
+            if meta.get("warp"):
+                face_warp = FaceWarp(*(np.load(os.path.join(folder, f"{key}.{part}.npy"), mmap_mode="r")
+                                       for part in WARP_PARTS), tuple(meta["warp"]))
+        except (OSError, ValueError, KeyError):
+            return None
+        return TemplatePlan(tuple(meta["box"]), shadow, base, meta["fit"], face_warp)
+
+    def save(self, digest, params, plan):
+        """Scrive il piano; gli errori di I/O non interrompono il rendering."""
+        folder = os.path.join(self.root, digest)
+        key = params_key(params)
+        has_alpha = plan.alpha is not None
+        try:
+            os.makedirs(folder, exist_ok=True)
+            self._write_array(os.path.join(folder, "rgba.npy" if has_alpha else "rgb.npy"), plan.base)
+            self._write_array(os.path.join(folder, key + ".shadow.npy"), plan.shadow, replace=True)
+            meta = {"box": [int(v) for v in plan.box], "fit": plan.fit, "alpha": has_alpha}
+            if plan.warp is not None:
+                for part in WARP_PARTS:
+                    self._write_array(os.path.join(folder, f"{key}.{part}.npy"), getattr(plan.warp, part), replace=True)
+                meta["warp"] = list(plan.warp.face_size)
+            write_json(os.path.join(folder, key + ".json"), meta)
+        except OSError:
+            return False
+        return True
+
+    def prune(self, digests):
+        """Elimina le cartelle dei template che non sono più tra digests."""
+        keep = set(digests)
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return 0
+        removed = 0
+        for entry in entries:
+            if entry.is_dir() and entry.name not in keep:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def _write_array(self, path, arr, replace=False):
+        # la base è la stessa per tutti i parametri: si scrive solo la prima volta
+        if not replace and os.path.exists(path):
+            return
+        atomic_write(path, lambda f: np.save(f, np.ascontiguousarray(arr)))
@@ -0,0 +1,120 @@
+"""Tempi per stadio del rendering (decode, resize, ombre, incolla, encode, zip).
+
+Il motore misura i suoi stadi con `with timing.stage("resize"):`; senza un
+timer attivo lo stadio è un contesto vuoto, quindi la strumentazione può
+restare sempre accesa. Un timer si attiva con `with timer.active():`; il
+contesto (timer ed etichetta) segue il lavoro passato ad altri thread con
+contextvars.copy_context().
+"""
+import contextlib
+import contextvars
+import csv
+import heapq
+import io
+import json
+import threading
+import time
+
+KEEP_SLOWEST = 5
+
+_current = contextvars.ContextVar("mockup_timer", default=None)
+_null = contextlib.nullcontext()
+
+
+class StageTimer:
+    """Totali, conteggi e item più lenti per ogni stadio."""
+
+    def __init__(self, keep_slowest=KEEP_SLOWEST):
+        self.keep_slowest = keep_slowest
+        self.stages = {}  # nome -> [count, total_s, heap di (secondi, item)]
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.wall = None
+
+    def add(self, name, seconds, item=None):
+        with self._lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = [0, 0.0, []]
+            entry[0] += 1
+            entry[1] += seconds
+            self._keep(entry[2], seconds, item)
+
+    def _keep(self, slow, seconds, item):
+        record = (seconds, item or "")
+        if len(slow) < self.keep_slowest:
+            heapq.heappush(slow, record)
+        elif seconds > slow[0][0]:
+            heapq.heapreplace(slow, record)
+
+    @contextlib.contextmanager
+    def measure(self, name, item=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, item)
+
+    @contextlib.contextmanager
+    def active(self, item=None):
+        """Rende il timer quello corrente; item etichetta gli stadi misurati dentro."""
+        token = _current.set((self, item))
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def export(self):
+        """Dati grezzi, serializzabili (per rimandarli dai worker)."""
+        with self._lock:
+            return {name: [c, t, list(slow)] for name, (c, t, slow) in self.stages.items()}
+
+    def merge(self, raw):
+        with self._lock:
+            for name, (count, total, slow) in raw.items():
+                entry = self.stages.setdefault(name, [0, 0.0, []])
+                entry[0] += count
+                entry[1] += total
+                for seconds, item in slow:
+                    self._keep(entry[2], seconds, item)
+
+    def stop(self):
+        self.wall = time.perf_counter() - self.started
+
+    def rows(self):
+        """Una riga per stadio, ordinate per tempo totale."""
+        out = []
+        for name, (count, total, slow) in self.export().items():
+            worst = sorted(slow, reverse=True)
+            out.append({"stage": name, "count": count, "total_s": round(total, 4),
+                        "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+                        "max_ms": round(worst[0][0] * 1000, 3) if worst else 0.0,
+                        "slowest": [{"ms": round(s * 1000, 3), "item": item} for s, item in worst]})
+        return sorted(out, key=lambda r: r["total_s"], reverse=True)
+
+    def to_json(self):
+        return json.dumps({"wall_s": round(self.wall, 4) if self.wall is not None else None,
+                           "stages": self.rows()}, indent=2)
+
+    def to_csv(self):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["stage", "count", "total_s", "mean_ms", "max_ms", "slowest_item"])
+        for r in self.rows():
+            writer.writerow([r["stage"], r["count"], r["total_s"], r["mean_ms"], r["max_ms"],
+                             r["slowest"][0]["item"] if r["slowest"] else ""])
+        return buf.getvalue()
+
+
+def current():
+    active = _current.get()
+    return active[0] if active else None
+
+
+def stage(name):
+    """Contesto che misura lo stadio sul timer corrente, se c'è."""
+    active = _current.get()
+    if active is None:
+        return _null
+    timer, item = active
+    return timer.measure(name, item)
@@ -0,0 +1,78 @@
+"""Facce in prospettiva: quattro angoli invece del rettangolo.
+
+Per ogni template la trasformazione inversa (pixel del template -> pixel del
+design) viene calcolata una volta nel piano come tabelle per cv2.remap; il
+render è poi un solo remap sulla regione della faccia.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+
+@dataclass(eq=False)
+class FaceWarp:
+    map_x: np.ndarray   # float32 (th, tw): colonna del design per ogni pixel del box
+    map_y: np.ndarray   # float32 (th, tw): riga del design
+    mask: np.ndarray    # uint8 (th, tw): copertura del quadrilatero, bordi antialias
+    face_size: tuple    # (fw, fh) a cui ridimensionare il design
+
+
+def face_quad(quad, w, h):
+    """Angoli in percentuale (alto-sx, alto-dx, basso-dx, basso-sx) -> pixel float32."""
+    return np.array([(px * w / 100, py * h / 100) for px, py in quad], np.float32)
+
+
+def quad_box(corners, w, h):
+    """Box intero (x1, y1, tw, th) che contiene il quadrilatero, dentro il template."""
+    x1, y1 = np.floor(corners.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(corners.max(axis=0)).astype(int)
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+    return int(x1), int(y1), int(x2 - x1), int(y2 - y1)
+
+
+def build_warp(corners, box):
+    """Tabelle di remap e maschera del quadrilatero nel box."""
+    x1, y1, tw, th = box
+    tl, tr, br, bl = corners
+    # il design prende la misura media dei lati opposti
+    fw = max(1, int(round((np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2)))
+    fh = max(1, int(round((np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2)))
+    # i bordi del quadrilatero sono i bordi esterni dei pixel del design
+    src = np.array([(-0.5, -0.5), (fw - 0.5, -0.5), (fw - 0.5, fh - 0.5), (-0.5, fh - 0.5)], np.float32)
+    # centri dei pixel del box, in coordinate del template
+    dst = corners - np.float32((x1 + 0.5, y1 + 0.5))
+    inv = cv2.getPerspectiveTransform(dst, src)
+    xs, ys = np.meshgrid(np.arange(tw, dtype=np.float32), np.arange(th, dtype=np.float32))
+    pts = cv2.perspectiveTransform(np.dstack([xs, ys]), inv)
+    map_x = np.ascontiguousarray(pts[..., 0])
+    map_y = np.ascontiguousarray(pts[..., 1])
+    mask = cv2.remap(np.full((fh, fw), 255, np.uint8), map_x, map_y, cv2.INTER_LINEAR,
+                     borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    for arr in (map_x, map_y, mask):
+        arr.flags.writeable = False
+    return FaceWarp(map_x, map_y, mask, (fw, fh))
+
+
+def scale_warp(warp, size):
+    """FaceWarp per un box ridotto a size (anteprime)."""
+    tw, th = warp.mask.shape[1], warp.mask.shape[0]
+    fx, fy = size[0] / tw, size[1] / th
+    fw, fh = max(1, round(warp.face_size[0] * fx)), max(1, round(warp.face_size[1] * fy))
+    sx, sy = fw / warp.face_size[0], fh / warp.face_size[1]
+
+    def shrink(arr, scale, interp):
+        small = cv2.resize(np.asarray(arr), size, interpolation=interp)
+        if scale is not None:
+            small = (small + 0.5) * np.float32(scale) - np.float32(0.5)
+        small.flags.writeable = False
+        return small
+    return FaceWarp(shrink(warp.map_x, sx, cv2.INTER_LINEAR), shrink(warp.map_y, sy, cv2.INTER_LINEAR),
+                    shrink(warp.mask, None, cv2.INTER_AREA), (fw, fh))
+
+
+def apply_warp(warp, face, out=None):
+    """Deforma il design già ridimensionato a face_size sul box del piano."""
+    return cv2.remap(face, warp.map_x, warp.map_y, cv2.INTER_LINEAR, dst=out,
+                     borderMode=cv2.BORDER_REPLICATE)
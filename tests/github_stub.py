@@ -0,0 +1,235 @@
+"""Server locale che imita le API GitHub usate da mockup_engine.github e coords.
+
+Solo ciò che serve al tool: contents (elenco cartella, file con ETag, PUT),
+download dei file e Git Data API (blobs, trees, commits, ref). Il repository
+è in memoria: ogni commit è un dict {path: sha del blob}.
+
+    with GitHubStub({"templates/a.jpg": b"..."}) as stub:
+        gh = stub.repo()
+        sync_templates(gh)
+
+stub.requests registra (metodo, path) di ogni richiesta; stub.fail() fa
+fallire le prossime richieste che combaciano; stub.before_patch è chiamata
+prima di ogni aggiornamento del ref (per simulare un push concorrente).
+"""
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from mockup_engine.github import GitHubRepo, git_blob_sha
+
+REPO = "owner/mockups"
+BRANCH = "main"
+
+
+class GitHubStub:
+    def __init__(self, files=None, repo=REPO, branch=BRANCH):
+        self.repo_name = repo
+        self.branch = branch
+        self.blobs = {}    # sha -> bytes
+        self.trees = {}    # sha -> {path: sha del blob}
+        self.commits = {}  # sha -> {"tree", "parents", "message"}
+        self.requests = []
+        self.before_patch = None
+        self._failures = []  # [metodo, frammento del path, status, quante volte, corpo]
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.head = self._commit(self._tree({p: self._blob(d) for p, d in (files or {}).items()}), [], "init")
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.stub = self
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    # --- uso dai test ---
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def repo(self):
+        return GitHubRepo(self.repo_name, branch=self.branch, api_root=self.url)
+
+    def files(self, commit=None):
+        """{path: bytes} del commit (default: head del branch)."""
+        tree = self.trees[self.commits[commit or self.head]["tree"]]
+        return {path: self.blobs[sha] for path, sha in tree.items()}
+
+    def push(self, changes, message="push"):
+        """Commit diretto sul branch, come un push da un altro client; None in changes cancella."""
+        with self._lock:
+            tree = dict(self.trees[self.commits[self.head]["tree"]])
+            for path, data in changes.items():
+                if data is None:
+                    tree.pop(path, None)
+                else:
+                    tree[path] = self._blob(data)
+            self.head = self._commit(self._tree(tree), [self.head], message)
+        return self.head
+
+    def fail(self, method, fragment, status=500, times=1, body=None):
+        """Le prossime `times` richieste method con fragment nel path rispondono status.
+
+        body (bytes) sostituisce il JSON di errore, per esempio con una pagina HTML.
+        """
+        with self._lock:
+            self._failures.append([method, fragment, status, times, body])
+
+    def count(self, method, fragment=""):
+        return sum(1 for m, p in self.requests if m == method and fragment in p)
+
+    # --- stato interno ---
+
+    def _sha(self, kind):
+        self._counter += 1
+        return git_blob_sha(f"{kind}-{self._counter}".encode())
+
+    def _blob(self, data):
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def _tree(self, entries):
+        sha = self._sha("tree")
+        self.trees[sha] = entries
+        return sha
+
+    def _commit(self, tree, parents, message):
+        sha = self._sha("commit")
+        self.commits[sha] = {"tree": tree, "parents": parents, "message": message}
+        return sha
+
+    def _injected(self, method, path):
+        with self._lock:
+            for failure in self._failures:
+                if failure[0] == method and failure[1] in path and failure[3] > 0:
+                    failure[3] -= 1
+                    return failure[2], failure[4]
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def _dispatch(self, method):
+        stub = self.server.stub
+        path = unquote(urlsplit(self.path).path)
+        stub.requests.append((method, path))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        injected = stub._injected(method, path)
+        if injected is not None:
+            status, raw = injected
+            if raw is not None:
+                return self._send(status, raw, "text/html")
+            return self._json(status, {"message": "injected failure"})
+        prefix = f"/repos/{stub.repo_name}/"
+        if path.startswith("/raw/"):
+            return self._raw(stub, path[len("/raw/"):])
+        if not path.startswith(prefix):
+            return self._json(404, {"message": "Not Found"})
+        route = path[len(prefix):]
+        if route.startswith("contents/"):
+            return self._contents(stub, method, route[len("contents/"):], body)
+        if route.startswith("git/"):
+            return self._git(stub, method, route[len("git/"):], body)
+        return self._json(404, {"message": "Not Found"})
+
+    def _raw(self, stub, path):
+        data = stub.files().get(path)
+        if data is None:
+            return self._json(404, {"message": "Not Found"})
+        self._send(200, data)
+
+    def _send(self, status, data, content_type=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _contents(self, stub, method, path, body):
+        files = stub.files()
+        if method == "PUT":
+            current = files.get(path)
+            if current is not None and body.get("sha") != git_blob_sha(current):
+                return self._json(409, {"message": "sha mismatch"})
+            stub.push({path: base64.b64decode(body["content"])}, body.get("message", ""))
+            return self._json(200, {"content": {"path": path, "sha": git_blob_sha(stub.files()[path])}})
+        if path in files:
+            sha = git_blob_sha(files[path])
+            etag = f'"{sha}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            return self._json(200, {"name": path.rsplit("/", 1)[-1], "path": path, "sha": sha,
+                                    "content": base64.b64encode(files[path]).decode("ascii"),
+                                    "encoding": "base64"}, {"ETag": etag})
+        listing = [{"name": p[len(path) + 1:], "path": p, "sha": git_blob_sha(data), "type": "file",
+                    "download_url": f"{stub.url}/raw/{p}"}
+                   for p, data in sorted(files.items()) if p.startswith(path + "/") and "/" not in p[len(path) + 1:]]
+        if not listing:
+            return self._json(404, {"message": "Not Found"})
+        return self._json(200, listing)
+
+    def _git(self, stub, method, route, body):
+        if method == "POST" and route == "blobs":
+            return self._json(201, {"sha": stub._blob(base64.b64decode(body["content"]))})
+        if method == "GET" and route == f"ref/heads/{stub.branch}":
+            return self._json(200, {"ref": f"refs/heads/{stub.branch}", "object": {"sha": stub.head}})
+        if method == "GET" and route.startswith("commits/"):
+            commit = stub.commits.get(route[len("commits/"):])
+            if commit is None:
+                return self._json(404, {"message": "Not Found"})
+            return self._json(200, {"tree": {"sha": commit["tree"]}, "parents": commit["parents"]})
+        if method == "POST" and route == "trees":
+            entries = dict(stub.trees.get(body.get("base_tree"), {}))
+            for item in body["tree"]:
+                if item["sha"] is None:
+                    entries.pop(item["path"], None)
+                else:
+                    entries[item["path"]] = item["sha"]
+            return self._json(201, {"sha": stub._tree(entries)})
+        if method == "POST" and route == "commits":
+            return self._json(201, {"sha": stub._commit(body["tree"], body["parents"], body["message"])})
+        if method == "PATCH" and route == f"refs/heads/{stub.branch}":
+            if stub.before_patch is not None:
+                stub.before_patch()
+            commit = stub.commits.get(body["sha"])
+            # fast-forward soltanto, come con force=False
+            if commit is None or stub.head not in commit["parents"]:
+                return self._json(422, {"message": "Update is not a fast forward"})
+            stub.head = body["sha"]
+            return self._json(200, {"object": {"sha": stub.head}})
+        return self._json(404, {"message": "Not Found"})
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
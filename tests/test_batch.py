@@ -0,0 +1,76 @@
+import io
+import os
+import zipfile
+
+import pytest
+from PIL import Image
+
+from mockup_engine.batch import render_batch
+from mockup_engine.cli import main
+from mockup_engine.ingest import DesignError
+from mockup_engine.results import ResultCache
+
+
+def _template(path):
+    # fondo bianco con un libro grigio chiaro: il box si rileva in automatico
+    img = Image.new("RGB", (90, 120), (250, 250, 250))
+    img.paste((235, 235, 235), (20, 15, 70, 105))
+    img.save(path, quality=95)
+    return path
+
+
+def _batch(tmp_path):
+    d = tmp_path / "designs"
+    d.mkdir()
+    Image.new("RGB", (60, 80), "teal").save(d / "a.jpg")
+    (d / "b.jpg").write_bytes(b"non un'immagine")
+    # header valido, dati troncati: l'errore arriva solo in decodifica
+    buf = io.BytesIO()
+    Image.effect_noise((60, 80), 64).convert("RGB").save(buf, format="JPEG")
+    (d / "c.jpg").write_bytes(buf.getvalue()[:-len(buf.getvalue()) // 3])
+    Image.new("RGB", (60, 80), "olive").save(d / "d.jpg")
+    t = tmp_path / "templates"
+    t.mkdir()
+    templates = {name: _template(str(t / name)) for name in ("A4-libro.jpg", "A5-libro.jpg")}
+    designs = [(str(d / name), name) for name in sorted(os.listdir(d))]
+    return designs, templates
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bad_designs_are_reported_and_skipped(tmp_path, workers):
+    designs, templates = _batch(tmp_path)
+    errors = []
+    names = [arcname for arcname, _ in render_batch(designs, templates, {}, workers, errors=errors)]
+    assert [n.split("/")[0] for n in names] == ["a", "a", "d", "d"]
+    assert len(errors) == 2
+    assert errors[0].startswith("b: formato non riconosciuto")
+    assert errors[1].startswith("c: file danneggiato")
+
+
+def test_bad_designs_are_skipped_with_the_result_cache(tmp_path):
+    designs, templates = _batch(tmp_path)
+    cache = ResultCache(str(tmp_path / "cache"))
+    for _ in range(2):
+        errors = []
+        names = [arcname for arcname, _ in render_batch(designs, templates, {}, 1, cache=cache, errors=errors)]
+        assert [n.split("/")[0] for n in names] == ["a", "a", "d", "d"]
+        assert len(errors) == 2
+    assert cache.hits == 4
+
+
+def test_without_errors_the_batch_stops(tmp_path):
+    designs, templates = _batch(tmp_path)
+    with pytest.raises(DesignError, match="^b: "):
+        list(render_batch(designs, templates, {}, 1))
+
+
+def test_cli_writes_the_good_designs_and_exits_nonzero(tmp_path, capsys):
+    designs, templates = _batch(tmp_path)
+    out = str(tmp_path / "out.zip")
+    rc = main([os.path.dirname(designs[0][0]), "--templates-dir", os.path.dirname(next(iter(templates.values()))),
+               "--template", "A4-libro.jpg", "--out", out, "--no-plan-cache", "--quiet"])
+    assert rc == 1
+    with zipfile.ZipFile(out) as zf:
+        assert sorted(zf.namelist()) == ["a/A4-a.jpg", "d/A4-d.jpg"]
+    err = capsys.readouterr().err
+    assert "b: formato non riconosciuto" in err and "c: file danneggiato" in err
@@ -0,0 +1,18 @@
+import numpy as np
+
+from mockup_engine import blend, plans
+
+
+def test_shade_stays_within_one_level_of_float64():
+    rng = np.random.default_rng(0)
+    cover = rng.integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    shadow = np.clip(rng.random((37, 53), dtype=np.float32) * 1.2, 0, 1)
+    # come il vecchio motore: prodotto in float64 troncato a uint8
+    expected = (cover.astype(np.float64) * shadow[..., None]).astype(np.uint8)
+    plan = plans.TemplatePlan((0, 0, 53, 37), shadow, np.zeros((37, 53, 3), np.uint8))
+    for got in (blend.shade(cover, shadow), blend.shade(cover, plan.shadow_rgb),
+                blend.shade(cover.copy(), plan.shadow_rgb, out=np.empty_like(cover))):
+        assert np.abs(got.astype(int) - expected).max() <= 1
+    out = cover.copy()
+    assert blend.shade(out, plan.shadow_rgb, out=out) is out
+    assert np.array_equal(out, blend.shade(cover, shadow))
@@ -0,0 +1,124 @@
+import json
+
+from mockup_engine.coords import CoordinateStore
+from tests.github_stub import GitHubStub
+
+DEFAULTS = {"a.jpg": {"coords": [10.0, 10.0, 50.0, 80.0], "offset": 1}}
+SAVED = {"a.jpg": {"coords": [21.5, 4.8, 57.0, 91.5], "offset": 2}}
+
+
+def _store(stub, tmp_path):
+    local = str(tmp_path / "template_coordinates.json")
+    return CoordinateStore(stub.repo(), "template_coordinates.json", local, DEFAULTS), local
+
+
+def test_editing_saved_maps_does_not_change_the_store(tmp_path):
+    with GitHubStub({"template_coordinates.json": json.dumps(DEFAULTS).encode()}) as stub:
+        store, local = _store(stub, tmp_path)
+        maps = json.loads(json.dumps(SAVED))
+        assert store.save(maps)
+        # come la sessione di calibrazione dopo SALVA: modifiche non salvate
+        maps["a.jpg"]["coords"][0] = 99.0
+        maps["a.jpg"]["offset"] = 7
+        assert store.get() == SAVED
+        with open(local) as f:
+            assert json.load(f) == SAVED
+        assert json.loads(stub.files()["template_coordinates.json"]) == SAVED
+
+
+def test_editing_returned_maps_does_not_change_the_store(tmp_path):
+    with GitHubStub({"template_coordinates.json": json.dumps(SAVED).encode()}) as stub:
+        store, _ = _store(stub, tmp_path)
+        maps = store.get()
+        assert maps == SAVED
+        maps["a.jpg"]["coords"][0] = 99.0
+        assert store.get() == SAVED
+
+
+def test_editing_default_maps_does_not_change_the_defaults(tmp_path):
+    # né file locale né file su GitHub: si parte dalle coordinate di default
+    with GitHubStub({}) as stub:
+        store, _ = _store(stub, tmp_path)
+        maps = store.get()
+        maps["a.jpg"]["coords"][0] = 99.0
+        assert store.get() == DEFAULTS and DEFAULTS["a.jpg"]["coords"][0] == 10.0
+
+
+def _coords(data):
+    return {"template_coordinates.json": json.dumps(data).encode()}
+
+
+def _record_gets(store):
+    """Status e If-None-Match delle GET del coordinate store."""
+    seen = []
+    get = store.gh.session.get
+
+    def recording(url, headers=None, **kw):
+        resp = get(url, headers=headers, **kw)
+        seen.append((resp.status_code, (headers or {}).get("If-None-Match")))
+        return resp
+    store.gh.session.get = recording
+    return seen
+
+
+def test_revalidation_uses_etag_and_304(tmp_path):
+    with GitHubStub(_coords(DEFAULTS)) as stub:
+        store, local = _store(stub, tmp_path)
+        seen = _record_gets(store)
+        assert store.get() == DEFAULTS
+        assert not store.refresh()
+        assert seen[0] == (200, None)
+        assert seen[1][0] == 304 and seen[1][1]
+        stub.push(_coords(SAVED))
+        assert store.refresh()
+        assert seen[2][0] == 200
+        assert store.get() == SAVED
+        with open(local) as f:
+            assert json.load(f) == SAVED
+
+
+def test_failed_save_is_not_overwritten_by_revalidation(tmp_path):
+    with GitHubStub(_coords(DEFAULTS)) as stub:
+        store, local = _store(stub, tmp_path)
+        store.ttl = 0
+        assert store.get() == DEFAULTS
+        stub.fail("PUT", "contents/template_coordinates.json", status=403)
+        assert not store.save(SAVED)
+        # TTL scaduto: la revalidazione legge la copia vecchia su GitHub e la scarta
+        assert not store.refresh()
+        assert store.get() == SAVED
+        with open(local) as f:
+            assert json.load(f) == SAVED
+        # un salvataggio riuscito riattiva gli aggiornamenti da GitHub
+        assert store.save(SAVED)
+        changed = {"a.jpg": {"coords": [1.0, 1.0, 1.0, 1.0], "offset": 1}}
+        stub.push(_coords(changed))
+        assert store.refresh()
+        assert store.get() == changed
+
+
+def test_save_during_revalidation_wins(tmp_path):
+    remote = {"a.jpg": {"coords": [1.0, 1.0, 1.0, 1.0], "offset": 1}}
+    with GitHubStub(_coords(remote)) as stub:
+        store, local = _store(stub, tmp_path)
+        get = store.gh.session.get
+
+        def save_while_in_flight(url, **kw):
+            resp = get(url, **kw)
+            store.gh.session.get = get
+            assert store.save(SAVED)
+            return resp
+        store.gh.session.get = save_while_in_flight
+        # la risposta (la copia remota prima della save) arriva dopo il salvataggio: si scarta
+        assert not store.refresh()
+        assert store.get() == SAVED
+        with open(local) as f:
+            assert json.load(f) == SAVED
+        assert json.loads(stub.files()["template_coordinates.json"]) == SAVED
+
+
+def test_non_json_response_falls_back_to_defaults(tmp_path):
+    with GitHubStub(_coords(SAVED)) as stub:
+        store, _ = _store(stub, tmp_path)
+        stub.fail("GET", "contents/template_coordinates.json", status=200, body=b"<html>login</html>")
+        assert store.get() == DEFAULTS
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from benchmarks import golden_reference as ref
+from mockup_engine import detect
+
+
+def _old_content_bounds(tmpl_gray):
+    # i quattro loop del motore di partenza per i template "base_copertina"
+    h, w = tmpl_gray.shape
+    bx1, bx2, by1, by2 = 0, w-1, 0, h-1
+    for x in range(w):
+        if np.any(tmpl_gray[:, x] < 250):
+            bx1 = x
+            break
+    for x in range(w-1, -1, -1):
+        if np.any(tmpl_gray[:, x] < 250):
+            bx2 = x
+            break
+    for y in range(h):
+        if np.any(tmpl_gray[y, :] < 250):
+            by1 = y
+            break
+    for y in range(h-1, -1, -1):
+        if np.any(tmpl_gray[y, :] < 250):
+            by2 = y
+            break
+    return bx1, bx2, by1, by2
+
+
+def _templates():
+    rng = np.random.default_rng(7)
+    out = []
+    for _ in range(20):
+        h, w = rng.integers(40, 160, 2)
+        gray = np.full((h, w), rng.integers(200, 252), np.uint8)
+        x1, y1 = rng.integers(0, w // 2), rng.integers(0, h // 2)
+        x2, y2 = rng.integers(x1 + 1, w), rng.integers(y1 + 1, h)
+        gray[y1:y2, x1:x2] = rng.integers(0, 256, (y2 - y1, x2 - x1))
+        # a volte una fascia chiara sulla riga centrale, dove si cerca l'inizio della faccia
+        if rng.random() < 0.5:
+            mid = (y1 + y2) // 2
+            gray[mid, rng.integers(x1, x2):x2] = 245
+        out.append(gray)
+    out.append(np.full((50, 60), 255, np.uint8))   # nessun libro
+    out.append(np.zeros((50, 60), np.uint8))       # libro su tutto il frame
+    return out
+
+
+@pytest.mark.parametrize("gray", _templates())
+def test_detection_matches_the_old_loops(gray):
+    bg = float(np.median([gray[3, 3], gray[3, -3], gray[-3, 3], gray[-3, -3]]))
+    assert detect.find_book_region(gray, bg) == ref.find_book_region(gray, bg)
+    gray_f = gray.astype(np.float32)
+    assert detect.find_book_region_auto(gray_f, bg) == ref.find_book_region_auto(gray_f, bg)
+    assert detect.content_bounds(gray) == _old_content_bounds(gray)
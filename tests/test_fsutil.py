@@ -0,0 +1,40 @@
+import json
+import os
+
+import pytest
+
+from mockup_engine.fsutil import TMP_PREFIX, atomic_write, write_json
+
+
+def _leftovers(directory):
+    return [n for n in os.listdir(directory) if n.startswith(TMP_PREFIX)]
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = tmp_path / "dati.bin"
+    atomic_write(str(path), b"vecchio")
+    atomic_write(str(path), lambda f: f.write(b"nuovo"))
+    assert path.read_bytes() == b"nuovo" and not _leftovers(tmp_path)
+    write_json(str(tmp_path / "dati.json"), {"a": [1, 2]})
+    assert json.loads((tmp_path / "dati.json").read_text()) == {"a": [1, 2]}
+
+
+def test_failed_write_keeps_the_old_file_and_no_temporary(tmp_path):
+    path = tmp_path / "dati.json"
+    write_json(str(path), {"versione": 1})
+
+    def broken(f):
+        f.write(b"{\"vers")
+        raise OSError("disco pieno")
+    with pytest.raises(OSError):
+        atomic_write(str(path), broken)
+    with pytest.raises(TypeError):
+        write_json(str(path), {"non serializzabile": object()})
+    assert json.loads(path.read_text()) == {"versione": 1}
+    assert not _leftovers(tmp_path)
+
+
+def test_relative_path_in_the_current_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    atomic_write("locale.txt", b"ok")
+    assert (tmp_path / "locale.txt").read_bytes() == b"ok" and not _leftovers(tmp_path)
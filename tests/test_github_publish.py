@@ -0,0 +1,94 @@
+from mockup_engine.github import publish_templates
+from tests.github_stub import GitHubStub
+
+FILES = {"templates/a.jpg": b"a-v1", "templates/b.png": b"b-v1", "README.md": b"readme"}
+
+
+def test_publish_uploads_and_deletes_in_one_commit():
+    with GitHubStub(FILES) as stub:
+        before = stub.head
+        seen = []
+        report = publish_templates(stub.repo(), {"c.jpg": b"c-v1", "a.jpg": b"a-v2"}, delete=["b.png"],
+                                   progress=lambda name, done, total: seen.append((done, total)))
+        assert report.ok and report.error is None
+        assert report.commit == stub.head
+        assert stub.commits[stub.head]["parents"] == [before]
+        assert stub.files() == {"templates/a.jpg": b"a-v2", "templates/c.jpg": b"c-v1", "README.md": b"readme"}
+        assert sorted(report.uploaded) == ["a.jpg", "c.jpg"] and report.deleted == ["b.png"]
+        assert stub.count("POST", "/git/blobs") == 2
+        assert stub.count("POST", "/git/commits") == 1 and stub.count("PATCH", "/git/refs/") == 1
+        assert sorted(seen) == [(1, 2), (2, 2)]
+
+
+def test_publish_delete_only():
+    with GitHubStub(FILES) as stub:
+        report = publish_templates(stub.repo(), delete=["a.jpg"])
+        assert report.ok and report.deleted == ["a.jpg"]
+        assert "templates/a.jpg" not in stub.files()
+        assert stub.count("POST", "/git/blobs") == 0
+
+
+def test_publish_nothing_does_not_commit():
+    with GitHubStub(FILES) as stub:
+        before = stub.head
+        report = publish_templates(stub.repo())
+        assert not report.ok and report.error is None
+        assert stub.head == before and stub.requests == []
+
+
+def test_publish_retries_once_when_the_branch_moved():
+    with GitHubStub(FILES) as stub:
+        pushed = []
+
+        def concurrent_push():
+            if not pushed:
+                pushed.append(stub.push({"templates/altro.jpg": b"da un altro client"}))
+        stub.before_patch = concurrent_push
+        report = publish_templates(stub.repo(), {"c.jpg": b"c-v1"})
+        assert report.ok
+        # il secondo commit parte dal nuovo head e conserva il push concorrente
+        assert stub.commits[report.commit]["parents"] == pushed
+        assert stub.files()["templates/altro.jpg"] == b"da un altro client"
+        assert stub.files()["templates/c.jpg"] == b"c-v1"
+        assert stub.count("PATCH", "/git/refs/") == 2
+        # i blob non si ricaricano al secondo tentativo
+        assert stub.count("POST", "/git/blobs") == 1
+
+
+def test_publish_gives_up_after_a_second_conflict():
+    with GitHubStub(FILES) as stub:
+        stub.before_patch = lambda: stub.push({"templates/altro.jpg": str(len(stub.commits)).encode()})
+        report = publish_templates(stub.repo(), {"c.jpg": b"c-v1"})
+        assert not report.ok and "422" in report.error
+        assert "templates/c.jpg" not in stub.files()
+        assert stub.count("PATCH", "/git/refs/") == 2
+
+
+def test_failed_blob_leaves_ref_untouched():
+    with GitHubStub(FILES) as stub:
+        before = stub.head
+        stub.fail("POST", "/git/blobs")
+        report = publish_templates(stub.repo(), {"c.jpg": b"c-v1", "d.jpg": b"d-v1", "e.jpg": b"e-v1"},
+                                   delete=["a.jpg"])
+        assert not report.ok and "blobs" in report.error
+        assert report.uploaded == [] and report.deleted == []
+        assert stub.head == before and stub.files() == FILES
+        assert stub.count("POST", "/git/trees") == 0 and stub.count("PATCH") == 0
+
+
+def test_failed_commit_leaves_ref_untouched():
+    with GitHubStub(FILES) as stub:
+        before = stub.head
+        stub.fail("POST", "/git/commits")
+        report = publish_templates(stub.repo(), {"c.jpg": b"c-v1"}, delete=["a.jpg"])
+        assert not report.ok and "commits" in report.error
+        assert stub.head == before and stub.files() == FILES
+        assert stub.count("PATCH") == 0
+
+
+def test_unreachable_server_reports_error():
+    with GitHubStub(FILES) as stub:
+        gh = stub.repo()
+    # server chiuso: connessione rifiutata
+    report = publish_templates(gh, {"c.jpg": b"c-v1"})
+    assert not report.ok and report.error
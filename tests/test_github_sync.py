@@ -0,0 +1,87 @@
+import os
+
+from mockup_engine import github
+from mockup_engine.github import MANIFEST_NAME, sync_templates
+from tests.github_stub import GitHubStub
+
+FILES = {"templates/a.jpg": b"a-v1", "templates/b.png": b"b-v1", "templates/note.txt": b"non un template"}
+
+
+def _leftovers(dest):
+    return [n for n in os.listdir(dest) if n.startswith(".tmp-")]
+
+
+def _read(dest, name):
+    with open(os.path.join(dest, name), "rb") as f:
+        return f.read()
+
+
+def test_sync_downloads_then_skips_unchanged(tmp_path):
+    dest = str(tmp_path / "templates")
+    with GitHubStub(FILES) as stub:
+        report = sync_templates(stub.repo(), "templates", dest)
+        assert sorted(report.downloaded) == ["a.jpg", "b.png"]
+        assert _read(dest, "a.jpg") == b"a-v1"
+        assert os.path.exists(os.path.join(dest, MANIFEST_NAME))
+
+        report = sync_templates(stub.repo(), "templates", dest)
+        assert report.downloaded == [] and sorted(report.skipped) == ["a.jpg", "b.png"]
+        assert stub.count("GET", "/raw/") == 2
+
+
+def test_sync_downloads_only_files_changed_upstream(tmp_path):
+    dest = str(tmp_path / "templates")
+    with GitHubStub(FILES) as stub:
+        sync_templates(stub.repo(), "templates", dest)
+        stub.push({"templates/b.png": b"b-v2"})
+        report = sync_templates(stub.repo(), "templates", dest)
+        assert report.downloaded == ["b.png"] and report.skipped == ["a.jpg"]
+        assert _read(dest, "b.png") == b"b-v2"
+
+
+def test_sync_keeps_local_only_edits(tmp_path):
+    dest = str(tmp_path / "templates")
+    with GitHubStub(FILES) as stub:
+        sync_templates(stub.repo(), "templates", dest)
+        with open(os.path.join(dest, "a.jpg"), "wb") as f:
+            f.write(b"a-locale")
+        report = sync_templates(stub.repo(), "templates", dest)
+        assert "a.jpg" in report.skipped
+        assert _read(dest, "a.jpg") == b"a-locale"
+
+
+def test_failed_download_leaves_previous_file(tmp_path):
+    dest = str(tmp_path / "templates")
+    with GitHubStub(FILES) as stub:
+        sync_templates(stub.repo(), "templates", dest)
+        stub.push({"templates/a.jpg": b"a-v2"})
+        stub.fail("GET", "/raw/templates/a.jpg")
+        report = sync_templates(stub.repo(), "templates", dest)
+        assert report.failed == ["a.jpg"]
+        assert _read(dest, "a.jpg") == b"a-v1"
+        assert _leftovers(dest) == []
+        # il manifest non segna a.jpg come aggiornato: il giro dopo lo riscarica
+        report = sync_templates(stub.repo(), "templates", dest)
+        assert report.downloaded == ["a.jpg"]
+        assert _read(dest, "a.jpg") == b"a-v2"
+
+
+def test_interrupted_write_is_atomic(tmp_path, monkeypatch):
+    dest = str(tmp_path / "templates")
+    with GitHubStub(FILES) as stub:
+        sync_templates(stub.repo(), "templates", dest)
+        stub.push({"templates/a.jpg": b"a-v2"})
+
+        def broken_replace(src, dst):
+            raise OSError("disco pieno")
+        monkeypatch.setattr(github.os, "replace", broken_replace)
+        report = sync_templates(stub.repo(), "templates", dest)
+        monkeypatch.undo()
+        assert report.failed == ["a.jpg"]
+        assert _read(dest, "a.jpg") == b"a-v1"
+        assert _leftovers(dest) == []
+
+
+def test_missing_remote_listing_returns_none(tmp_path):
+    with GitHubStub(FILES) as stub:
+        assert sync_templates(stub.repo(), "altro", str(tmp_path / "templates")) is None
@@ -0,0 +1,181 @@
+import io
+import json
+import os
+import sys
+import time
+import types
+import zipfile
+
+from PIL import Image
+
+from mockup_engine import jobs
+from mockup_engine.jobs import CANCELLED, DONE, FAILED, INTERRUPTED, RUNNING, JobManager
+
+NAMES = ["a/A4-a.jpg", "a/A5-a.jpg", "b/A4-b.jpg", "b/A5-b.jpg"]
+
+
+def _templates(tmp_path):
+    paths = {}
+    for name in ("A4-libro.jpg", "A5-libro.jpg"):
+        img = Image.new("RGB", (90, 120), (250, 250, 250))
+        img.paste((235, 235, 235), (20, 15, 70, 105))
+        paths[name] = str(tmp_path / name)
+        img.save(paths[name], quality=95)
+    return paths
+
+
+def _design(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (60, 80), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _submit(jm, tmp_path, designs=None):
+    designs = designs or [(_design("teal"), "a.jpg"), (_design("olive"), "b.jpg")]
+    return jm.submit(designs, _templates(tmp_path), {}, label="prova")
+
+
+def _wait(jm, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jm.get(job_id)
+        if job["status"] not in ("queued", RUNNING):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"lavoro {job_id} ancora {job['status']}")
+
+
+def _zip_names(jm, job_id):
+    with zipfile.ZipFile(jm.result_path(job_id)) as zf:
+        return sorted(zf.namelist())
+
+
+def _perf(jm, job_id):
+    with open(jm.perf_path(job_id)) as f:
+        return json.load(f)
+
+
+def _stage_count(perf, name):
+    return next(r["count"] for r in perf["stages"] if r["stage"] == name)
+
+
+def _cancel_after(monkeypatch, jm, pairs):
+    # annulla il lavoro dopo le prime coppie: il job id è la cartella dei design
+    render = jobs.render_pairs
+
+    def render_pairs(designs, *args, **kwargs):
+        job_id = os.path.basename(os.path.dirname(os.path.dirname(designs[0][0])))
+        for n, result in enumerate(render(designs, *args, **kwargs), 1):
+            if n == pairs:
+                jm.cancel(job_id)
+            yield result
+    monkeypatch.setattr(jobs, "render_pairs", render_pairs)
+
+
+def test_submit_runs_to_done(tmp_path):
+    jm = JobManager(str(tmp_path / "jobs"), workers=1)
+    job_id = _submit(jm, tmp_path)
+    job = _wait(jm, job_id)
+    assert job["status"] == DONE and job["done"] == job["total"] == 4
+    assert job["errors"] == [] and job["error"] is None
+    assert _zip_names(jm, job_id) == NAMES
+    perf = _perf(jm, job_id)
+    assert _stage_count(perf, "encode") == 4 and perf["pairs"] == 4 and not perf["partial"]
+    assert jm.perf_path(job_id, "csv")
+    assert [j["id"] for j in jm.list()] == [job_id]
+
+
+def test_cancel_then_resume_renders_only_missing_pairs(tmp_path, monkeypatch):
+    jm = JobManager(str(tmp_path / "jobs"), workers=1)
+    _cancel_after(monkeypatch, jm, 1)
+    job_id = _submit(jm, tmp_path)
+    job = _wait(jm, job_id)
+    assert job["status"] == CANCELLED and job["done"] == 1
+    assert jm.result_path(job_id) is None
+
+    monkeypatch.undo()
+    skipped = []
+    render = jobs.render_pairs
+    monkeypatch.setattr(jobs, "render_pairs", lambda *a, **kw: skipped.append(kw["skip"]) or render(*a, **kw))
+    assert jm.resume(job_id)
+    job = _wait(jm, job_id)
+    assert job["status"] == DONE and skipped == [{0}]
+    assert _zip_names(jm, job_id) == NAMES
+    # i tempi coprono entrambe le esecuzioni: la ripresa da sola codifica 3 coppie
+    perf = _perf(jm, job_id)
+    assert _stage_count(perf, "encode") >= 4 and perf["pairs"] == 4 and not perf["partial"]
+
+
+def test_restart_resumes_from_the_manifest(tmp_path, monkeypatch):
+    root = str(tmp_path / "jobs")
+    jm = JobManager(root, workers=1)
+    _cancel_after(monkeypatch, jm, 2)
+    job_id = _submit(jm, tmp_path)
+    _wait(jm, job_id)
+    monkeypatch.undo()
+    # riavvio a metà lavoro: stato "running", ultima riga del manifest troncata, tempi persi
+    jm._update(job_id, status=RUNNING)
+    job_dir = os.path.join(root, job_id)
+    with open(os.path.join(job_dir, "done.jsonl"), "a") as f:
+        f.write('{"i": 2, "arc')
+    os.unlink(os.path.join(job_dir, "timer.json"))
+
+    jm = JobManager(root, workers=1)
+    assert jm.get(job_id)["status"] == INTERRUPTED and jm.get(job_id)["done"] == 2
+    assert jm.resume(job_id)
+    job = _wait(jm, job_id)
+    assert job["status"] == DONE and _zip_names(jm, job_id) == NAMES
+    perf = _perf(jm, job_id)
+    assert perf["pairs"] == 2 and perf["partial"]
+
+
+def test_failure_is_reported_and_resumable(tmp_path, monkeypatch):
+    jm = JobManager(str(tmp_path / "jobs"), workers=1)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("disco pieno")
+        yield
+    monkeypatch.setattr(jobs, "render_pairs", broken)
+    job_id = _submit(jm, tmp_path)
+    job = _wait(jm, job_id)
+    assert job["status"] == FAILED and job["error"] == "disco pieno"
+
+    monkeypatch.undo()
+    assert jm.resume(job_id)
+    job = _wait(jm, job_id)
+    assert job["status"] == DONE and job["error"] is None
+    assert _zip_names(jm, job_id) == NAMES
+    assert not jm.resume(job_id)
+
+
+def test_bad_design_is_listed_in_job_errors(tmp_path):
+    jm = JobManager(str(tmp_path / "jobs"), workers=1)
+    job_id = _submit(jm, tmp_path, [(_design("teal"), "a.jpg"), (b"rotto", "x.jpg"), (_design("olive"), "b.jpg")])
+    job = _wait(jm, job_id)
+    assert job["status"] == DONE and job["done"] == 4 and job["total"] == 6
+    assert len(job["errors"]) == 1 and job["errors"][0].startswith("x: ")
+    assert _zip_names(jm, job_id) == NAMES
+
+
+def test_pool_workers_do_not_rerun_a_spec_less_main(tmp_path, monkeypatch):
+    # come sotto Streamlit: __main__ fittizio con __file__ e senza spec; il lavoro
+    # parte dal thread del JobManager, quindi il pool usa forkserver o spawn
+    script = tmp_path / "app.py"
+    script.write_text("import os\nopen(os.path.join(os.path.dirname(__file__), 'rieseguito'), 'w').close()\n")
+    fake = types.ModuleType("__main__")
+    fake.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", fake)
+    jm = JobManager(str(tmp_path / "jobs"), workers=2)
+    job_id = _submit(jm, tmp_path)
+    job = _wait(jm, job_id)
+    assert job["status"] == DONE and _zip_names(jm, job_id) == NAMES
+    assert not (tmp_path / "rieseguito").exists()
+    assert fake.__spec__ is None
+
+
+def test_delete_only_finished_jobs(tmp_path):
+    jm = JobManager(str(tmp_path / "jobs"), workers=1)
+    job_id = _submit(jm, tmp_path)
+    _wait(jm, job_id)
+    assert jm.delete(job_id)
+    assert jm.get(job_id) is None and jm.list() == []
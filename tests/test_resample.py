@@ -0,0 +1,28 @@
+from PIL import Image
+
+from mockup_engine import resample
+from mockup_engine.resample import DesignSource
+
+
+def _jpeg(tmp_path, size=(2400, 3200)):
+    path = str(tmp_path / "design.jpg")
+    Image.new("RGB", size, "teal").save(path, quality=90)
+    return path
+
+
+def test_design_source_decodes_once_for_the_largest_face(tmp_path, monkeypatch):
+    decoded = []
+    decode = resample.decode_design
+    monkeypatch.setattr(resample, "decode_design", lambda img, name=None: decoded.append(img.size) or decode(img, name))
+    source = DesignSource(_jpeg(tmp_path), faces=[(100, 120), (500, 600), (250, 300)])
+    first = source.resampler()
+    assert source.resampler() is first
+    assert decoded == [source.size]
+    # draft a 1/4: la faccia più grande (500×600) resta coperta
+    assert source.size == (600, 800)
+
+
+def test_design_source_size_reads_only_the_header(tmp_path, monkeypatch):
+    monkeypatch.setattr(resample, "decode_design", None)
+    source = DesignSource(_jpeg(tmp_path), faces=[(500, 600)])
+    assert source.size == (600, 800)
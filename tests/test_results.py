@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from PIL import Image
+
+from mockup_engine import batch, results
+from mockup_engine.batch import render_batch
+from mockup_engine.encode import DEFAULT_SETTINGS, EncoderSettings
+from mockup_engine.results import ResultCache, map_params, result_key
+
+PARAMS = ("v3", None, (600, 800))
+
+
+def _key(**changes):
+    args = {"design_digest": "d" * 40, "template_digest": "t" * 40, "params": PARAMS,
+            "encoder": DEFAULT_SETTINGS} | changes
+    return result_key(**args)
+
+
+def test_key_is_stable():
+    # cambia solo se cambiano gli input (o VERSION): una chiave diversa svuota di fatto la cache
+    assert _key() == "e765ae00724081c9948eddb85bdd2a6267ea8f80"
+    assert map_params({"t": {"offset": 2, "coords": [1, 2, 3, 4]}}, "t") == \
+        map_params({"t": {"coords": [1, 2, 3, 4], "offset": 2}}, "t")
+    assert map_params({}, "t") is None
+
+
+@pytest.mark.parametrize("changes", [
+    {"design_digest": "e" * 40},
+    {"template_digest": "u" * 40},
+    {"params": ("v3", map_params({"t": {"coords": [1, 2, 3, 4]}}, "t"), (600, 800))},
+    {"params": ("v3", None, (300, 400))},
+    {"encoder": EncoderSettings(jpeg_quality=90)},
+])
+def test_key_changes_with_every_input(changes):
+    assert _key(**changes) != _key()
+
+
+def test_key_changes_with_version(monkeypatch):
+    before = _key()
+    monkeypatch.setattr(results, "VERSION", results.VERSION + 1)
+    assert _key() != before
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), budget=3500)
+    for n, key in enumerate(("aa01", "bb02", "cc03")):
+        cache.put(key, ".jpg", b"x" * 1000)
+        os.utime(cache._path(key, ".jpg"), ns=(n * 10**9, n * 10**9))
+    # letto di recente: diventa il più nuovo
+    assert cache.find("aa01") == ".jpg"
+    cache.put("dd04", ".jpg", b"x" * 1000)
+    assert cache.find("bb02") is None
+    assert [cache.find(k) for k in ("aa01", "cc03", "dd04")] == [".jpg"] * 3
+
+
+def test_hit_counts_only_after_a_successful_read(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("aa01", ".png", b"dati")
+    ext = cache.find("aa01")
+    assert ext == ".png" and cache.stats() == {"hits": 0, "misses": 0}
+    os.unlink(cache._path("aa01", ext))
+    assert cache.read("aa01", ext) is None
+    assert cache.stats() == {"hits": 0, "misses": 1}
+    cache.put("aa01", ".png", b"dati")
+    assert cache.read("aa01", cache.find("aa01")) == b"dati"
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_cached_pairs_are_served_without_rendering(tmp_path, monkeypatch):
+    d = tmp_path / "designs"
+    d.mkdir()
+    designs = []
+    for name, color in (("a.jpg", "teal"), ("b.jpg", "olive")):
+        Image.new("RGB", (60, 80), color).save(d / name)
+        designs.append((str(d / name), name))
+    templates = {}
+    for name in ("A4-libro.jpg", "A5-libro.png"):
+        img = Image.new("RGB", (90, 120), (250, 250, 250))
+        img.paste((235, 235, 235), (20, 15, 70, 105))
+        templates[name] = str(tmp_path / name)
+        img.save(templates[name])
+    cache = ResultCache(str(tmp_path / "cache"))
+    first = list(render_batch(designs, templates, {}, 1, cache=cache))
+    assert cache.stats() == {"hits": 0, "misses": 4}
+
+    monkeypatch.setattr(batch, "_composite", None)
+    cache = ResultCache(str(tmp_path / "cache"))
+    assert list(render_batch(designs, templates, {}, 1, cache=cache)) == first
+    assert cache.stats() == {"hits": 4, "misses": 0}
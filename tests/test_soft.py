@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from benchmarks import golden_reference as ref
+from mockup_engine import soft
+from mockup_engine.soft import FeatherMask
+
+
+@pytest.mark.parametrize("size", [(1, 1), (3, 7), (40, 25), (161, 97)])
+@pytest.mark.parametrize("radius", [0.5, 1, 2.5, 5, 12, 40])
+def test_feather_mask_matches_the_pil_mask(size, radius):
+    expected = np.asarray(ref.get_feathered_mask(size, radius))
+    mask = FeatherMask(size, radius)
+    assert np.array_equal(mask.values(), expected)
+    assert np.array_equal(np.asarray(soft.get_feathered_mask(size, radius)), expected)
+    # fuori dalle fasce la maschera è piena
+    x0, y0, x1, y1 = mask.inner
+    assert (expected[y0:y1, x0:x1] == 255).all()
+    covered = np.zeros(expected.shape, bool)
+    for ys, xs in mask.bands():
+        assert not covered[ys, xs].any()
+        covered[ys, xs] = True
+        assert np.array_equal(mask.values(ys, xs), expected[ys, xs])
+    covered[y0:y1, x0:x1] = True
+    assert covered.all()
+
+
+def test_zero_radius_is_a_full_mask():
+    expected = np.asarray(ref.get_feathered_mask((9, 4), 0))
+    assert np.array_equal(np.asarray(soft.get_feathered_mask((9, 4), 0)), expected)
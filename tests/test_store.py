@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from mockup_engine import compositor, plans
+from mockup_engine.plans import TemplatePlan
+from mockup_engine.store import PlanStore, params_key
+from mockup_engine.warp import FaceWarp
+
+DIGEST = "ab" * 20
+
+
+def _plan(channels, warp=False):
+    rng = np.random.default_rng(channels)
+    base = rng.integers(0, 256, (30, 40, channels), dtype=np.uint8)
+    shadow = rng.random((12, 16), dtype=np.float32)
+    face_warp = None
+    if warp:
+        face_warp = FaceWarp(rng.random((12, 16), dtype=np.float32), rng.random((12, 16), dtype=np.float32),
+                             rng.integers(0, 256, (12, 16), dtype=np.uint8), (20, 24))
+    return TemplatePlan((5, 6, 16, 12), shadow, base, "stretch", face_warp)
+
+
+@pytest.mark.parametrize("channels, warp", [(3, False), (4, False), (3, True)])
+def test_plan_round_trips_as_read_only_mmap(tmp_path, channels, warp):
+    store = PlanStore(str(tmp_path))
+    plan = _plan(channels, warp)
+    assert store.save(DIGEST, ("v3", "t.jpg", None, 1), plan)
+    loaded = store.load(DIGEST, ("v3", "t.jpg", None, 1))
+    assert loaded.box == plan.box and loaded.fit == plan.fit
+    for name in ("base", "shadow"):
+        arr = getattr(loaded, name)
+        assert isinstance(arr, np.memmap) and not arr.flags.writeable
+        assert arr.dtype == getattr(plan, name).dtype and np.array_equal(arr, getattr(plan, name))
+    assert (loaded.alpha is None) == (channels == 3)
+    if warp:
+        for part in ("map_x", "map_y", "mask"):
+            assert np.array_equal(getattr(loaded.warp, part), getattr(plan.warp, part))
+        assert loaded.warp.face_size == (20, 24)
+    else:
+        assert loaded.warp is None
+    assert not [n for n in os.listdir(tmp_path / DIGEST) if n.startswith(".tmp-")]
+
+
+def test_missing_or_broken_plan_loads_as_none(tmp_path):
+    store = PlanStore(str(tmp_path))
+    params = ("v3", "t.jpg", None, 1)
+    assert store.load(DIGEST, params) is None
+    store.save(DIGEST, params, _plan(3))
+    os.unlink(tmp_path / DIGEST / (params_key(params) + ".shadow.npy"))
+    assert store.load(DIGEST, params) is None
+
+
+def test_rendering_from_the_store_matches_in_memory_plans(tmp_path):
+    img = Image.new("RGB", (90, 120), (250, 250, 250))
+    img.paste((235, 235, 235), (20, 15, 70, 105))
+    img.save(tmp_path / "A4-libro.jpg", quality=95)
+    design = Image.new("RGB", (60, 80), "teal")
+    plans.invalidate_plans()
+    with Image.open(tmp_path / "A4-libro.jpg") as tmpl:
+        expected = np.asarray(compositor.composite_v3_fixed(tmpl, design, "A4-libro.jpg"))
+    try:
+        plans.use_store(str(tmp_path / "store"))
+        for from_disk in (False, True):
+            plans.invalidate_plans()
+            with Image.open(tmp_path / "A4-libro.jpg") as tmpl:
+                assert np.array_equal(np.asarray(compositor.composite_v3_fixed(tmpl, design, "A4-libro.jpg")),
+                                      expected)
+                # la seconda volta il piano arriva dal disco
+                assert isinstance(compositor.plan_v3(tmpl, "A4-libro.jpg").shadow, np.memmap) == from_disk
+    finally:
+        plans.use_store(None)
+        plans.invalidate_plans()